@@ -0,0 +1,304 @@
+"""Time and memory of each stage of the feed pipeline, from parsing to rendering, as feeds grow.
+
+Feeds are synthetic and served through ReplayTransport, so no network is needed.
+Each stage is timed at every scale (best of --repeat runs), then run once more
+under tracemalloc for its peak memory:
+
+    parse     fetch_vehicle_positions, get_trip_updates (plus decoding every row)
+              and fetch_service_alerts on a feed that changed since the last fetch
+    snap      get_blue_line_map and get_green_line_map on an already fetched snapshot
+    table     the table update methods, until every row batch has been applied, unsorted and sorted
+    render    each map tab's render_map on a snapshot where trains moved
+    filter    building each table's filter index, and a filter query against a scan of every row
+    sort      sorting the vehicles by speed and by vehicle id, with and without computing the sort values
+    arrivals  building the per-stop arrivals index, and a station's next arrivals against a scan of every trip
+
+Usage:
+    python -m benchmarks.bench_pipeline [--scales 10,100,1000,10000] [--repeat 3] [--stage parse]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from functools import partial
+
+from google.transit import gtfs_realtime_pb2
+from textual.app import App
+
+from benchmarks.synthetic_feeds import alerts_feed, trip_updates_feed, vehicle_positions_feed
+from src.combined_map_tab import CombinedMapTab
+from src.feed_capture import CaptureTransport, ReplayTransport
+from src.feed_index import index_alerts, index_trip_updates, index_vehicles
+from src.feed_poller import FeedPoller, FeedSource
+from src.feed_sort import natural, sort_order
+from src.feed_sources import FEED_SOURCES
+from src.horizontal_map_tab import HorizontalMapTab
+from src.line_map_tab import LineMapTab
+from src.metro_api import (
+    ALERTS_URL,
+    TRIP_UPDATES_URL,
+    VEHICLE_POSITIONS_URL,
+    VehicleSnapshot,
+    feed_cache,
+    fetch_service_alerts,
+    fetch_stop_arrivals,
+    fetch_vehicle_positions,
+    get_blue_line_map,
+    get_green_line_map,
+    get_trip_updates,
+)
+from src.snapshots import feed_error
+from src.status_bar import StatusBar
+from src.stop_arrivals import StopArrivals
+from src.tables import AlertsTable, TripUpdatesTable, VehiclePositionsTable
+from src.transport import set_transport
+
+STAGES = ["parse", "snap", "table", "render", "filter", "sort", "arrivals"]
+STOPS_PER_TRIP = 10
+RAIL_SHARE = 0.1  # Share of vehicles on the Blue and Green Lines
+MAP_TABS = {
+    "blue_line_map": partial(LineMapTab, "blue"),
+    "green_line_map": partial(LineMapTab, "green"),
+    "combined_map": CombinedMapTab,
+    "horizontal_map": HorizontalMapTab,
+}
+
+
+def report(stage, name, scale, seconds, peak):
+    print(f"{stage:<8} {name:<28} {scale:>7}   {seconds * 1000:10.2f} ms   {peak / 1024:10.0f} KiB")
+
+
+def measure(stage, name, scale, repeat, func):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    report(stage, name, scale, best, peak)
+
+
+async def measure_async(stage, name, scale, repeat, func):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    await func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    report(stage, name, scale, best, peak)
+
+
+def install_replay(archive_path, scale):
+    """Capture two versions of every feed at this scale and replay them alternately"""
+    capture = CaptureTransport(archive_path)
+    # Timestamps differ between scales, or the feed cache would keep the last scale's feed as unchanged
+    start = 1_750_000_000 + scale * 60
+    for version, timestamp in enumerate((start, start + 30)):
+        capture.record(VEHICLE_POSITIONS_URL, vehicle_positions_feed(scale, RAIL_SHARE, version, timestamp))
+        capture.record(TRIP_UPDATES_URL, trip_updates_feed(scale, STOPS_PER_TRIP, version, timestamp))
+        capture.record(ALERTS_URL, alerts_feed(scale, version, timestamp))
+    capture.close()
+    set_transport(ReplayTransport(archive_path, speed=0, loop=True))
+    feed_cache.invalidate()
+
+
+def changed(url, fetch):
+    # The next replayed capture differs, so every call fetches and parses a new feed version
+    def run():
+        feed_cache.invalidate(url)
+        return fetch()
+
+    return run
+
+
+def snapshots(scale):
+    """Two vehicle snapshots with the same vehicles in different places"""
+    result = []
+    for seed in (1, 2):
+        feed = gtfs_realtime_pb2.FeedMessage()
+        feed.ParseFromString(vehicle_positions_feed(scale, RAIL_SHARE, seed))
+        result.append(VehicleSnapshot.from_feed(feed))
+    return result
+
+
+class BenchApp(App):
+    """Just the tables and map tabs, with a poller that never fetches anything real"""
+
+    def __init__(self):
+        super().__init__()
+        # Every feed the app polls, each answering with what it shows when its fetch fails,
+        # so the map tabs can subscribe to theirs without fetching during the measurements
+        idle = [
+            FeedSource(source.name, partial(feed_error, source.name, None), interval=3600) for source in FEED_SOURCES
+        ]
+        self.feed_poller = FeedPoller(self, idle)
+
+    def compose(self):
+        yield AlertsTable(id="alerts_table")
+        yield TripUpdatesTable(id="trip_updates_table")
+        yield VehiclePositionsTable(id="vehicle_positions_table")
+        for name, tab in MAP_TABS.items():
+            yield StatusBar(id=f"{name}_status_bar")
+            yield tab(id=name)
+
+
+async def bench_widgets(app, pilot, stages, scale, repeat):
+    vehicles = snapshots(scale)
+    trips = [list(changed(TRIP_UPDATES_URL, get_trip_updates)()) for _ in range(2)]
+    alerts = [changed(ALERTS_URL, fetch_service_alerts)() for _ in range(2)]
+
+    async def settle(table):
+        while table._pending_rows is not None:
+            await pilot.pause()
+
+    if "table" in stages:
+        trips_table, vehicles_table = app.query_one(TripUpdatesTable), app.query_one(VehiclePositionsTable)
+        tables = [
+            ("AlertsTable", app.query_one(AlertsTable), "update_alerts", alerts, None),
+            ("TripUpdatesTable", trips_table, "update_trip_updates", trips, None),
+            ("TripUpdatesTable, Arrival", trips_table, "update_trip_updates", trips, "Arrival"),
+            ("VehiclePositionsTable", vehicles_table, "update_vehicle_positions", vehicles, None),
+            ("VehiclePositionsTable, Speed", vehicles_table, "update_vehicle_positions", vehicles, "Speed"),
+        ]
+        for name, table, method, data, sort_column in tables:
+            flip = [0]
+
+            async def update(table=table, method=method, data=data, flip=flip):
+                flip[0] ^= 1
+                getattr(table, method)(data[flip[0]])
+                await settle(table)
+
+            if sort_column:
+                table.sort_by(sort_column)
+            await measure_async("table", name, scale, repeat, update)
+            if sort_column:
+                # Reversed, then back to feed order
+                table.sort_by(sort_column)
+                table.sort_by(sort_column)
+
+    if "render" in stages:
+        for name in MAP_TABS:
+            tab = app.query_one(f"#{name}")
+            version = [0]
+
+            def render(tab=tab, version=version):
+                version[0] += 1
+                tab.render_map(vehicles[version[0] % 2], version[0], datetime.now())
+
+            measure("render", name, scale, repeat, render)
+
+
+def bench_filter(scale, repeat):
+    vehicles = changed(VEHICLE_POSITIONS_URL, fetch_vehicle_positions)()
+    trips = changed(TRIP_UPDATES_URL, get_trip_updates)()
+    alerts = changed(ALERTS_URL, fetch_service_alerts)()
+    # Fields are sorted on their first lookup, so each build is timed with its first query
+    measure("filter", "index_vehicles", scale, repeat, lambda: index_vehicles(vehicles).query("route:9"))
+    measure("filter", "index_trip_updates", scale, repeat, lambda: index_trip_updates(trips).query("route:9"))
+    measure("filter", "index_alerts", scale, repeat, lambda: index_alerts(alerts).query("detour"))
+
+    # A stop is the slowest filter, since it means reading every prediction of every trip. The
+    # first stop query pays for indexing them, later ones (as the query is typed) don't.
+    stop_id = trips.trip_update(0).stop_time_update[0].stop_id if len(trips) else ""
+    query = f"stop:{stop_id}"
+    measure("filter", "query stop:, first", scale, repeat, lambda: index_trip_updates(trips).query(query))
+    index = index_trip_updates(trips)
+    index.query(query)
+    measure("filter", "query stop:, indexed", scale, repeat, lambda: index.query(query))
+
+    def scan():
+        return [
+            row
+            for row in range(len(trips))
+            if any(stop.stop_id.startswith(stop_id) for stop in trips.trip_update(row).stop_time_update)
+        ]
+
+    measure("filter", "query stop:, scan", scale, repeat, scan)
+
+
+def bench_sort(scale, repeat):
+    vehicles = snapshots(scale)[0]
+    ids = natural(vehicles.vehicle_ids)
+    measure("sort", "sort_order, speed", scale, repeat, lambda: sort_order(vehicles.speed))
+    measure("sort", "sort_order, vehicle id", scale, repeat, lambda: sort_order(ids))
+    measure("sort", "sort_order, natural(ids)", scale, repeat, lambda: sort_order(natural(vehicles.vehicle_ids)))
+
+
+def bench_arrivals(scale, repeat):
+    measure("arrivals", "fetch_stop_arrivals", scale, repeat, changed(TRIP_UPDATES_URL, fetch_stop_arrivals))
+    feed = feed_cache.get(TRIP_UPDATES_URL)
+    measure("arrivals", "StopArrivals.from_feed", scale, repeat, lambda: StopArrivals.from_feed(feed))
+    arrivals = StopArrivals.from_feed(feed)
+    trips = get_trip_updates()
+    # A station with two platforms, one of them a stop the feed has predictions for
+    stop_ids = [trips.trip_update(0).stop_time_update[0].stop_id if len(trips) else "", "0"]
+    now = feed.header.timestamp
+    measure("arrivals", "station, indexed", scale, repeat, lambda: arrivals.arrivals(stop_ids, after=now, limit=30))
+
+    def scan():
+        found = [
+            (stop_time.arrival.time, row)
+            for row in range(len(trips))
+            for stop_time in trips.trip_update(row).stop_time_update
+            if stop_time.stop_id in stop_ids and stop_time.arrival.time >= now
+        ]
+        return sorted(found)[:30]
+
+    measure("arrivals", "station, scan", scale, repeat, scan)
+
+
+async def run(scales, repeat, stages):
+    app = BenchApp()
+    async with app.run_test(size=(160, 60)) as pilot:
+        await pilot.pause()
+        with tempfile.TemporaryDirectory() as directory:
+            for scale in scales:
+                install_replay(os.path.join(directory, f"feeds-{scale}.archive"), scale)
+                if "parse" in stages:
+                    parsers = [
+                        ("fetch_vehicle_positions", VEHICLE_POSITIONS_URL, fetch_vehicle_positions),
+                        ("get_trip_updates", TRIP_UPDATES_URL, get_trip_updates),
+                        ("get_trip_updates, all rows", TRIP_UPDATES_URL, lambda: list(get_trip_updates())),
+                        ("fetch_service_alerts", ALERTS_URL, fetch_service_alerts),
+                    ]
+                    for name, url, fetch in parsers:
+                        measure("parse", name, scale, repeat, changed(url, fetch))
+                if "snap" in stages:
+                    vehicles = fetch_vehicle_positions()
+                    measure("snap", "get_blue_line_map", scale, repeat, lambda: get_blue_line_map(vehicles=vehicles))
+                    measure("snap", "get_green_line_map", scale, repeat, lambda: get_green_line_map(vehicles=vehicles))
+                if "filter" in stages:
+                    bench_filter(scale, repeat)
+                if "sort" in stages:
+                    bench_sort(scale, repeat)
+                if "arrivals" in stages:
+                    bench_arrivals(scale, repeat)
+                if "table" in stages or "render" in stages:
+                    await bench_widgets(app, pilot, stages, scale, repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="10,100,1000,10000", help="comma separated entity counts per feed")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stage", action="append", choices=STAGES)
+    args = parser.parse_args()
+    scales = [int(scale) for scale in args.scales.split(",")]
+    stages = set(args.stage or STAGES)
+
+    print(f"{'stage':<8} {'benchmark':<28} {'entities':>7}   {'best':>13}   {'peak memory':>14}")
+    asyncio.run(run(scales, repeat=args.repeat, stages=stages))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Time from interpreter start to the app's first frame, with lazy and eager tab construction.
+
+Every run starts a fresh interpreter, so import time is included. The app runs
+headless and exits on its Ready event, which Textual sends once the first frame
+has been displayed. Feed fetches start on worker threads during startup as they
+normally would, so a run without network access measures the same thing.
+
+Usage:
+    python -m benchmarks.bench_startup [--runs 5]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RUN = """
+import time
+start = time.perf_counter()
+import os, sys
+sys.path.insert(0, {root!r})
+import main
+imported = time.perf_counter()
+
+class StartupApp(main.TransitApp):
+    def on_ready(self):
+        loaded = sorted(module for module in ("numpy", "requests", "google.protobuf") if module in sys.modules)
+        print(imported - start, time.perf_counter() - start, ",".join(loaded) or "-", flush=True)
+        os._exit(0)
+
+StartupApp(lazy_tabs={lazy_tabs}).run(headless=True)
+"""
+
+
+def run_once(lazy_tabs):
+    code = RUN.format(root=ROOT, lazy_tabs=lazy_tabs)
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, timeout=60).stdout
+    import_seconds, first_frame_seconds, loaded = output.split()
+    return float(import_seconds), float(first_frame_seconds), loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'mode':<6} {'import main':>12} {'first frame':>12}   heavy modules loaded by the first frame")
+    for lazy_tabs in (False, True):
+        runs = [run_once(lazy_tabs) for _ in range(args.runs)]
+        import_ms = statistics.median(run[0] for run in runs) * 1000
+        frame_ms = statistics.median(run[1] for run in runs) * 1000
+        mode = "lazy" if lazy_tabs else "eager"
+        print(f"{mode:<6} {import_ms:9.0f} ms {frame_ms:9.0f} ms   {runs[-1][2]}")
+
+
+if __name__ == "__main__":
+    main()
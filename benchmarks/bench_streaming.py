@@ -0,0 +1,172 @@
+"""Compare parsing a whole trip updates body at once against decoding it with FeedStream as it arrives.
+
+The body arrives in chunks the way `response.iter_content()` yields it, optionally
+throttled to --mbps to stand in for the network. For each way of decoding the
+benchmark reports the time until the first entity is usable, the total time, and
+the peak of Python allocations. That peak is the downloaded bytes held at once, the
+whole payload or a chunk. tracemalloc doesn't see protobuf's own allocations, and
+every full decode builds the same complete message tree there, so it is not the
+process's peak memory.
+
+Before timing anything, FeedStream is checked against ParseFromString on a small
+feed: the same message across chunk sizes, with and without a route filter, and the
+same outcome on truncations of the body.
+
+Usage:
+    python -m benchmarks.bench_streaming [--trips 10000] [--stops 20] [--mbps 0] [--repeat 3]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from google.protobuf.message import DecodeError
+from google.transit import gtfs_realtime_pb2
+
+from benchmarks.synthetic_feeds import trip_updates_feed, vehicle_positions_feed
+from src.feed_capture import CaptureTransport, read_archive
+from src.metro_api import STREAM_CHUNK_SIZE, FeedStream
+
+RAIL_ROUTES = {"901", "902"}
+
+
+def body(payload, mbps):
+    """Yield the payload in chunks, at `mbps` megabits a second if it's not 0"""
+    for start in range(0, len(payload), STREAM_CHUNK_SIZE):
+        chunk = payload[start : start + STREAM_CHUNK_SIZE]
+        if mbps:
+            time.sleep(len(chunk) * 8 / (mbps * 1e6))
+        yield chunk
+
+
+def whole(chunks):
+    # What FeedCache did before streaming: read response.content, then parse it
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(b"".join(chunks))
+    yield from feed.entity
+
+
+def streamed(chunks, routes=None):
+    yield from FeedStream(chunks, routes)
+
+
+def header_then_rest(chunks):
+    # What FeedCache does: the header off the first chunk, then the rest in one parse
+    stream = FeedStream(chunks)
+    stream.read_header()
+    yield from stream.read().entity
+
+
+def split(payload, size):
+    return [payload[start : start + size] for start in range(0, len(payload), size)]
+
+
+def decoded(decode):
+    """The serialized message `decode()` returns, or DecodeError if it raised one"""
+    try:
+        return decode().SerializePartialToString()
+    except DecodeError:
+        return DecodeError
+
+
+def check(payload, routes, stride=1):
+    """Assert FeedStream decodes `payload` the way ParseFromString does, truncated every `stride` bytes too"""
+    expected = gtfs_realtime_pb2.FeedMessage()
+    expected.ParseFromString(payload)
+    kept = gtfs_realtime_pb2.FeedMessage()
+    kept.header.CopyFrom(expected.header)
+    for entity in expected.entity:
+        trip = entity.trip_update.trip if entity.HasField("trip_update") else entity.vehicle.trip
+        if trip.route_id in routes:
+            kept.entity.add().CopyFrom(entity)
+    for size in (1, 2, 3, 7, 64, 1000, len(payload)):
+        assert decoded(lambda: FeedStream(split(payload, size)).read()) == expected.SerializeToString(), size
+        stream = FeedStream(split(payload, size))
+        stream.read_header()
+        assert decoded(stream.read) == expected.SerializeToString(), size
+        assert list(FeedStream(split(payload, size))) == list(expected.entity), size
+        assert decoded(lambda: FeedStream(split(payload, size), routes).read()) == kept.SerializeToString(), size
+    for end in range(0, len(payload), stride):
+        truncated = payload[:end]
+        assert decoded(lambda: FeedStream(split(truncated, 64)).read()) == decoded(
+            lambda: gtfs_realtime_pb2.FeedMessage.FromString(truncated)
+        ), end
+        # Chunk by chunk, the scan has to tell a cut-off field from a complete one
+        truncated_stream = FeedStream(split(truncated, 64))
+        outcome = decoded(lambda: (list(truncated_stream), truncated_stream.feed)[1])
+        assert outcome is DecodeError or outcome == decoded(
+            lambda: gtfs_realtime_pb2.FeedMessage.FromString(truncated)
+        ), end
+
+
+def run(decode, source):
+    """(seconds until the first entity, seconds until the last one, entities)"""
+    start = time.perf_counter()
+    first = None
+    count = 0
+    for _ in decode(source()):
+        if first is None:
+            first = time.perf_counter() - start
+        count += 1
+    return first or 0.0, time.perf_counter() - start, count
+
+
+def measure(name, repeat, decode, source):
+    best = min((run(decode, source) for _ in range(repeat)), key=lambda result: result[1])
+    tracemalloc.start()
+    run(decode, source)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    first, total, count = best
+    print(f"{name:<36} {first * 1000:10.2f} ms {total * 1000:10.2f} ms {count:9} {peak / 1024:10.0f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trips", type=int, default=10000)
+    parser.add_argument("--stops", type=int, default=20)
+    parser.add_argument("--mbps", type=float, default=0, help="download speed to simulate, 0 for none")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for small in (trip_updates_feed(30, 4), vehicle_positions_feed(40, 0.5)):
+        check(small, RAIL_ROUTES)
+    # Entities over 16 KiB, whose lengths take three bytes
+    check(trip_updates_feed(4, 700), RAIL_ROUTES, stride=97)
+    print("FeedStream decodes the same as ParseFromString")
+
+    payload = trip_updates_feed(args.trips, args.stops)
+    print(f"feed: {args.trips} trips x {args.stops} stops, {len(payload) / 1024:.0f} KiB")
+    print(f"{'decode':<36} {'first entity':>13} {'all':>13} {'entities':>9} {'peak memory':>14}")
+
+    def chunks():
+        return body(payload, args.mbps)
+
+    measure("ParseFromString(response.content)", args.repeat, whole, chunks)
+    measure("FeedStream", args.repeat, streamed, chunks)
+    measure("FeedStream.read_header, then read", args.repeat, header_then_rest, chunks)
+    measure("FeedStream, rail routes only", args.repeat, lambda source: streamed(source, RAIL_ROUTES), chunks)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "feeds.archive")
+        capture = CaptureTransport(path)
+        capture.record("tripupdates.pb", payload)
+        capture.close()
+
+        def captured():
+            return next(read_archive(path))[1]
+
+        def read_file():
+            # How ReplayTransport loaded captures before it memory-mapped the archive
+            with open(path, "rb") as archive:
+                archive.readline()
+                return [archive.read(len(payload))]
+
+        measure("ParseFromString, capture read", args.repeat, whole, read_file)
+        measure("FeedStream, memory-mapped capture", args.repeat, streamed, captured)
+
+
+if __name__ == "__main__":
+    main()
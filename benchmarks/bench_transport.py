@@ -0,0 +1,84 @@
+"""Compare per-call latency of one-off requests.get calls against the pooled transport.
+
+Runs against a local HTTP stand-in so the numbers only reflect connection
+handling, not the Metro Transit servers. Local connections skip TLS, so the
+savings against the real HTTPS endpoints are larger than shown here. Each payload
+size is timed separately, since the share of a fetch that connecting costs shrinks
+as the body grows.
+
+Usage:
+    python -m benchmarks.bench_transport [--calls 200] [--payload-kb 1,50,300]
+"""
+
+import argparse
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from src.transport import HttpTransport
+
+
+def make_handler(payload):
+    class FeedHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep connections open between requests
+        # The headers and body go out in separate writes. With Nagle's algorithm on, the body
+        # waits for the client's delayed ACK of the headers on a reused connection
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FeedHandler
+
+
+def time_calls(get, url, calls):
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        get(url).content
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    mean = statistics.mean(samples)
+    median = statistics.median(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:<16} mean {mean:7.3f} ms   median {median:7.3f} ms   p95 {p95:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--payload-kb", default="1,50,300", help="comma separated payload sizes in KiB")
+    args = parser.parse_args()
+
+    for payload_kb in (int(size) for size in args.payload_kb.split(",")):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(b"\0" * (payload_kb * 1024)))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/vehiclepositions.pb"
+
+        transport = HttpTransport()
+        try:
+            print(f"{payload_kb} KiB payload")
+            report("requests.get", time_calls(lambda u: requests.get(u, timeout=10), url, args.calls))
+            report("HttpTransport", time_calls(transport.get, url, args.calls))
+        finally:
+            transport.close()
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
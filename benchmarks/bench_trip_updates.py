@@ -0,0 +1,76 @@
+"""Compare eager decoding of the whole trip updates feed against the lazy TripUpdatesView.
+
+Uses a synthetic feed, so the absolute numbers depend on --trips and --stops. The
+number that matters for the UI is the time until the first screenful of rows is
+ready, since the table adds rows in batches after that.
+
+Usage:
+    python -m benchmarks.bench_trip_updates [--trips 2000] [--stops 20] [--first 50] [--repeat 5]
+"""
+
+import argparse
+import time
+from itertools import islice
+
+from google.transit import gtfs_realtime_pb2
+
+from benchmarks.synthetic_feeds import trip_updates_feed
+from src.metro_api import TripUpdatesView, format_timestamp
+
+
+def eager_decode(feed):
+    # The decoding get_trip_updates did before TripUpdatesView: every row formatted up front
+    updates = []
+    for entity in feed.entity:
+        if entity.HasField("trip_update"):
+            trip = entity.trip_update.trip
+            stop_time = entity.trip_update.stop_time_update[0] if entity.trip_update.stop_time_update else None
+            updates.append(
+                {
+                    "trip_id": trip.trip_id,
+                    "route_id": getattr(trip, "route_id", "N/A"),
+                    "schedule": getattr(trip, "schedule_relationship", "SCHEDULED"),
+                    "stop_id": stop_time.stop_id if stop_time else "N/A",
+                    "arrival": format_timestamp(stop_time.arrival.time)
+                    if stop_time and stop_time.HasField("arrival")
+                    else "N/A",
+                    "departure": format_timestamp(stop_time.departure.time)
+                    if stop_time and stop_time.HasField("departure")
+                    else "N/A",
+                }
+            )
+    return updates
+
+
+def best_of(repeat, func):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trips", type=int, default=2000)
+    parser.add_argument("--stops", type=int, default=20)
+    parser.add_argument("--first", type=int, default=50, help="rows needed for the first paint")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payload = trip_updates_feed(args.trips, args.stops)
+    feed = gtfs_realtime_pb2.FeedMessage()
+    parse = best_of(args.repeat, lambda: feed.ParseFromString(payload))
+    print(f"feed: {args.trips} trips x {args.stops} stops, {len(payload) / 1024:.0f} KiB, parse {parse:.1f} ms")
+
+    eager_all = best_of(args.repeat, lambda: eager_decode(feed))
+    lazy_first = best_of(args.repeat, lambda: list(islice(TripUpdatesView(feed), args.first)))
+    lazy_all = best_of(args.repeat, lambda: list(TripUpdatesView(feed)))
+    print(f"eager decode, all rows       {eager_all:8.2f} ms")
+    print(f"lazy view, first {args.first:<4} rows    {lazy_first:8.2f} ms")
+    print(f"lazy view, all rows          {lazy_all:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
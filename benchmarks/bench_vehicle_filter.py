@@ -0,0 +1,107 @@
+"""Measure decoding only the rail vehicles of a full-fleet vehicle positions feed.
+
+The map tabs draw routes 901 and 902 alone. This compares decoding every vehicle of
+a recorded full-fleet feed, what the maps used to get, against the route-filtered
+decodes `fetch_vehicle_positions(routes=...)` picks from, and against decoding a feed
+that only has the rail vehicles in it, the floor any filter can get to.
+
+The full-fleet feed is the last vehicle positions capture of an archive recorded with
+`python main.py --record`, or a synthetic one.
+
+Usage:
+    python -m benchmarks.bench_vehicle_filter [--archive feeds.archive] [--vehicles 1000] [--repeat 20]
+"""
+
+import argparse
+import time
+
+from google.transit import gtfs_realtime_pb2
+
+from benchmarks.synthetic_feeds import vehicle_positions_feed
+from src.feed_capture import read_archive
+from src.feed_urls import VEHICLE_POSITIONS_URL
+from src.metro_api import FeedStream, VehicleSnapshot
+
+RAIL_ROUTES = frozenset({"901", "902"})
+RAIL_SHARE = 0.1
+
+
+def recorded_feed(path):
+    """The last vehicle positions payload of a capture archive"""
+    payload = None
+    for header, data in read_archive(path):
+        if header["url"] == VEHICLE_POSITIONS_URL:
+            payload = data
+    if payload is None:
+        raise SystemExit(f"{path} has no vehicle positions capture")
+    return bytes(payload)
+
+
+def parse(payload):
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(payload)
+    return feed
+
+
+def rail_only(feed):
+    """The rail vehicles of a feed, serialized as a feed of their own"""
+    rail = gtfs_realtime_pb2.FeedMessage()
+    rail.header.CopyFrom(feed.header)
+    rail.entity.extend(entity for entity in feed.entity if entity.vehicle.trip.route_id in RAIL_ROUTES)
+    return rail.SerializeToString()
+
+
+def measure(name, repeat, run):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:<52} {best * 1000:10.3f} ms {len(result):9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--archive", help="capture archive to take the full-fleet feed from")
+    parser.add_argument("--vehicles", type=int, default=1000, help="vehicles in the synthetic feed")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    full_payload = recorded_feed(args.archive) if args.archive else vehicle_positions_feed(args.vehicles, RAIL_SHARE)
+    feed = parse(full_payload)
+    rail_payload = rail_only(feed)
+    rail_feed = parse(rail_payload)
+    every_vehicle = VehicleSnapshot.from_feed(feed)
+    print(
+        f"full fleet: {len(feed.entity)} vehicles, {len(full_payload) / 1024:.0f} KiB; "
+        f"rail only: {len(rail_feed.entity)} vehicles, {len(rail_payload) / 1024:.0f} KiB"
+    )
+    print(f"{'decode':<52} {'time':>13} {'vehicles':>9}")
+
+    # From the parse FeedCache shares between every derived snapshot
+    measure("full fleet, every vehicle", args.repeat, lambda: VehicleSnapshot.from_feed(feed))
+    measure("full fleet, every vehicle then rail slice", args.repeat, lambda: every_vehicle.routes(RAIL_ROUTES))
+    measure("full fleet, rail routes only", args.repeat, lambda: VehicleSnapshot.from_feed(feed, RAIL_ROUTES))
+    measure("rail-only feed, every vehicle", args.repeat, lambda: VehicleSnapshot.from_feed(rail_feed))
+
+    # From the downloaded bytes
+    measure(
+        "full fleet bytes, parse + every vehicle", args.repeat, lambda: VehicleSnapshot.from_feed(parse(full_payload))
+    )
+    measure(
+        "full fleet bytes, parse + rail routes only",
+        args.repeat,
+        lambda: VehicleSnapshot.from_feed(parse(full_payload), RAIL_ROUTES),
+    )
+    measure(
+        "full fleet bytes, FeedStream(rail) + decode",
+        args.repeat,
+        lambda: VehicleSnapshot.from_feed(FeedStream([full_payload], RAIL_ROUTES).read()),
+    )
+    measure(
+        "rail-only bytes, parse + every vehicle", args.repeat, lambda: VehicleSnapshot.from_feed(parse(rail_payload))
+    )
+
+
+if __name__ == "__main__":
+    main()
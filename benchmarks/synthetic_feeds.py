@@ -0,0 +1,85 @@
+"""Synthetic GTFS realtime feeds sized like (or larger than) the Metro Transit ones"""
+
+import random
+import time
+
+from google.transit import gtfs_realtime_pb2
+
+from src.station_data import BLUE_LINE_STATIONS, GREEN_LINE_STATIONS
+
+ROUTE_IDS = ["901", "902", "2", "5", "6", "10", "18", "21", "54", "63"]
+
+
+def _feed(timestamp=None):
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = "2.0"
+    feed.header.timestamp = timestamp or int(time.time())
+    return feed
+
+
+def trip_updates_feed(
+    trips: int = 2000, stops_per_trip: int = 20, seed: int = 1, timestamp: int | None = None
+) -> bytes:
+    """Serialized trip updates feed with `trips` trips of `stops_per_trip` stop time updates each"""
+    rng = random.Random(seed)
+    feed = _feed(timestamp)
+    now = feed.header.timestamp
+    for trip in range(trips):
+        entity = feed.entity.add()
+        entity.id = f"trip-{trip}"
+        update = entity.trip_update
+        update.trip.trip_id = f"{trip:08d}-DEC25-MVS-BUS-Weekday-01"
+        update.trip.route_id = rng.choice(ROUTE_IDS)
+        arrival = now + rng.randint(0, 600)
+        for stop in range(stops_per_trip):
+            stop_time = update.stop_time_update.add()
+            stop_time.stop_sequence = stop + 1
+            stop_time.stop_id = str(rng.randint(1000, 60000))
+            stop_time.arrival.time = arrival
+            stop_time.departure.time = arrival + 30
+            arrival += rng.randint(60, 180)
+    return feed.SerializeToString()
+
+
+def vehicle_positions_feed(
+    vehicles: int = 1000, rail_share: float = 0.1, seed: int = 1, timestamp: int | None = None
+) -> bytes:
+    """Serialized vehicle positions feed, with `rail_share` of the vehicles on the Blue and Green Lines"""
+    rng = random.Random(seed)
+    feed = _feed(timestamp)
+    for vehicle in range(vehicles):
+        entity = feed.entity.add()
+        entity.id = f"vehicle-{vehicle}"
+        position = entity.vehicle
+        if rng.random() < rail_share:
+            route_id, stations = rng.choice([("901", BLUE_LINE_STATIONS), ("902", GREEN_LINE_STATIONS)])
+            station = rng.choice(stations)
+            latitude, longitude = station["latitude"], station["longitude"]
+        else:
+            route_id = rng.choice(ROUTE_IDS[2:])
+            latitude, longitude = 44.98, -93.27
+        position.vehicle.id = str(vehicle)
+        position.trip.trip_id = f"{vehicle:08d}-DEC25-MVS-Weekday-01"
+        position.trip.route_id = route_id
+        position.trip.direction_id = rng.randint(0, 1)
+        position.position.latitude = latitude + rng.uniform(-0.002, 0.002)
+        position.position.longitude = longitude + rng.uniform(-0.002, 0.002)
+        position.position.bearing = rng.uniform(0, 360)
+        position.position.speed = rng.uniform(0, 20)
+        position.timestamp = feed.header.timestamp - rng.randint(0, 60)
+    return feed.SerializeToString()
+
+
+def alerts_feed(alerts: int = 50, seed: int = 1, timestamp: int | None = None) -> bytes:
+    """Serialized service alerts feed"""
+    rng = random.Random(seed)
+    feed = _feed(timestamp)
+    for alert_number in range(alerts):
+        entity = feed.entity.add()
+        entity.id = f"alert-{alert_number}"
+        alert = entity.alert
+        alert.active_period.add(start=feed.header.timestamp - 3600, end=feed.header.timestamp + 3600)
+        alert.informed_entity.add(route_id=rng.choice(ROUTE_IDS))
+        alert.header_text.translation.add(text=f"Detour on route {alert_number}", language="en")
+        alert.description_text.translation.add(text="Buses are detoured due to construction. " * 4, language="en")
+    return feed.SerializeToString()
@@ -0,0 +1,40 @@
+"""Headless daemon that polls the Metro Transit feeds once and serves them to any number of app instances.
+
+Run it, then start each terminal's app with `python main.py --connect http://127.0.0.1:8765`.
+"""
+
+import argparse
+
+from src.capture_options import add_capture_arguments, apply_capture_arguments
+from src.feed_sources import FEED_SOURCES
+from src.snapshots import DEFAULT_HOST, DEFAULT_PORT, SnapshotPublisher, SnapshotServer, SnapshotStore
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve Metro Transit feed snapshots to transit app clients")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"address to listen on (default {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"port to listen on (default {DEFAULT_PORT})")
+    add_capture_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    apply_capture_arguments(args)
+
+    store = SnapshotStore()
+    publisher = SnapshotPublisher(store, FEED_SOURCES)
+    server = SnapshotServer((args.host, args.port), store)
+    publisher.start()
+    print(f"Serving feed snapshots on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        publisher.stop(timeout=1)
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
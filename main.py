@@ -1,18 +1,44 @@
+import argparse
 from datetime import datetime
+from functools import partial
 
 from textual.app import App, ComposeResult
 from textual.containers import Container
 from textual.widgets import Footer, Header, Static, TabbedContent, TabPane
 from textual.widgets._toast import ToastRack
 
-from src.blue_line_map_tab import BlueLineMapTab
-from src.combined_map_tab import CombinedMapTab
-from src.green_line_map_tab import GreenLineMapTab
-from src.horizontal_map_tab import HorizontalMapTab
-from src.metro_api import MetroTransitAPI, fetch_service_alerts
+from src.capture_options import add_capture_arguments, apply_capture_arguments
+from src.feed_poller import FeedPoller
+from src.feed_sources import FEED_SOURCES
+from src.feed_urls import ALERTS_URL
+from src.filter_bar import FilterBar
+from src.instrumentation import recorder
+from src.line_registry import lines
+from src.messages import FeedFetched
+from src.profiler_panel import ProfilerPanel
 from src.status_bar import StatusBar
 from src.tables import AlertsTable, RoutesTable, TripUpdatesTable, VehiclePositionsTable
 
+# {tab id: feed shown in the tab's table}
+TAB_FEEDS = {
+    "alerts_tab": "alerts",
+    "routes_tab": "routes",
+    "trip_updates_tab": "trip_updates",
+    "vehicle_positions_tab": "vehicle_positions",
+}
+FEED_TABS = {feed: tab_id for tab_id, feed in TAB_FEEDS.items()}
+
+# {pane id: method building its content}, for panes built the first time they're shown
+PANE_BUILDERS = {
+    "routes_tab": "_routes_tab",
+    "trip_updates_tab": "_trip_updates_tab",
+    "vehicle_positions_tab": "_vehicle_positions_tab",
+    "departures_tab": "_departures_tab",
+    "live_maps_tab": "_live_maps_tab",
+    "combined_map_tab": "_combined_map_tab",
+    "horizontal_map_tab": "_horizontal_map_tab",
+}
+
 
 class TransitApp(App):
     CSS_PATH = None
@@ -21,12 +47,58 @@ class TransitApp(App):
     BINDINGS = [
         ("q", "quit", "Quit"),
         ("r", "refresh", "Refresh alerts"),
+        ("/", "focus_filter", "Filter"),
+        ("p", "toggle_profiler", "Profiler"),
+        ("P", "dump_profile", "Dump profile"),
     ]
 
+    def __init__(self, *args, lazy_tabs: bool = True, sources=None, **kwargs):
+        """
+        Args:
+            lazy_tabs: Build each tab the first time it's shown instead of all of them up front
+            sources: FeedSource of every feed, defaults to polling Metro Transit directly
+        """
+        super().__init__(*args, **kwargs)
+        self.lazy_tabs = lazy_tabs
+        # {pane id: line key}, a map tab for every line in the registry
+        self._line_map_panes = {f"{line.key}_line_map_tab": line.key for line in lines()}
+        # The first line's map is built along with the Live Maps tab
+        self._unbuilt_panes = set(PANE_BUILDERS) | set(list(self._line_map_panes)[1:]) if lazy_tabs else set()
+        self._shown_versions = {}  # {feed: feed version currently shown in its table}
+        self._polled_feed = None  # Feed of the visible table, polled on the app's behalf
+        self.feed_poller = FeedPoller(self, FEED_SOURCES if sources is None else sources)
+
+    def _feed_changed(self, feed, version):
+        """Return True if a feed version differs from the one its table last showed"""
+        if version and self._shown_versions.get(feed) == version:
+            return False
+        self._shown_versions[feed] = version
+        return True
+
     def action_refresh(self):
-        self.refresh_alerts()
+        from src.metro_api import feed_cache
+
+        feed_cache.invalidate(ALERTS_URL)
+        self.feed_poller.refresh("alerts")
         self.notify("Data refreshed!", severity="information", timeout=3)
 
+    def action_focus_filter(self):
+        """Focus the filter of the active tab, if it has one"""
+        pane = self.query_one(TabbedContent).active_pane
+        filters = pane.query(FilterBar) if pane is not None else ()
+        if filters:
+            filters.first().focus()
+
+    def action_toggle_profiler(self):
+        self.query_one("#profiler_panel", ProfilerPanel).toggle()
+
+    def action_dump_profile(self):
+        """Write the recorded spans as JSON and as a Chrome trace to the working directory"""
+        stem = datetime.now().strftime("transit-profile-%Y%m%d-%H%M%S")
+        recorder.dump(f"{stem}.json")
+        recorder.dump(f"{stem}.trace.json", format="chrome")
+        self.notify(f"Profile written to {stem}.json and {stem}.trace.json", timeout=5)
+
     def update_status_bar(self, dt):
         bar = self.query_one("#status_bar", StatusBar)
         bar.update_refresh_time(dt)
@@ -35,34 +107,57 @@ class TransitApp(App):
         yield Header(show_clock=True)
         with TabbedContent():
             yield TabPane("Service Alerts", self._alerts_tab(), id="alerts_tab")
-            yield TabPane("Routes", self._routes_tab(), id="routes_tab")
-            yield TabPane("Trip Updates", self._trip_updates_tab(), id="trip_updates_tab")
+            yield TabPane("Routes", self._pane_content("routes_tab"), id="routes_tab")
+            yield TabPane("Trip Updates", self._pane_content("trip_updates_tab"), id="trip_updates_tab")
             yield TabPane(
                 "Vehicle Positions",
-                self._vehicle_positions_tab(),
+                self._pane_content("vehicle_positions_tab"),
                 id="vehicle_positions_tab",
             )
-            with TabPane("Live Maps", id="live_maps_tab"):
-                with TabbedContent():
-                    yield TabPane(
-                        "Blue Line Map",
-                        self._blue_line_map_tab(),
-                        id="blue_line_map_tab",
-                    )
-                    yield TabPane(
-                        "Green Line Map",
-                        self._green_line_map_tab(),
-                        id="green_line_map_tab",
-                    )
-                    yield TabPane("Combined Map", self._combined_map_tab(), id="combined_map_tab")
-                    yield TabPane("Horizontal Map", self._horizontal_map_tab(), id="horizontal_map_tab")
+            yield TabPane("Departures Board", self._pane_content("departures_tab"), id="departures_tab")
+            yield TabPane("Live Maps", self._pane_content("live_maps_tab"), id="live_maps_tab")
+        yield ProfilerPanel(id="profiler_panel")
         yield ToastRack()
         yield Footer()
 
+    def _pane_content(self, pane_id):
+        """The pane's content, or a placeholder if it's built on first activation"""
+        if pane_id in self._unbuilt_panes:
+            return Static("Loading...", classes="placeholder")
+        return self._pane_builder(pane_id)()
+
+    def _pane_builder(self, pane_id):
+        if pane_id in self._line_map_panes:
+            return partial(self._line_map_tab, self._line_map_panes[pane_id])
+        return getattr(self, PANE_BUILDERS[pane_id])
+
+    async def build_pane(self, pane):
+        """Replace a pane's placeholder with its content"""
+        self._unbuilt_panes.discard(pane.id)
+        await pane.query(".placeholder").remove()
+        await pane.mount(self._pane_builder(pane.id)())
+        feed = TAB_FEEDS.get(pane.id)
+        if feed is not None:
+            # Subscribing again sends the latest snapshot to the new table
+            self.feed_poller.subscribe(feed, self, poll=feed == self._polled_feed)
+
+    def _live_maps_tab(self):
+        maps = TabbedContent()
+        # What a `with TabbedContent():` block in compose does with the panes yielded inside it
+        for line in lines():
+            pane_id = f"{line.key}_line_map_tab"
+            maps.compose_add_child(TabPane(f"{line.name} Map", self._pane_content(pane_id), id=pane_id))
+        maps.compose_add_child(TabPane("Combined Map", self._pane_content("combined_map_tab"), id="combined_map_tab"))
+        maps.compose_add_child(
+            TabPane("Horizontal Map", self._pane_content("horizontal_map_tab"), id="horizontal_map_tab")
+        )
+        return maps
+
     def _alerts_tab(self):
         container = Container(
             Static("Transit Service Alerts", id="title", classes="bold"),
             StatusBar(id="alerts_status_bar"),
+            FilterBar("alerts_table", placeholder="Filter: route:901 or words in the alert", id="alerts_filter"),
             AlertsTable(id="alerts_table"),
         )
         return container
@@ -79,6 +174,9 @@ class TransitApp(App):
         container = Container(
             Static("Trip Updates", id="title", classes="bold"),
             StatusBar(id="trip_updates_status_bar"),
+            FilterBar(
+                "trip_updates_table", placeholder="Filter: route:901 trip:... stop:51405", id="trip_updates_filter"
+            ),
             TripUpdatesTable(id="trip_updates_table"),
         )
         return container
@@ -87,27 +185,39 @@ class TransitApp(App):
         container = Container(
             Static("Vehicle Positions", id="title", classes="bold"),
             StatusBar(id="vehicle_positions_status_bar"),
+            FilterBar(
+                "vehicle_positions_table",
+                placeholder="Filter: route:901 vehicle:1234 trip:...",
+                id="vehicle_positions_filter",
+            ),
             VehiclePositionsTable(id="vehicle_positions_table"),
         )
         return container
 
-    def _blue_line_map_tab(self):
+    def _departures_tab(self):
+        from src.departures_board import DeparturesBoard
+
         container = Container(
-            Static("Blue Line Map", id="title", classes="bold"),
-            StatusBar(id="blue_line_map_status_bar"),
-            BlueLineMapTab(id="blue_line_map_ascii"),
+            Static("Departures Board", id="title", classes="bold"),
+            StatusBar(id="departures_status_bar"),
+            DeparturesBoard(id="departures_board"),
         )
         return container
 
-    def _green_line_map_tab(self):
+    def _line_map_tab(self, key):
+        from src.line_map_tab import LineMapTab
+
+        map_tab = LineMapTab(key, id=f"{key}_line_map_ascii")
         container = Container(
-            Static("Green Line Map", id="title", classes="bold"),
-            StatusBar(id="green_line_map_status_bar"),
-            GreenLineMapTab(id="green_line_map_ascii"),
+            Static(f"{map_tab.line.name} Map", id="title", classes="bold"),
+            StatusBar(id=f"{key}_line_map_status_bar"),
+            map_tab,
         )
         return container
 
     def _combined_map_tab(self):
+        from src.combined_map_tab import CombinedMapTab
+
         container = Container(
             Static("Combined Map", id="title", classes="bold"),
             StatusBar(id="combined_map_status_bar"),
@@ -116,6 +226,8 @@ class TransitApp(App):
         return container
 
     def _horizontal_map_tab(self):
+        from src.horizontal_map_tab import HorizontalMapTab
+
         container = Container(
             Static("Horizontal Map View", id="title", classes="bold"),
             StatusBar(id="horizontal_map_status_bar"),
@@ -124,71 +236,91 @@ class TransitApp(App):
         return container
 
     def on_mount(self):
-        self.refresh_alerts()
-        self.refresh_routes()
-        self.refresh_trip_updates()
-        self.refresh_vehicle_positions()
-
-    def on_tabbed_content_tab_activated(self, event):
-        if event.tab.id == "alerts_tab":
-            self.refresh_alerts()
-        elif event.tab.id == "routes_tab":
-            self.refresh_routes()
-        elif event.tab.id == "trip_updates_tab":
-            self.refresh_trip_updates()
-        elif event.tab.id == "vehicle_positions_tab":
-            self.refresh_vehicle_positions()
-        elif event.tab.id == "blue_line_map_tab":
-            blue_line_map = self.query_one("#blue_line_map_ascii", BlueLineMapTab)
-            blue_line_map.refresh_map()
-        elif event.tab.id == "green_line_map_tab":
-            green_line_map = self.query_one("#green_line_map_ascii", GreenLineMapTab)
-            green_line_map.refresh_map()
-        elif event.tab.id == "horizontal_map_tab":
-            horizontal_map = self.query_one("#horizontal_map_ascii", HorizontalMapTab)
-            horizontal_map.refresh_map()
-
-    def refresh_alerts(self):
-        alerts = fetch_service_alerts()
-        alerts_table = self.query_one("#alerts_table", AlertsTable)
-        alerts_table.update_alerts(alerts)
-        now = datetime.now()
+        # Fetching imports the API modules, so wait for the first frame to be painted
+        self.call_after_refresh(self.start_feeds)
+
+    def start_feeds(self):
+        # Every table listens to its feed, and all four are fetched once concurrently at startup
+        for feed in TAB_FEEDS.values():
+            self.feed_poller.subscribe(feed, self, poll=False)
+        for feed in TAB_FEEDS.values():
+            self.feed_poller.refresh(feed)
+        self.poll_table_feed("alerts_tab")
+
+    async def on_tabbed_content_tab_activated(self, event):
+        if event.pane.id in self._unbuilt_panes:
+            await self.build_pane(event.pane)
+        # Map tabs and the departures board subscribe to the poller themselves when they are shown
+        if event.pane.id in TAB_FEEDS or event.pane.id in ("live_maps_tab", "departures_tab"):
+            self.poll_table_feed(event.pane.id)
+
+    def poll_table_feed(self, tab_id):
+        """Keep polling the feed of the table in the given tab, and stop polling the previous one"""
+        feed = TAB_FEEDS.get(tab_id)
+        if feed == self._polled_feed:
+            return
+        if self._polled_feed is not None:
+            self.feed_poller.set_polling(self._polled_feed, self, False)
+        if feed is not None:
+            self.feed_poller.set_polling(feed, self, True)
+        self._polled_feed = feed
+
+    def on_feed_fetched(self, message: FeedFetched):
+        if FEED_TABS.get(message.feed) in self._unbuilt_panes:
+            return  # The table doesn't exist yet, it gets the latest snapshot once built
+        if message.feed == "alerts":
+            self.show_alerts(message.data, message.version, message.fetched_at)
+        elif message.feed == "routes":
+            self.show_routes(message.data, message.fetched_at)
+        elif message.feed == "trip_updates":
+            self.show_trip_updates(message.data, message.version, message.fetched_at)
+        elif message.feed == "vehicle_positions":
+            self.show_vehicle_positions(message.data, message.version, message.fetched_at)
+
+    def show_alerts(self, alerts, version, fetched_at):
+        if self._feed_changed("alerts", version):
+            alerts_table = self.query_one("#alerts_table", AlertsTable)
+            alerts_table.update_alerts(alerts)
         bar = self.query_one("#alerts_status_bar")
-        bar.update_refresh_time(now)
-
-    def refresh_routes(self):
-        api = MetroTransitAPI()
-        try:
-            routes = api.get_routes()
-        except Exception as e:
-            routes = [{"route_id": "ERROR", "route_label": str(e)}]
+        bar.update_refresh_time(fetched_at)
+
+    def show_routes(self, routes, fetched_at):
         routes_table = self.query_one("#routes_table", RoutesTable)
         routes_table.update_routes(routes)
-        now = datetime.now()
         bar = self.query_one("#routes_status_bar")
-        bar.update_refresh_time(now)
+        bar.update_refresh_time(fetched_at)
 
-    def refresh_trip_updates(self):
-        from src.metro_api import get_trip_updates
-
-        updates = get_trip_updates()
-        trip_updates_table = self.query_one("#trip_updates_table", TripUpdatesTable)
-        trip_updates_table.update_trip_updates(updates)
-        now = datetime.now()
+    def show_trip_updates(self, updates, version, fetched_at):
+        if self._feed_changed("trip_updates", version):
+            trip_updates_table = self.query_one("#trip_updates_table", TripUpdatesTable)
+            trip_updates_table.update_trip_updates(updates)
         bar = self.query_one("#trip_updates_status_bar")
-        bar.update_refresh_time(now)
-
-    def refresh_vehicle_positions(self):
-        from src.metro_api import fetch_vehicle_positions
+        bar.update_refresh_time(fetched_at)
 
-        vehicles = fetch_vehicle_positions()
-        vehicle_positions_table = self.query_one("#vehicle_positions_table", VehiclePositionsTable)
-        vehicle_positions_table.update_vehicle_positions(vehicles)
-        now = datetime.now()
+    def show_vehicle_positions(self, vehicles, version, fetched_at):
+        if self._feed_changed("vehicle_positions", version):
+            vehicle_positions_table = self.query_one("#vehicle_positions_table", VehiclePositionsTable)
+            vehicle_positions_table.update_vehicle_positions(vehicles)
         bar = self.query_one("#vehicle_positions_status_bar")
-        bar.update_refresh_time(now)
+        bar.update_refresh_time(fetched_at)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Metro Transit in your terminal")
+    archive = add_capture_arguments(parser)
+    archive.add_argument(
+        "--connect", metavar="URL", help="show the feeds a snapshot daemon at URL serves instead of polling them"
+    )
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    app = TransitApp()
+    args = parse_args()
+    apply_capture_arguments(args)
+    sources = None
+    if args.connect:
+        from src.snapshots import SnapshotClient
+
+        sources = SnapshotClient(args.connect).sources(FEED_SOURCES)
+    app = TransitApp(sources=sources)
     app.run()
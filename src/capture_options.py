@@ -0,0 +1,41 @@
+"""The --record and --replay command line options shared by the app and the snapshot daemon.
+
+Kept apart from feed_capture so parsing the command line doesn't import requests
+before the app has drawn its first frame.
+"""
+
+import argparse
+
+
+def add_capture_arguments(parser: argparse.ArgumentParser):
+    """Add --record, --replay, --speed and --loop to a parser.
+
+    Returns:
+        The mutually exclusive group --record and --replay are in, for options that
+        rule both of them out
+    """
+    archive = parser.add_mutually_exclusive_group()
+    archive.add_argument("--record", metavar="ARCHIVE", help="append every fetched feed payload to ARCHIVE")
+    archive.add_argument("--replay", metavar="ARCHIVE", help="serve feeds from ARCHIVE instead of the network")
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="replay speed multiplier, 0 serves the next capture on every fetch"
+    )
+    parser.add_argument("--loop", action="store_true", help="restart the replay when the archive runs out")
+    return archive
+
+
+def apply_capture_arguments(args: argparse.Namespace):
+    """Install the capturing or replaying transport the parsed options ask for, if any"""
+    if args.record:
+        from .feed_capture import CaptureTransport
+        from .transport import set_transport
+
+        set_transport(CaptureTransport(args.record))
+    elif args.replay:
+        from .feed_capture import ReplayTransport
+        from .metadata_store import MetadataStore, set_metadata_store
+        from .transport import set_transport
+
+        set_transport(ReplayTransport(args.replay, speed=args.speed, loop=args.loop))
+        # Metadata from a replay shouldn't outlive it in the on-disk store
+        set_metadata_store(MetadataStore(":memory:"))
@@ -1,15 +1,13 @@
-from textual.timer import Timer
 from textual.widgets import Static
 
-from .metro_api import (
-    fetch_vehicle_positions,
-    get_coordinates_list,
-    get_station_coordinates,
-)
+from .instrumentation import recorder
+from .line_registry import get_line
+from .map_render import FrameCache
+from .messages import FeedFetched
+from .vehicle_tracker import feed_headings, vehicle_tracker
 
 
 class CombinedMapTab(Static):
-    refresh_timer: Timer | None = None
     # Updated marker styles for better visibility
     BLUE_MARKER_STYLES = {
         "track": "[blue]║[/]",
@@ -25,24 +23,31 @@ class CombinedMapTab(Static):
         "east": "[green]▶[/]",
         "west": "[magenta on green]◀[/]",
     }
+    AT_STATION_DISTANCE = 1000  # Metres, about the 0.01 degree radius the map has always used
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.blue_vehicle_cache = {}
-        self.blue_direction_cache = {}
-        self.green_vehicle_cache = {}
-        self.green_direction_cache = {}
         self.last_refresh_time = None
+        self.shown_feed_version = None
+        self.frame = FrameCache()
+        # Station names, label width, header and legend never change, so they're built once
+        self.blue_line = get_line("blue")
+        self.green_line = get_line("green")
+        self._blue_stations = self.blue_line.names
+        self._green_stations = self.green_line.names
+        self._max_label_len = max(
+            max(len(name) for name in self._blue_stations),
+            max(len(name) for name in self._green_stations),
+        )
+        self._header = self.render_header(self._max_label_len)
+        self._legend = self.render_legend()
 
     def on_show(self):
-        if not hasattr(self, "refresh_timer") or self.refresh_timer is None:
-            self.refresh_timer = self.set_interval(5, self.refresh_map)
-        self.refresh_map()
+        # The poller sends the latest snapshot right away and keeps polling while we're visible
+        self.app.feed_poller.subscribe("line_vehicles", self)
 
     def on_hide(self):
-        if hasattr(self, "refresh_timer") and self.refresh_timer is not None:
-            self.refresh_timer.stop()
-            self.refresh_timer = None
+        self.app.feed_poller.unsubscribe("line_vehicles", self)
 
     def render_station_line(self, blue_data, green_data, max_label_len=20):
         station_name, blue_marker = blue_data if blue_data else ("", "")
@@ -61,6 +66,14 @@ class CombinedMapTab(Static):
         # Combine into single line with padding
         return f"{blue_label} {blue_vis}   {green_vis} {green_label}"
 
+    def render_header(self, max_label_len):
+        return (
+            "[bold blue]Blue Line[/]"
+            + " " * (max_label_len * 2)
+            + "[bold green]Green Line[/]\n"
+            + "-" * (max_label_len * 2 + 20)
+        )
+
     def render_legend(self):
         blue_legend = (
             f"{self.BLUE_MARKER_STYLES['station']}: Station  "
@@ -77,82 +90,70 @@ class CombinedMapTab(Static):
         return f"{blue_legend}\n{green_legend}"
 
     def refresh_map(self):
-        from datetime import datetime
-
-        # Get station data
-        blue_stations = [station["name"] for station in get_station_coordinates("blue")]
-        green_stations = [station["name"] for station in get_station_coordinates("green")]
-
-        # Get vehicle positions
-        vehicles = fetch_vehicle_positions()
-        blue_vehicles = [v for v in vehicles if v["route_id"] == "901"]
-        green_vehicles = [v for v in vehicles if v["route_id"] == "902"]
-
-        # Get coordinates for distance calculations
-        blue_coords = get_coordinates_list("blue")
-        green_coords = get_coordinates_list("green")
-
-        def get_vehicle_at_station(coords, vehicles, station_idx):
-            if not vehicles:
-                return "station"
-
-            station_lat, station_lon = coords[station_idx]
-            for vehicle in vehicles:
-                dlat = station_lat - vehicle["latitude"]
-                dlon = station_lon - vehicle["longitude"]
-                dist = dlat * dlat + dlon * dlon
-
-                if dist < 0.0001:  # Threshold for considering a vehicle at a station
-                    # Determine direction based on position relative to previous station
-                    if station_idx > 0:
-                        prev_lat, prev_lon = coords[station_idx - 1]
-                        if abs(vehicle["latitude"] - prev_lat) > abs(vehicle["longitude"] - prev_lon):
-                            return "north" if vehicle["latitude"] > prev_lat else "south"
-                        else:
-                            return "east" if vehicle["longitude"] > prev_lon else "west"
-                    return "train"
-            return "station"
-
-        # Build the map display
-        lines = []
-        max_label_len = max(
-            max(len(name) for name in blue_stations),
-            max(len(name) for name in green_stations),
-        )
+        """Ask the poller for fresh vehicle positions, the map is redrawn when they arrive"""
+        self.app.feed_poller.refresh("line_vehicles")
 
-        # Add header
-        lines.append("[bold blue]Blue Line[/]" + " " * (max_label_len * 2) + "[bold green]Green Line[/]")
-        lines.append("-" * (max_label_len * 2 + 20))
+    def on_feed_fetched(self, message: FeedFetched):
+        if message.feed == "line_vehicles":
+            with recorder.span("render", widget=type(self).__name__):
+                self.render_map(message.data, message.version, message.fetched_at)
 
-        # Create station lines
-        max_stations = max(len(blue_stations), len(green_stations))
-        for i in range(max_stations):
-            blue_data = (
-                (
-                    blue_stations[i],
-                    get_vehicle_at_station(blue_coords, blue_vehicles, i),
-                )
-                if i < len(blue_stations)
-                else None
-            )
-            green_data = (
-                (
-                    green_stations[i],
-                    get_vehicle_at_station(green_coords, green_vehicles, i),
+    def render_map(self, vehicles, feed_version, fetched_at):
+        # Update status bar
+        now = fetched_at
+        bar = self.app.query_one("#combined_map_status_bar")
+        bar.update_refresh_time(now)
+
+        # Nothing to redraw if the feed hasn't changed since the last render
+        if feed_version and feed_version == self.shown_feed_version:
+            return
+        self.shown_feed_version = feed_version
+
+        # Split vehicle positions by line
+        blue_vehicles = self.blue_line.vehicles(vehicles)
+        green_vehicles = self.green_line.vehicles(vehicles)
+
+        vehicle_tracker.update(vehicles)
+
+        def get_station_markers(line, vehicles):
+            index = line.index
+            markers = ["station"] * len(index)
+            # Snap every vehicle to its closest station in one vectorized call
+            snapped = index.snap_vehicles(vehicles)
+            headings = feed_headings(vehicles, line, snapped)
+            rows = zip(vehicles.vehicle_ids, snapped.index.tolist(), snapped.distance.tolist(), headings)
+            for vehicle_id, station_idx, dist, heading in rows:
+                # Threshold for considering a vehicle at a station, the first one found wins
+                if station_idx < 0 or dist > self.AT_STATION_DISTANCE or markers[station_idx] != "station":
+                    continue
+                # The feed's direction_id or bearing, else the vehicle's movement along the line
+                direction = vehicle_tracker.line_direction(
+                    vehicle_id, index, line.forward, line.backward, heading=heading
                 )
-                if i < len(green_stations)
-                else None
-            )
-            lines.append(self.render_station_line(blue_data, green_data, max_label_len))
+                # 'southbound' is drawn with the 'south' marker
+                markers[station_idx] = "train" if direction == "stationary" else direction.removesuffix("bound")
+            return markers
 
-        # Add legend
-        lines.append("")
-        lines.append(self.render_legend())
+        blue_markers = get_station_markers(self.blue_line, blue_vehicles)
+        green_markers = get_station_markers(self.green_line, green_vehicles)
 
-        # Update display
-        self.update("\n".join(lines))
+        # Only the rows whose blue or green marker changed are rendered again
+        blue_stations = self._blue_stations
+        green_stations = self._green_stations
+        max_stations = max(len(blue_stations), len(green_stations))
+        states = [
+            (
+                blue_markers[i] if i < len(blue_stations) else None,
+                green_markers[i] if i < len(green_stations) else None,
+            )
+            for i in range(max_stations)
+        ]
 
-        # Update status bar
-        now = datetime.now()
-        bar = self.app.query_one("#combined_map_status_bar")
-        bar.update_refresh_time(now)
+        def render_row(i, state):
+            blue_marker, green_marker = state
+            blue_data = (blue_stations[i], blue_marker) if blue_marker is not None else None
+            green_data = (green_stations[i], green_marker) if green_marker is not None else None
+            return self.render_station_line(blue_data, green_data, self._max_label_len)
+
+        rows = self.frame.render_rows(states, render_row)
+        self.frame.publish(self, self._header, rows, "", self._legend)
@@ -0,0 +1,116 @@
+import time
+from functools import partial
+
+from textual.containers import Container
+from textual.widgets import Select, Static
+
+from .instrumentation import recorder
+from .line_registry import get_line, lines
+from .messages import FeedFetched
+from .tables import DeparturesTable
+
+
+class DeparturesBoard(Container):
+    """The next predicted arrivals at a station of any registered line.
+
+    The stations don't carry GTFS stop ids, so the first time a line's station is
+    picked its platforms' stop ids are looked up in the metadata store on a worker
+    thread. After that every trip updates snapshot is answered from the
+    StopArrivals index with a binary search per platform, and again every second
+    from the poller's shared clock so the countdown keeps running between polls.
+    """
+
+    LIMIT = 30  # Arrivals shown
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stop_ids = {}  # {(line key, station index): stop ids of the station's platforms}
+        self._station = None  # (line key, station index) picked, None before one is
+        self._arrivals = None  # Latest StopArrivals snapshot
+        self._version = None  # Its feed version
+        self._fetched_at = 0.0  # POSIX time it was fetched
+
+    def compose(self):
+        options = [(f"{line.name}: {name}", (line.key, i)) for line in lines() for i, name in enumerate(line.names)]
+        yield Select(options, prompt="Pick a station", id="departures_station")
+        yield Static("Pick a station to see its next arrivals", id="departures_message")
+        yield DeparturesTable(id="departures_table")
+
+    def on_show(self):
+        # The poller sends the latest snapshot right away and keeps polling while we're visible
+        self.app.feed_poller.subscribe("stop_arrivals", self)
+        self.app.feed_poller.subscribe_clock(self)
+
+    def on_hide(self):
+        self.app.feed_poller.unsubscribe("stop_arrivals", self)
+        self.app.feed_poller.unsubscribe_clock(self)
+
+    def update_message(self):
+        # Called every second by the poller's shared clock
+        if self._arrivals is not None and self._stop_ids.get(self._station) is not None:
+            self.show_departures()
+
+    def on_select_changed(self, event: Select.Changed):
+        self._station = None if event.value is Select.BLANK else event.value
+        if self._station is not None and self._station not in self._stop_ids:
+            self._set_message(f"Looking up the platforms of {self._station_name()}...")
+            line_key = self._station[0]
+            self.run_worker(partial(self._resolve_stops, line_key), thread=True, group=f"stops_{line_key}")
+            return
+        self.show_departures()
+
+    def on_feed_fetched(self, message: FeedFetched):
+        if message.feed != "stop_arrivals":
+            return
+        self.app.query_one("#departures_status_bar").update_refresh_time(message.fetched_at)
+        if message.version and message.version == self._version:
+            return
+        self._arrivals, self._version = message.data, message.version
+        self._fetched_at = message.fetched_at.timestamp()
+        self.show_departures()
+
+    def _resolve_stops(self, line_key: str):
+        # Runs on a worker thread, the first time fetching every stop of the line from NexTrip
+        from .metadata_store import get_metadata_store
+
+        try:
+            stop_ids = get_line(line_key).station_stop_ids(get_metadata_store())
+        except Exception as e:
+            self.app.call_from_thread(self._set_message, f"Couldn't look up the line's stops: {e}")
+            return
+        self.app.call_from_thread(self._stops_resolved, line_key, stop_ids)
+
+    def _stops_resolved(self, line_key: str, stop_ids):
+        for station, ids in enumerate(stop_ids):
+            self._stop_ids[line_key, station] = ids
+        self.show_departures()
+
+    def show_departures(self):
+        table = self.query_one("#departures_table", DeparturesTable)
+        stop_ids = self._stop_ids.get(self._station)
+        if stop_ids is None or self._arrivals is None:
+            if self._station is None:
+                self._set_message("Pick a station to see its next arrivals")
+            table.update_departures([], 0)
+            return
+        with recorder.span("render", widget=type(self).__name__):
+            # The countdown runs from when the feed was published, which also holds for a replayed
+            # feed, plus the time since it was fetched
+            now = time.time()
+            if self._arrivals.timestamp:
+                now = self._arrivals.timestamp + max(now - self._fetched_at, 0)
+            arrivals = self._arrivals.arrivals(stop_ids, after=now, limit=self.LIMIT)
+            table.update_departures(arrivals, now)
+        if not stop_ids:
+            self._set_message(f"No GTFS stops found near {self._station_name()}")
+        elif not arrivals:
+            self._set_message(f"No predicted arrivals at {self._station_name()}")
+        else:
+            self._set_message(f"Next arrivals at {self._station_name()}, platforms {', '.join(stop_ids)}")
+
+    def _station_name(self) -> str:
+        line_key, station = self._station
+        return get_line(line_key).names[station]
+
+    def _set_message(self, message: str):
+        self.query_one("#departures_message", Static).update(message)
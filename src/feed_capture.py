@@ -0,0 +1,172 @@
+"""Record fetched feed payloads to an archive and replay them without a network.
+
+The archive is a single append-only file. Every record is one JSON header line
+followed by the raw payload and a newline:
+
+    {"url": "...", "fetched_at": 1718000000.25, "status": 200, "content_type": "...", "length": 1234}
+    <1234 payload bytes>
+
+Records are only ever appended, so an archive can be captured across several runs
+and inspected with `head` while it grows.
+"""
+
+import json
+import mmap
+import os
+import threading
+import time
+from bisect import bisect_right
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .transport import HttpTransport
+
+
+class CaptureTransport:
+    """Wraps a transport and appends every successful response to an archive.
+
+    Args:
+        path: Archive file, created if missing and appended to otherwise
+        transport: Transport that does the actual fetching, defaults to a new HttpTransport
+    """
+
+    def __init__(self, path: str, transport=None):
+        self.path = path
+        self.transport = transport or HttpTransport()
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+
+    def get(
+        self, url: str, headers: dict | None = None, timeout: float | None = None, stream: bool = False
+    ) -> requests.Response:
+        response = self.transport.get(url, headers=headers, timeout=timeout, stream=stream)
+        if response.status_code == 200:
+            # Reads the whole body, which a streamed response then iterates from memory
+            self.record(url, response.content, response.headers.get("Content-Type", ""))
+        return response
+
+    def record(self, url: str, payload: bytes, content_type: str = "", fetched_at: float | None = None):
+        """Append one payload to the archive"""
+        header = {
+            "url": url,
+            "fetched_at": time.time() if fetched_at is None else fetched_at,
+            "status": 200,
+            "content_type": content_type,
+            "length": len(payload),
+        }
+        with self._lock:
+            self._file.write(json.dumps(header).encode() + b"\n" + payload + b"\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+        self.transport.close()
+
+
+def read_archive(path: str):
+    """Yield (header, payload) for every record in an archive, in the order they were captured.
+
+    The archive is memory-mapped, and each payload is a read-only memoryview of it, so
+    payloads are only paged in from disk when they're read.
+    """
+    with open(path, "rb") as archive:
+        if not os.fstat(archive.fileno()).st_size:
+            return
+        mapped = mmap.mmap(archive.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    pos = 0
+    while True:
+        end = mapped.find(b"\n", pos)
+        if end < 0:
+            return
+        header = json.loads(mapped[pos:end])
+        start = end + 1
+        pos = start + header["length"] + 1
+        if pos > len(mapped):
+            return  # Truncated last record, e.g. the capture was killed mid-write
+        yield header, view[start : start + header["length"]]
+
+
+class ReplayTransport:
+    """Serves captured payloads in place of the network.
+
+    Replay starts at the first capture in the archive and a replay clock runs `speed`
+    times faster than real time. Each request gets the latest payload captured for its
+    URL at the replay clock's time. With `speed=0` the clock doesn't run and every
+    request for a URL gets that URL's next capture instead, which makes runs
+    deterministic.
+
+    Every capture gets an ETag, so conditional requests get a 304 while the payload
+    for a URL hasn't changed, like they would from the live endpoints. The archive is
+    memory-mapped, so a long capture is read from disk one served payload at a time.
+
+    Args:
+        path: Archive written by CaptureTransport
+        speed: Replay clock rate, e.g. 10 to replay ten minutes of captures in one
+        loop: Start over from the first capture once the archive is exhausted
+    """
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False):
+        self.speed = speed
+        self.loop = loop
+        self._captures = {}  # {url: [(fetched_at, content_type, payload memoryview)]}
+        for header, payload in read_archive(path):
+            self._captures.setdefault(header["url"], []).append((header["fetched_at"], header["content_type"], payload))
+        for captures in self._captures.values():
+            captures.sort(key=lambda capture: capture[0])
+        self._times = {url: [capture[0] for capture in captures] for url, captures in self._captures.items()}
+        self.start = min((times[0] for times in self._times.values()), default=0.0)
+        self.end = max((times[-1] for times in self._times.values()), default=0.0)
+        self._started = time.monotonic()
+        self._steps = {}  # {url: requests served}, used when speed is 0
+        self._lock = threading.Lock()
+
+    def now(self) -> float:
+        """Current time on the replay clock, in the captured POSIX time"""
+        elapsed = (time.monotonic() - self._started) * self.speed
+        duration = self.end - self.start
+        if self.loop and duration > 0:
+            elapsed %= duration
+        return self.start + elapsed
+
+    def _capture_index(self, url: str) -> int:
+        captures = self._captures[url]
+        if self.speed == 0:
+            with self._lock:
+                step = self._steps.get(url, 0)
+                self._steps[url] = step + 1
+            return step % len(captures) if self.loop else min(step, len(captures) - 1)
+        # Before a URL's first capture, serve that capture rather than nothing
+        return max(bisect_right(self._times[url], self.now()) - 1, 0)
+
+    def get(
+        self, url: str, headers: dict | None = None, timeout: float | None = None, stream: bool = False
+    ) -> requests.Response:
+        if url not in self._captures:
+            return self._response(url, 404, b"", "")
+        index = self._capture_index(url)
+        fetched_at, content_type, payload = self._captures[url][index]
+        # Capture time as well as position, so captures from another archive never match
+        etag = f'"{index}-{fetched_at}"'
+        if headers and headers.get("If-None-Match") == etag:
+            return self._response(url, 304, b"", content_type, etag)
+        # A streamed body is only read with iter_content(), which slices the mapped payload
+        # without copying it. Anything else gets bytes, which `.json()` and `.text` need.
+        return self._response(url, 200, payload if stream else bytes(payload), content_type, etag)
+
+    @staticmethod
+    def _response(url: str, status: int, payload: bytes, content_type: str, etag: str | None = None):
+        response = requests.Response()
+        response.url = url
+        response.status_code = status
+        response._content = payload
+        response._content_consumed = True  # iter_content() slices the payload instead of reading a socket
+        response.headers = CaseInsensitiveDict({"Content-Type": content_type} if content_type else {})
+        if etag:
+            response.headers["ETag"] = etag
+        return response
+
+    def close(self):
+        pass
@@ -0,0 +1,181 @@
+"""Inverted indexes over the rows of one feed snapshot, for the table filters.
+
+Each index maps field values (route id, vehicle id, stop id, alert text token, ...)
+to the rows that have them. It's built once per feed update, after which a filter
+query is a handful of lookups instead of a scan over every row. Values are matched
+by prefix with a binary search over each field's sorted values, so a query
+narrows as it's typed.
+
+Queries are space separated terms. `field:value` terms only match that field, and
+bare words match any of the table's free text fields. Every term must match. Terms
+are split into words the same way indexed text is, so "station's," matches text
+saying "Station's", and a term with no words in it, such as a bare `route:`, is
+ignored.
+"""
+
+import re
+
+import numpy as np
+
+TOKEN = re.compile(r"\w+")
+LAST_CHAR = "\U0010ffff"  # Sorts after any character a value can continue with
+
+
+class InvertedIndex:
+    """The rows having each value of each field for one snapshot, matched without regard to case.
+
+    A field is kept as two arrays: its lowercased values sorted, and the row of each
+    value. All the values starting with a prefix are then one slice, found with two
+    binary searches.
+
+    Args:
+        fields: Names of the indexed fields, which queries can name
+        free_text_fields: Fields that bare words in a query are matched against
+    """
+
+    def __init__(self, fields, free_text_fields=()):
+        self.field_names = tuple(fields)
+        self.free_text_fields = tuple(free_text_fields)
+        self._added = {field: ([], []) for field in self.field_names}  # {field: (values, rows)} not yet sorted
+        self._deferred = {}  # {field: callable returning its values and rows}, indexed on first lookup
+        self._sorted = {}  # {field: (sorted lowercased values, their rows)}, built on the field's first lookup
+        self._text_fields = set()  # Fields indexed word by word with add_text
+
+    def add(self, field: str, values, rows=None):
+        """Index values of a field.
+
+        Args:
+            field: Field name
+            values: Strings, empty ones are never matched
+            rows: Row of each value, defaults to one value per row in order
+        """
+        added_values, added_rows = self._added[field]
+        added_values.extend(values)
+        added_rows.extend(range(len(values)) if rows is None else rows)
+
+    def defer(self, field: str, build):
+        """Index a field the first time a query looks it up, for fields that are slow to read.
+
+        Args:
+            field: Field name
+            build: Callable returning the field's values and the row of each
+        """
+        self._deferred[field] = build
+
+    def add_text(self, field: str, texts):
+        """Index every word of (text, row) pairs"""
+        tokens = {}  # {text: its distinct words}, since alerts often share a description
+        values, rows = [], []
+        for text, row in texts:
+            words = tokens.get(text)
+            if words is None:
+                words = tokens[text] = list(set(TOKEN.findall(text)))
+            values += words
+            rows += [row] * len(words)
+        self.add(field, values, rows)
+        self._text_fields.add(field)
+
+    def _field(self, field: str):
+        indexed = self._sorted.get(field)
+        if indexed is None:
+            if field in self._deferred:
+                self.add(field, *self._deferred.pop(field)())
+            values, rows = self._added.pop(field)
+            # One str.lower over every value at once, values never contain a newline
+            lowered = np.array("\n".join(map(str, values)).lower().split("\n") if values else [], dtype=str)
+            order = np.argsort(lowered, kind="stable")
+            indexed = self._sorted[field] = (lowered[order], np.asarray(rows, dtype=np.int64)[order])
+        return indexed
+
+    def rows(self, field: str, prefix: str) -> np.ndarray:
+        """Sorted distinct rows with a value of `field` starting with `prefix`"""
+        values, rows = self._field(field)
+        prefix = prefix.lower()
+        # side="right" for an empty prefix skips empty values, which sort first
+        start = np.searchsorted(values, prefix, side="right" if not prefix else "left")
+        end = np.searchsorted(values, prefix + LAST_CHAR, side="left")
+        return np.unique(rows[start:end])
+
+    def query(self, text: str) -> list | None:
+        """Rows matching every term of a query, in feed order, or None for an empty query"""
+        matched = None
+        for term in text.split():
+            field, sep, value = term.partition(":")
+            if sep and field in self.field_names:
+                rows = self._term_rows(field, value)
+            else:
+                matches = [self._term_rows(field, term) for field in self.free_text_fields]
+                matches = [rows for rows in matches if rows is not None]
+                rows = np.unique(np.concatenate(matches)) if matches else None
+            if rows is None:
+                continue
+            matched = rows if matched is None else np.intersect1d(matched, rows, assume_unique=True)
+            if not len(matched):
+                return []
+        return None if matched is None else matched.tolist()
+
+    def _term_rows(self, field: str, value: str) -> np.ndarray | None:
+        """Rows a term's value matches in one field, None if the term has nothing to match"""
+        if field not in self._text_fields:
+            return self.rows(field, value) if value else None
+        # Every word of the term must start a word of the row's text
+        matched = None
+        for word in TOKEN.findall(value):
+            rows = self.rows(field, word)
+            matched = rows if matched is None else np.intersect1d(matched, rows, assume_unique=True)
+        return matched
+
+
+def index_trip_updates(updates) -> InvertedIndex:
+    """Index trip update rows by trip, route and every stop the trip has a prediction for.
+
+    Reading every stop of every trip takes as long as scanning the rows once, so stops
+    are only indexed when a query asks for one, and bare words don't match them.
+    """
+    index = InvertedIndex(("trip", "route", "stop"), free_text_fields=("trip", "route"))
+    # A TripUpdatesView can list every stop of a trip, a plain list of rows only the first
+    if hasattr(updates, "trip_update"):
+        trip_updates = [updates.trip_update(row) for row in range(len(updates))]
+        trips = [trip_update.trip for trip_update in trip_updates]
+        index.add("trip", [trip.trip_id for trip in trips])
+        index.add("route", [trip.route_id for trip in trips])
+
+        def stops():
+            stop_ids = [[stop_time.stop_id for stop_time in update.stop_time_update] for update in trip_updates]
+            rows = np.repeat(np.arange(len(stop_ids)), [len(ids) for ids in stop_ids])
+            return [stop_id for ids in stop_ids for stop_id in ids], rows
+
+        index.defer("stop", stops)
+    else:
+        for field, key in (("trip", "trip_id"), ("route", "route_id"), ("stop", "stop_id")):
+            index.add(field, [update[key] for update in updates])
+    return index
+
+
+def index_vehicles(vehicles) -> InvertedIndex:
+    """Index a VehicleSnapshot by vehicle, trip and route"""
+    index = InvertedIndex(("vehicle", "trip", "route"), free_text_fields=("vehicle", "trip", "route"))
+    index.add("vehicle", vehicles.vehicle_ids)
+    index.add("trip", vehicles.trip_ids)
+    index.add("route", vehicles.route_ids)
+    return index
+
+
+def index_alerts(alerts) -> InvertedIndex:
+    """Index alerts by affected route, and by the words of their header and description"""
+    index = InvertedIndex(("route", "text"), free_text_fields=("text",))
+    routes = [alert.get("affected_routes", ()) for alert in alerts]
+    index.add(
+        "route",
+        [route_id for ids in routes for route_id in ids],
+        np.repeat(np.arange(len(routes)), [len(ids) for ids in routes]),
+    )
+    index.add_text(
+        "text",
+        (
+            (text, row)
+            for row, alert in enumerate(alerts)
+            for text in ((alert["error"],) if "error" in alert else (alert["header"], alert["description"]))
+        ),
+    )
+    return index
@@ -0,0 +1,201 @@
+"""Central scheduler that polls each feed once and publishes snapshots to subscribed widgets"""
+
+from datetime import datetime
+from functools import partial
+
+from textual.timer import Timer
+
+from .messages import FeedFetched
+
+
+class FeedSource:
+    """A feed the poller knows how to fetch.
+
+    Args:
+        name: Name of the feed, used as the subscription key
+        fetch: Callable returning the decoded rows for the feed, or for a feed with a url
+            (rows, version of the cached feed they were decoded from, 0 if the fetch failed)
+        url: GTFS realtime URL the feed is decoded from, if any
+        interval: Seconds between polls while the feed keeps changing
+        max_interval: Longest interval to back off to while the feed is unchanged or failing
+        version: Callable returning the version of the rows the last fetch returned, for
+            feeds not versioned by the feed cache
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fetch,
+        url: str | None = None,
+        interval: float = 5,
+        max_interval: float | None = None,
+        version=None,
+    ):
+        self.name = name
+        self.fetch = fetch
+        self.url = url
+        self.interval = interval
+        self.max_interval = max_interval if max_interval is not None else interval
+        self.version = version
+
+    def fetch_versioned(self):
+        """Fetch the feed and return its rows with their version, 0 if unversioned"""
+        if self.url is not None:
+            # Several feeds are decoded from one URL, so the version is read with the rows
+            # rather than from the cache afterwards, when another feed's poll may have moved it
+            return self.fetch()
+        data = self.fetch()
+        if self.version is not None:
+            return data, self.version()
+        return data, 0
+
+
+class _FeedState:
+    def __init__(self, source: FeedSource):
+        self.source = source
+        self.interval = source.interval
+        self.subscribers = {}  # {widget: True if the widget wants the feed polled}
+        self.snapshot = None  # (data, version, fetched_at) of the last poll
+        self.timer: Timer | None = None
+        self.in_flight = False
+
+    @property
+    def wants_polling(self) -> bool:
+        return any(self.subscribers.values())
+
+
+class FeedPoller:
+    """Polls every feed at its own cadence on worker threads and posts each result as a
+    FeedFetched message to the widgets subscribed to that feed.
+
+    A feed is only polled while at least one subscriber asks for polling, and its
+    interval doubles (up to the source's max_interval) every time a poll returns
+    the same feed version. A feed that keeps failing keeps returning version 0, or
+    raises, and backs off the same way. A fetch that raises leaves the last rows in
+    place, or shows the feed's error rows if it never loaded.
+    """
+
+    CLOCK_INTERVAL = 1
+
+    def __init__(self, app, sources):
+        self.app = app
+        self._feeds = {source.name: _FeedState(source) for source in sources}
+        self._clock_subscribers = set()
+        self._clock: Timer | None = None
+
+    def subscribe(self, feed: str, widget, poll: bool = True):
+        """Send a feed's snapshots to a widget, starting with the latest one if there is one.
+
+        Args:
+            feed: Name of the feed
+            widget: The widget (or app) that receives FeedFetched messages
+            poll: If False the widget only listens to snapshots other subscribers cause
+        """
+        state = self._feeds[feed]
+        state.subscribers[widget] = poll
+        if state.snapshot is not None:
+            widget.post_message(FeedFetched(feed, *state.snapshot))
+        if poll and state.timer is None and not state.in_flight:
+            self._schedule(state)
+
+    def unsubscribe(self, feed: str, widget):
+        """Stop sending a feed to a widget, and stop polling it once nobody asks for it"""
+        state = self._feeds[feed]
+        state.subscribers.pop(widget, None)
+        self._stop_unwanted(state)
+
+    def set_polling(self, feed: str, widget, poll: bool):
+        """Pause or resume polling a feed on a subscribed widget's behalf.
+
+        The widget keeps receiving the snapshots other subscribers cause, and isn't sent
+        the latest one again. The feed's pending poll is cancelled once nobody asks for
+        polling, and one is scheduled when the first subscriber asks again.
+        """
+        state = self._feeds[feed]
+        state.subscribers[widget] = poll
+        if not poll:
+            self._stop_unwanted(state)
+        elif state.timer is None and not state.in_flight:
+            self._schedule(state)
+
+    def _stop_unwanted(self, state: _FeedState):
+        if not state.wants_polling and state.timer is not None:
+            state.timer.stop()
+            state.timer = None
+
+    def refresh(self, feed: str):
+        """Poll a feed right away and reset its interval"""
+        state = self._feeds[feed]
+        state.interval = state.source.interval
+        if state.in_flight:
+            return
+        if state.timer is not None:
+            state.timer.stop()
+            state.timer = None
+        self._poll(state)
+
+    def subscribe_clock(self, widget):
+        """Call `widget.update_message()` every second from one shared timer"""
+        self._clock_subscribers.add(widget)
+        if self._clock is None:
+            self._clock = self.app.set_interval(self.CLOCK_INTERVAL, self._tick)
+
+    def unsubscribe_clock(self, widget):
+        self._clock_subscribers.discard(widget)
+        if not self._clock_subscribers and self._clock is not None:
+            self._clock.stop()
+            self._clock = None
+
+    def _tick(self):
+        for widget in list(self._clock_subscribers):
+            widget.update_message()
+
+    def _schedule(self, state: _FeedState):
+        # A snapshot younger than the interval is still current, poll once it ages out
+        if state.snapshot is not None:
+            age = (datetime.now() - state.snapshot[2]).total_seconds()
+            if age < state.interval:
+                state.timer = self.app.set_timer(state.interval - age, partial(self._poll, state))
+                return
+        self._poll(state)
+
+    def _poll(self, state: _FeedState):
+        state.timer = None
+        state.in_flight = True
+        self.app.run_worker(partial(self._fetch, state), thread=True, group=f"poll_{state.source.name}")
+
+    def _fetch(self, state: _FeedState):
+        # Runs on a worker thread, and always hands back to _publish, which clears in_flight
+        # and schedules the next poll. Raising would leave the feed unpolled and stop the app
+        data, version, error = None, 0, None
+        try:
+            data, version = state.source.fetch_versioned()
+        except Exception as e:
+            error = e
+        finally:
+            self.app.call_from_thread(self._publish, state, data, version, error)
+
+    def _publish(self, state: _FeedState, data, version: int, error: Exception | None = None):
+        state.in_flight = False
+        previous = state.snapshot
+        if error is not None:
+            # Subscribers keep the rows of the last fetch that worked, and the feed is
+            # retried less and less often until it comes back
+            state.interval = min(state.interval * 2, state.source.max_interval)
+            if previous is None:
+                from .snapshots import feed_error
+
+                self._send(state, feed_error(state.source.name, error), 0)
+        else:
+            if previous is not None and previous[1] == version:
+                state.interval = min(state.interval * 2, state.source.max_interval)
+            else:
+                state.interval = state.source.interval
+            self._send(state, data, version)
+        if state.wants_polling:
+            state.timer = self.app.set_timer(state.interval, partial(self._poll, state))
+
+    def _send(self, state: _FeedState, data, version: int):
+        state.snapshot = (data, version, datetime.now())
+        for widget in list(state.subscribers):
+            widget.post_message(FeedFetched(state.source.name, *state.snapshot))
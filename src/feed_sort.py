@@ -0,0 +1,55 @@
+"""Sort orders of the feed tables, computed on typed values rather than on the cell text.
+
+Matching the rows of one snapshot to the last one's by key, to only re-sort the rows
+that changed, costs more than numpy's argsort of the whole column, so every update
+sorts the column again.
+"""
+
+import numpy as np
+
+
+def natural(ids) -> np.ndarray:
+    """Sort values for ids that are mostly numbers, so route '6' sorts before '21'"""
+    return np.array([value.rjust(12) if value.isdigit() else value for value in map(str, ids)], dtype=str)
+
+
+def text(values) -> np.ndarray:
+    """Sort values for text, ignoring case"""
+    return np.array([value.casefold() for value in values], dtype=str)
+
+
+def numbers(values) -> np.ndarray:
+    """float64 sort values, with None (not reported) as NaN so it sorts last"""
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+
+def sort_order(values):
+    """Return the stable ascending permutation sorting `values`, and how many of them are NaN.
+
+    NaN sorts last, the way numpy sorts it, so the NaN rows are the end of the order.
+    """
+    values = np.asarray(values)
+    missing = int(np.count_nonzero(np.isnan(values))) if values.dtype.kind == "f" else 0
+    return np.argsort(values, kind="stable"), missing
+
+
+def visible_rows(row_count: int, order=None, selection=None, descending: bool = False, missing: int = 0):
+    """Rows to show in display order, or None for every row in feed order.
+
+    Args:
+        row_count: Number of rows in the snapshot
+        order: Ascending sort permutation, None for feed order
+        selection: Rows matching a filter in feed order, None for every row
+        descending: Show the sort order reversed
+        missing: Rows at the end of `order` without a value, which stay last when reversed
+    """
+    if order is None:
+        return None if selection is None else np.asarray(selection, dtype=np.intp)
+    if descending:
+        valued = len(order) - missing
+        order = np.concatenate((order[valued - 1 :: -1] if valued else order[:0], order[valued:]))
+    if selection is None:
+        return order
+    selected = np.zeros(row_count, dtype=bool)
+    selected[selection] = True
+    return order[selected[order]]
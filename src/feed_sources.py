@@ -0,0 +1,73 @@
+"""The feeds the app and the snapshot daemon poll, and how each one is fetched"""
+
+from .feed_poller import FeedSource
+from .feed_urls import ALERTS_URL, TRIP_UPDATES_URL, VEHICLE_POSITIONS_URL
+
+# The fetchers import metro_api (requests, protobuf and numpy) on the poller's worker
+# threads, so none of it is loaded before the first frame. Those of feeds with a URL
+# return their rows together with the feed cache version they were decoded from.
+# Every fetcher raises when it fails, so the poller keeps the rows it last got and
+# backs off instead of replacing them with empty ones
+
+
+def fetch_routes():
+    """Read the route list from the metadata store"""
+    from .metadata_store import get_metadata_store
+
+    return get_metadata_store().routes()
+
+
+def routes_version():
+    """Version of the stored route list, 0 if the store can't be read"""
+    from .metadata_store import get_metadata_store
+
+    try:
+        return get_metadata_store().version("routes")
+    except Exception:
+        return 0
+
+
+def fetch_service_alerts():
+    from .metro_api import fetch_service_alerts
+
+    return fetch_service_alerts(versioned=True)
+
+
+def get_trip_updates():
+    from .metro_api import get_trip_updates
+
+    return get_trip_updates(versioned=True)
+
+
+def fetch_stop_arrivals():
+    from .metro_api import fetch_stop_arrivals
+
+    return fetch_stop_arrivals(versioned=True)
+
+
+def fetch_vehicle_positions():
+    from .metro_api import fetch_vehicle_positions
+
+    return fetch_vehicle_positions(versioned=True)
+
+
+def fetch_line_vehicles():
+    """Decode only the vehicles on the registered lines' routes, which is all the map tabs draw"""
+    from .line_registry import lines
+    from .metro_api import fetch_vehicle_positions
+
+    routes = {route_id for line in lines() for route_id in line.route_ids}
+    return fetch_vehicle_positions(routes, versioned=True)
+
+
+FEED_SOURCES = [
+    FeedSource("alerts", fetch_service_alerts, ALERTS_URL, interval=60, max_interval=300),
+    # Read from disk, so polling is cheap and picks up a background revalidation soon after it lands
+    FeedSource("routes", fetch_routes, interval=60, max_interval=3600, version=routes_version),
+    FeedSource("trip_updates", get_trip_updates, TRIP_UPDATES_URL, interval=15, max_interval=60),
+    # Derived from the trip updates feed, so polling both costs one download and one parse
+    FeedSource("stop_arrivals", fetch_stop_arrivals, TRIP_UPDATES_URL, interval=15, max_interval=60),
+    FeedSource("vehicle_positions", fetch_vehicle_positions, VEHICLE_POSITIONS_URL, interval=5, max_interval=20),
+    # Decoded from the same parse of the vehicle positions feed, or sliced from its snapshot
+    FeedSource("line_vehicles", fetch_line_vehicles, VEHICLE_POSITIONS_URL, interval=5, max_interval=20),
+]
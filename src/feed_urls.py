@@ -0,0 +1,9 @@
+"""Metro Transit GTFS realtime feed URLs.
+
+Kept apart from metro_api so the app can name its feeds at startup without
+importing requests, protobuf and numpy.
+"""
+
+ALERTS_URL = "https://svc.metrotransit.org/mtgtfs/alerts.pb"
+TRIP_UPDATES_URL = "https://svc.metrotransit.org/mtgtfs/tripupdates.pb"
+VEHICLE_POSITIONS_URL = "https://svc.metrotransit.org/mtgtfs/vehiclepositions.pb"
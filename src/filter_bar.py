@@ -0,0 +1,41 @@
+from textual.binding import Binding
+from textual.widgets import Input
+
+
+class FilterBar(Input):
+    """One line input that filters a PagedTable as it's typed.
+
+    Enter moves focus to the table and Escape clears the filter.
+
+    Args:
+        table_id: Id of the PagedTable to filter
+    """
+
+    DEFAULT_CSS = """
+    FilterBar {
+        border: none;
+        height: 1;
+        padding: 0 1;
+    }
+    """
+
+    BINDINGS = [Binding("escape", "clear_filter", "Clear filter", show=False)]
+
+    def __init__(self, table_id: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.table_id = table_id
+
+    @property
+    def table(self):
+        return self.app.query_one(f"#{self.table_id}")
+
+    def on_input_changed(self, event: Input.Changed):
+        event.stop()
+        self.table.filter_rows(event.value)
+
+    def on_input_submitted(self, event: Input.Submitted):
+        event.stop()
+        self.table.focus()
+
+    def action_clear_filter(self):
+        self.value = ""
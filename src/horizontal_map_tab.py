@@ -1,153 +1,158 @@
-from textual.timer import Timer
 from textual.widgets import Static
 
-from .metro_api import DirectionDetector
+from .instrumentation import recorder
+from .line_registry import get_line
+from .map_render import FrameCache, horizontal_marker
+from .messages import FeedFetched
+from .vehicle_tracker import feed_headings, vehicle_tracker
 
 
 class HorizontalMapTab(Static):
-    refresh_timer: Timer | None = None
     # Marker styles for easy customization
     MARKER_STYLES = {
         "─": "[blue]─[/]",  # Horizontal line for tracks
         "⊖": "[blue]⊖[/]",  # Empty station marker
         "●": "[yellow]●[/]",  # Circle for stationary
-        "►": "[cyan]►[/]",  # Right arrow for eastbound
-        "◄": "[magenta]◄[/]",  # Left arrow for westbound
+        "►": "[cyan]►[/]",  # Right arrow for trains moving along the line
+        "◄": "[magenta]◄[/]",  # Left arrow for trains moving back towards its start
     }
     TRACK_SEGMENT_LENGTH = 4  # Spacing between stations
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, line: str = "blue", **kwargs):
         super().__init__(*args, **kwargs)
-        self.direction_detector = DirectionDetector()
+        self.line = get_line(line)
         self.last_refresh_time = None
-
-    def render_map_line(self, stations_data):
-        """Render a horizontal map line showing all stations and trains."""
-        # Create three lines: track, numbers, and station list
+        self.shown_feed_version = None
+        self.frame = FrameCache()
+        self._station_names = self.line.names
+        self._number_line = self.render_number_line(len(self._station_names))
+        self._station_list_layout = self.station_list_layout()
+        self._legend = self.render_legend()
+
+    def render_track_line(self, stations_data, track_markers=None):
+        """Render the track with a marker at every station and for trains between stations.
+
+        `track_markers` maps (segment, cell) to the marker of a train that is between
+        stations, where segment i runs from station i to station i + 1.
+        """
+        track_markers = track_markers or {}
         track_line = ""
-        number_line = ""
-        station_lines = []
-
-        # First create the track with markers and numbers
-        for i, (stop, is_train) in enumerate(stations_data):
+        for i, (_, is_train) in enumerate(stations_data):
             # Add track segment with increased spacing
             if i > 0:
-                track_line += self.MARKER_STYLES["─"] * self.TRACK_SEGMENT_LENGTH
-                number_line += " " * self.TRACK_SEGMENT_LENGTH
+                for cell in range(self.TRACK_SEGMENT_LENGTH):
+                    track_line += self.MARKER_STYLES[track_markers.get((i - 1, cell), "─")]
 
             # Add station marker (⊖ for empty station, ● for train)
-            marker = "●" if is_train else "⊖"
-            track_line += self.MARKER_STYLES[marker]
-
-            # Add station number (centered under marker)
-            station_num = f"[blue]{i + 1}[/]"
-            number_line += station_num
-
-            # Format station label for the list
-            label = f"[b]{stop}[/]"
-            if is_train:
-                label = f"[reverse]{label}[/]"
-            station_lines.append((f"{i + 1}. {label}", len(f"{i + 1}. {stop}")))  # Store actual content length
-
-        # Create the station list in two columns with proper alignment
-        station_list = []
-        mid_point = (len(station_lines) + 1) // 2
-        left_column = station_lines[:mid_point]
-        right_column = station_lines[mid_point:]
-
-        # Calculate the maximum width needed for the left column
-        # Use the stored content lengths that don't include markup
-        max_left_width = max(length for _, length in left_column) + 5  # Add padding
-
-        # Pad shorter column if needed
-        while len(right_column) < len(left_column):
-            right_column.append(("", 0))
-
-        # Combine columns with calculated spacing
-        for (left, left_len), (right, _) in zip(left_column, right_column):
-            padding = " " * (max_left_width - left_len)
-            if right:
-                station_list.append(f"{left}{padding}{right}")
-            else:
-                station_list.append(left)
-
-        # Combine all elements
-        return f"{track_line}\n{number_line}\n\nStations:\n" + "\n".join(station_list)
+            track_line += self.MARKER_STYLES["●" if is_train else "⊖"]
+        return track_line
+
+    def render_number_line(self, station_count):
+        """Station numbers centered under the station markers, the same for every frame"""
+        return (" " * self.TRACK_SEGMENT_LENGTH).join(f"[blue]{i + 1}[/]" for i in range(station_count))
+
+    def station_list_layout(self):
+        """Split the station list into two columns, returning (left, right, left column width)"""
+        mid_point = (len(self._station_names) + 1) // 2
+        left = list(range(mid_point))
+        right = list(range(mid_point, len(self._station_names)))
+        # Use the content lengths, without markup, plus padding
+        left_width = max(len(f"{i + 1}. {self._station_names[i]}") for i in left) + 5
+        return left, right, left_width
+
+    def render_station_label(self, i, is_train):
+        label = f"[b]{self._station_names[i]}[/]"
+        if is_train:
+            label = f"[reverse]{label}[/]"
+        return f"{i + 1}. {label}"
+
+    def render_station_row(self, left_index, left_is_train, right_index, right_is_train, left_width):
+        """Render one row of the two column station list"""
+        left = self.render_station_label(left_index, left_is_train)
+        if right_index is None:
+            return left
+        padding = " " * (left_width - len(f"{left_index + 1}. {self._station_names[left_index]}"))
+        return f"{left}{padding}{self.render_station_label(right_index, right_is_train)}"
 
     def render_legend(self):
+        names = self.line.names
         return (
             f"[b]{self.MARKER_STYLES['●']}[/b]: Train at station  "
-            f"[b]{self.MARKER_STYLES['►']}[/b]: Eastbound  "
-            f"[b]{self.MARKER_STYLES['◄']}[/b]: Westbound  "
+            f"[b]{self.MARKER_STYLES['►']}[/b]: Towards {names[-1]}  "
+            f"[b]{self.MARKER_STYLES['◄']}[/b]: Towards {names[0]}  "
             f"[b]{self.MARKER_STYLES['⊖']}[/b]: Empty station"
         )
 
     def on_show(self):
-        if not hasattr(self, "refresh_timer") or self.refresh_timer is None:
-            self.refresh_timer = self.set_interval(5, self.refresh_map)
-        self.refresh_map()
+        # The poller sends the latest snapshot right away and keeps polling while we're visible
+        self.app.feed_poller.subscribe("line_vehicles", self)
 
     def on_hide(self):
-        if hasattr(self, "refresh_timer") and self.refresh_timer is not None:
-            self.refresh_timer.stop()
-            self.refresh_timer = None
+        self.app.feed_poller.unsubscribe("line_vehicles", self)
 
     def refresh_map(self):
-        from datetime import datetime
+        """Ask the poller for fresh vehicle positions, the map is redrawn when they arrive"""
+        self.app.feed_poller.refresh("line_vehicles")
 
-        from .metro_api import (
-            fetch_vehicle_positions,
-            get_blue_line_map,
-            get_coordinates_list,
-        )
-
-        # Get both the line map and vehicle positions
-        line_map = get_blue_line_map()
-        vehicles = fetch_vehicle_positions()
-        route_id = "901"  # Blue Line
-        blue_line_vehicles = [v for v in vehicles if v["route_id"] == route_id]
-
-        # Get station coordinates from metro_api
-        station_coords = get_coordinates_list("blue")
-
-        # Initialize all stops with track markers
-        stop_markers = ["─" for _ in line_map]
-        stop_directions = ["stationary" for _ in line_map]
-
-        # Update markers based on vehicle positions and directions
-        for v in blue_line_vehicles:
-            vehicle_id = v["vehicle_id"]
-            lon = v["longitude"]
-            # Find closest stop index
-            closest_idx = None
-            min_dist = float("inf")
-            for i, (_, s_lon) in enumerate(station_coords):
-                dlon = s_lon - lon
-                dist = abs(dlon)  # For horizontal map we care mainly about longitude
-                if dist < min_dist:
-                    min_dist = dist
-                    closest_idx = i
-
-            # Use DirectionDetector for horizontal direction detection
-            direction = self.direction_detector.detect_horizontal_direction(vehicle_id, lon)
-            marker = self.direction_detector.get_horizontal_marker(direction)
-
-            if closest_idx is not None:
-                stop_markers[closest_idx] = marker
-                stop_directions[closest_idx] = direction
-
-        # Update display with new markers
-        lines = []
-        stations_data = [(stop, is_train) for stop, is_train in line_map]
-        lines.append(self.render_map_line(stations_data))
-        lines.append("")  # Empty line for spacing
-        lines.append(self.render_legend())
-
-        # Update the content
-        self.update("\n".join(lines))
+    def on_feed_fetched(self, message: FeedFetched):
+        if message.feed == "line_vehicles":
+            with recorder.span("render", widget=type(self).__name__):
+                self.render_map(message.data, message.version, message.fetched_at)
 
+    def render_map(self, vehicles, feed_version, fetched_at):
         # Update the status bar
-        now = datetime.now()
+        now = fetched_at
         self.last_refresh_time = now.strftime("%Y-%m-%d %H:%M:%S")
         bar = self.app.query_one("#horizontal_map_status_bar")
         bar.update_refresh_time(now)
+
+        # Nothing to redraw if the feed hasn't changed since the last render
+        if feed_version and feed_version == self.shown_feed_version:
+            return
+        self.shown_feed_version = feed_version
+
+        index = self.line.index
+        line_vehicles = self.line.vehicles(vehicles)
+        # Project every train onto the line in one vectorized call
+        snapped = index.snap_vehicles(line_vehicles)
+        chainages = index.chainage(snapped)
+        positions = index.station_position(chainages).tolist()
+
+        vehicle_tracker.update(vehicles)
+
+        # Place each train at a station or on one of the track cells between two stations
+        cells_per_segment = self.TRACK_SEGMENT_LENGTH + 1
+        train_stop_indices = set()
+        track_markers = {}  # {(segment, cell): marker}
+        headings = feed_headings(line_vehicles, self.line, snapped)
+        for vehicle_id, position, heading in zip(line_vehicles.vehicle_ids, positions, headings):
+            if position != position:  # NaN, no coordinates
+                continue
+            direction = vehicle_tracker.line_direction(vehicle_id, index, heading=heading)
+            marker = horizontal_marker(direction)
+            segment = int(position)
+            cell = round((position - segment) * cells_per_segment)
+            if cell == 0:
+                train_stop_indices.add(segment)
+            elif cell == cells_per_segment:
+                train_stop_indices.add(segment + 1)
+            else:
+                track_markers[(segment, cell - 1)] = marker
+
+        # Row 0 is the track, the rest are station list rows that only change when a train arrives or leaves
+        is_train = [idx in train_stop_indices for idx in range(len(index.names))]
+        stations_data = list(zip(index.names, is_train))
+        left, right, left_width = self._station_list_layout
+        states = [(tuple(is_train), tuple(sorted(track_markers.items())))]
+        for row, left_index in enumerate(left):
+            right_index = right[row] if row < len(right) else None
+            right_is_train = is_train[right_index] if right_index is not None else False
+            states.append((left_index, is_train[left_index], right_index, right_is_train, left_width))
+
+        def render_row(row, state):
+            if row == 0:
+                return self.render_track_line(stations_data, track_markers)
+            return self.render_station_row(*state)
+
+        rows = self.frame.render_rows(states, render_row)
+        self.frame.publish(self, rows[:1], self._number_line, "", "Stations:", rows[1:], "", self._legend)
@@ -0,0 +1,109 @@
+"""Lightweight timing spans and counters for the fetch, parse, build, snap and render hot paths.
+
+Spans go into a fixed-size ring buffer, so recording is always on and costs two
+`perf_counter` calls and a deque append. The buffer can be summarized per stage
+for the profiler panel or dumped as JSON or in the Chrome trace event format,
+which chrome://tracing and Perfetto open directly.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import NamedTuple
+
+DEFAULT_CAPACITY = 4096
+
+
+class Span(NamedTuple):
+    """One timed stage"""
+
+    name: str  # Stage, e.g. 'fetch', 'parse' or 'render'
+    start: float  # perf_counter seconds
+    duration: float  # Seconds
+    thread: int  # Native id of the thread that ran it
+    args: dict  # Extra details, such as the feed or widget
+
+
+class Recorder:
+    """Records spans into a ring buffer and keeps the latest value of named counters.
+
+    Args:
+        capacity: Number of spans kept, older ones are dropped
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.spans = deque(maxlen=capacity)
+        self.counters = {}  # {name: latest value}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **args):
+        """Time the body of a `with` block as a span"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append(Span(name, start, time.perf_counter() - start, threading.get_native_id(), args))
+
+    def count(self, name: str, value):
+        """Set a counter, e.g. the payload bytes or entity count of the last fetch of a feed"""
+        with self._lock:
+            self.counters[name] = value
+
+    def clear(self):
+        self.spans.clear()
+        with self._lock:
+            self.counters.clear()
+
+    def summary(self):
+        """Aggregate the buffered spans per stage and detail.
+
+        Returns:
+            {(name, detail): (count, total seconds, max seconds, last seconds)}, where detail
+            is the span's first text argument, such as its feed or widget
+        """
+        stats = {}
+        for span in list(self.spans):
+            key = (span.name, next((value for value in span.args.values() if isinstance(value, str)), ""))
+            count, total, longest, _ = stats.get(key, (0, 0.0, 0.0, 0.0))
+            stats[key] = (count + 1, total + span.duration, max(longest, span.duration), span.duration)
+        return stats
+
+    def to_json(self) -> dict:
+        return {
+            "spans": [span._asdict() for span in list(self.spans)],
+            "counters": dict(self.counters),
+        }
+
+    def to_chrome_trace(self) -> dict:
+        """Spans as complete ('X') events and counters as counter ('C') events, in microseconds"""
+        pid = os.getpid()
+        events = [
+            {
+                "name": span.name,
+                "cat": "transit",
+                "ph": "X",
+                "ts": span.start * 1e6,
+                "dur": span.duration * 1e6,
+                "pid": pid,
+                "tid": span.thread,
+                "args": span.args,
+            }
+            for span in list(self.spans)
+        ]
+        now = time.perf_counter() * 1e6
+        for name, value in dict(self.counters).items():
+            events.append({"name": name, "ph": "C", "ts": now, "pid": pid, "args": {"value": value}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def dump(self, path: str, format: str = "json"):
+        """Write the buffer to a file, as 'json' or as a 'chrome' trace"""
+        data = self.to_chrome_trace() if format == "chrome" else self.to_json()
+        with open(path, "w") as file:
+            json.dump(data, file)
+
+
+recorder = Recorder()
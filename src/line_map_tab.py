@@ -0,0 +1,124 @@
+from textual.widgets import Static
+
+from .instrumentation import recorder
+from .line_registry import get_line
+from .map_render import FrameCache, direction_marker, strip_markup
+from .messages import FeedFetched
+from .vehicle_tracker import feed_headings, vehicle_tracker
+
+
+class LineMapTab(Static):
+    """Vertical map of one line from the line registry, with a marker for every train.
+
+    Args:
+        line: Key of the line, e.g. 'blue'
+    """
+
+    marker_col = 30  # Center marker (1-based)
+    label_width = marker_col - 4
+    width = 60
+    label_on_left = True  # Set to True to display label to the left of the marker
+
+    def __init__(self, line: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.line = get_line(line)
+        self.last_refresh_time = None
+        self.shown_feed_version = None
+        self.frame = FrameCache()
+        # Marker styles for easy customization
+        self.marker_styles = {
+            "║": f"[{self.line.color}]║[/]",  # Double vertical line for tracks
+            "●": "[yellow]●[/]",  # Circle for stationary
+            "▲": "[cyan]▲[/]",  # Up arrow for northbound (or eastbound)
+            "▼": "[magenta]▼[/]",  # Down arrow for southbound (or westbound)
+        }
+        self._labels = {}  # {(label_pad, stop, is_train): formatted label}, the static part of each row
+        self._legend = self.render_legend()
+        self._label_pad = max((len(strip_markup(name)) for name in self.line.names), default=0)
+
+    def render_label(self, stop, is_train, label_pad=0):
+        """Station label with its padding, rendered once per station, train state and width"""
+        key = (label_pad, stop, is_train)
+        if key not in self._labels:
+            label_fmt = f"[black on bright_white][b]{stop}[/][/]"
+            if is_train:
+                label_fmt = f"[reverse]{label_fmt}[/]"
+            if self.label_on_left:
+                # Pad label to align marker/track
+                label_fmt += " " * (label_pad - len(strip_markup(stop)))
+            self._labels[key] = label_fmt
+        return self._labels[key]
+
+    def render_map_line(self, stop, marker, is_train, label_pad=0):
+        marker_colored = self.marker_styles.get(marker, marker)
+        label = self.render_label(stop, is_train, label_pad)
+        if self.label_on_left:
+            return f"{label} {marker_colored}"
+        # Marker left, label right (default)
+        return f"{' ' * (self.marker_col - 1)}{marker_colored}   {label}"
+
+    def render_legend(self):
+        # Upward arrows first, as in 'Northbound  Southbound'
+        directions = sorted((self.line.forward, self.line.backward), key=direction_marker)
+        return "  ".join(
+            [f"[b]{self.marker_styles['●']}[/b]: Stationary"]
+            + [f"[b]{self.marker_styles[direction_marker(d)]}[/b]: {d.title()}" for d in directions]
+            + [f"[b]{self.marker_styles['║']}[/b]: Track"]
+        )
+
+    def on_show(self):
+        # The poller sends the latest snapshot right away and keeps polling while we're visible
+        self.app.feed_poller.subscribe("line_vehicles", self)
+
+    def on_hide(self):
+        self.app.feed_poller.unsubscribe("line_vehicles", self)
+
+    def refresh_map(self):
+        """Ask the poller for fresh vehicle positions, the map is redrawn when they arrive"""
+        self.app.feed_poller.refresh("line_vehicles")
+
+    def on_feed_fetched(self, message: FeedFetched):
+        if message.feed == "line_vehicles":
+            with recorder.span("render", widget=f"{type(self).__name__}[{self.line.key}]"):
+                self.render_map(message.data, message.version, message.fetched_at)
+
+    def render_map(self, vehicles, feed_version, fetched_at):
+        line = self.line
+        index = line.index
+        line_vehicles = line.vehicles(vehicles)
+        # Snap every train to its closest stop in one vectorized call
+        snapped = index.snap_vehicles(line_vehicles)
+        closest_indices = snapped.index.tolist()
+        train_stop_indices = set(closest_indices)
+        line_map = [(name, idx in train_stop_indices) for idx, name in enumerate(line.names)]
+
+        # For feedback: set last refresh time and update the StatusBar widget
+        now = fetched_at
+        self.last_refresh_time = now.strftime("%Y-%m-%d %H:%M:%S")
+        bar = self.app.query_one(f"#{line.key}_line_map_status_bar")
+        bar.update_refresh_time(now)
+
+        # Nothing to redraw if the feed hasn't changed since the last render
+        if feed_version and feed_version == self.shown_feed_version:
+            return
+        self.shown_feed_version = feed_version
+
+        stop_markers = ["║" for _ in line_map]  # Initialize with track markers
+
+        vehicle_tracker.update(vehicles)
+        headings = feed_headings(line_vehicles, line, snapped)
+        for vehicle_id, closest_idx, heading in zip(line_vehicles.vehicle_ids, closest_indices, headings):
+            if closest_idx < 0:
+                continue
+
+            direction = vehicle_tracker.line_direction(
+                vehicle_id, index, forward=line.forward, backward=line.backward, heading=heading
+            )
+            marker = direction_marker(direction)
+            stop_markers[closest_idx] = marker
+
+        # Only the stations whose marker or train state changed are rendered again
+        label_pad = self._label_pad if self.label_on_left else 0
+        states = [(stop_markers[idx], is_train, label_pad) for idx, (_, is_train) in enumerate(line_map)]
+        rows = self.frame.render_rows(states, lambda idx, state: self.render_map_line(line_map[idx][0], *state))
+        self.frame.publish(self, rows, "", self._legend)
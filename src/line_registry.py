@@ -0,0 +1,140 @@
+"""Registry of the lines the map tabs draw, built from data rather than code.
+
+Lines come from `station_data.LINES` and can be added at runtime, e.g. from the
+NexTrip stations in the metadata store with `register_route`.
+"""
+
+import threading
+
+from .station_data import LINES
+
+STOP_RADIUS = 250  # Metres from a station within which a GTFS stop is one of its platforms
+
+
+class Line:
+    """A rail or BRT line with the per-line data every map shares.
+
+    Args:
+        key: Short name used in widget ids, e.g. 'blue'
+        name: Display name, e.g. 'Blue Line'
+        route_ids: GTFS route ids whose vehicles run on the line
+        stations: Station dictionaries with name, latitude and longitude, in line order
+        forward: Direction name of travel away from the first station
+        backward: Direction name of travel towards the first station
+        directions: {GTFS direction_id: direction name}
+        color: Rich color of the line's track
+    """
+
+    def __init__(
+        self,
+        key: str,
+        name: str,
+        route_ids,
+        stations,
+        forward: str = "forward",
+        backward: str = "backward",
+        directions: dict | None = None,
+        color: str = "white",
+    ):
+        self.key = key
+        self.name = name
+        self.route_ids = frozenset(route_ids)
+        self.stations = list(stations)
+        self.forward = forward
+        self.backward = backward
+        self.directions = dict(directions or {})
+        self.color = color
+        self.names = [station["name"] for station in self.stations]
+        self.coordinates = [(station["latitude"], station["longitude"]) for station in self.stations]
+        self.label_width = max((len(name) for name in self.names), default=0)
+        self._index = None
+        self._index_lock = threading.Lock()
+
+    def __repr__(self):
+        return f"Line({self.key!r}, {len(self.stations)} stations, routes {sorted(self.route_ids)})"
+
+    @property
+    def index(self):
+        """The line's StationIndex, built on first use since it needs numpy"""
+        with self._index_lock:
+            if self._index is None:
+                from .snapping import StationIndex
+
+                self._index = StationIndex(self.stations)
+            return self._index
+
+    def vehicles(self, snapshot):
+        """The vehicles of a VehicleSnapshot that run on this line"""
+        return snapshot.routes(self.route_ids)
+
+    def station_stop_ids(self, store) -> list[list[str]]:
+        """GTFS stop ids of each station's platforms, in both directions of travel.
+
+        The stations don't carry stop ids, so the NexTrip stops of the line's routes are
+        snapped to the nearest station by their coordinates.
+
+        Args:
+            store: MetadataStore the NexTrip stops are read from
+        """
+        stops = [
+            stop
+            for route_id in sorted(self.route_ids)
+            for direction in store.directions(route_id)
+            for stop in store.stop_locations(route_id, direction["direction_id"])
+        ]
+        stop_ids = [[] for _ in self.stations]
+        if not stops:
+            return stop_ids
+        snapped = self.index.snap([stop["latitude"] for stop in stops], [stop["longitude"] for stop in stops])
+        for stop, station, distance in zip(stops, snapped.index.tolist(), snapped.distance.tolist()):
+            if station >= 0 and distance <= STOP_RADIUS and stop["stop_id"] not in stop_ids[station]:
+                stop_ids[station].append(stop["stop_id"])
+        return stop_ids
+
+
+_lines = {}  # {key: Line}, in registration order
+
+
+def register_line(line: Line) -> Line:
+    """Add a line, replacing any line with the same key"""
+    _lines[line.key] = line
+    return line
+
+
+def get_line(key: str) -> Line:
+    """Look up a line by key.
+
+    Raises:
+        ValueError: If no line has that key
+    """
+    line = _lines.get(key.lower())
+    if line is None:
+        raise ValueError(f"Unknown line {key!r}, expected one of {', '.join(_lines)}")
+    return line
+
+
+def lines() -> list[Line]:
+    """Every registered line, in registration order"""
+    return list(_lines.values())
+
+
+def register_route(store, key: str, name: str, route_id: str, direction_id: int = 0, color: str = "white") -> Line:
+    """Register a line from the NexTrip metadata of one of its routes.
+
+    Args:
+        store: MetadataStore the stations and direction names are read from
+        key: Short name for the line
+        name: Display name
+        route_id: NexTrip route id
+        direction_id: Direction whose stop order the stations are listed in
+        color: Rich color of the line's track
+    """
+    directions = {item["direction_id"]: item["direction_name"].lower() for item in store.directions(route_id)}
+    forward = directions.get(direction_id, "forward")
+    backward = next((direction for i, direction in directions.items() if i != direction_id), "backward")
+    stations = store.stations(route_id, direction_id)
+    return register_line(Line(key, name, [route_id], stations, forward, backward, directions, color))
+
+
+for definition in LINES:
+    register_line(Line(**definition))
@@ -0,0 +1,93 @@
+"""Direction markers and render caching shared by the ASCII map tabs"""
+
+import re
+
+from .instrumentation import recorder
+
+MARKUP_TAG = re.compile(r"\[/?[a-zA-Z0-9 _]+\]")
+
+
+def strip_markup(text: str) -> str:
+    """Remove Rich markup tags, leaving the text as it is displayed"""
+    return MARKUP_TAG.sub("", text)
+
+
+def direction_marker(direction: str) -> str:
+    """Convert a direction to its corresponding marker symbol.
+
+    Args:
+        direction: One of 'northbound', 'southbound', 'eastbound', 'westbound', or 'stationary'
+
+    Returns:
+        The marker symbol to use for that direction
+    """
+    if direction in ("northbound", "eastbound"):
+        return "▲"
+    if direction in ("southbound", "westbound"):
+        return "▼"
+    return "●"  # Stationary, and the default
+
+
+def horizontal_marker(direction: str) -> str:
+    """Convert a direction to its corresponding horizontal marker symbol.
+
+    Args:
+        direction: One of 'eastbound', 'westbound', 'forward', 'backward' or 'stationary'
+
+    Returns:
+        The marker symbol to use for that direction
+    """
+    if direction in ("eastbound", "forward"):
+        return "►"
+    if direction in ("westbound", "backward"):
+        return "◄"
+    return "●"  # Stationary, and the default
+
+
+class FrameCache:
+    """Keeps a map's rendered rows between frames.
+
+    Every row has a state, e.g. its station marker. A row is only rendered again
+    when its state differs from the previous frame, and the widget is only updated
+    when the assembled frame differs from the one it already shows.
+    """
+
+    def __init__(self):
+        self.states = []
+        self.rows = []
+        self.dirty = set()  # Rows whose state changed in the last render_rows call
+        self.frame_hash = None
+
+    def render_rows(self, states, render_row):
+        """Return one markup row per state, calling `render_row(index, state)` for dirty rows only"""
+        if len(states) != len(self.states):
+            self.states = [None] * len(states)
+            self.rows = [""] * len(states)
+        self.dirty = {i for i, state in enumerate(states) if state != self.states[i]}
+        for i in self.dirty:
+            self.rows[i] = render_row(i, states[i])
+            self.states[i] = states[i]
+        return self.rows
+
+    def publish(self, widget, *parts) -> bool:
+        """Join `parts` (strings or lists of rows) into a frame and show it if it changed.
+
+        Returns:
+            True if the widget was updated
+        """
+        if not self.dirty and self.frame_hash is not None:
+            return False
+        frame = "\n".join(part if isinstance(part, str) else "\n".join(part) for part in parts)
+        frame_hash = hash(frame)
+        if frame_hash == self.frame_hash:
+            return False
+        self.frame_hash = frame_hash
+        with recorder.span("update", widget=type(widget).__name__):
+            widget.update(frame)
+        return True
+
+    def invalidate(self):
+        """Forget every row, so the next frame is rendered and shown in full"""
+        self.states = []
+        self.rows = []
+        self.frame_hash = None
@@ -0,0 +1,23 @@
+"""Messages that hand feed data fetched on worker threads back to widgets"""
+
+from datetime import datetime
+
+from textual.message import Message
+
+
+class FeedFetched(Message, bubble=False):
+    """Posted once a feed has been fetched and decoded off the event loop.
+
+    Args:
+        feed: Name of the feed, e.g. 'alerts' or 'vehicle_positions'
+        data: The decoded rows returned by the fetcher
+        version: Version of the cached feed the rows came from, or 0 if unversioned
+        fetched_at: When the feed was fetched, defaults to now
+    """
+
+    def __init__(self, feed: str, data, version: int = 0, fetched_at: datetime | None = None):
+        super().__init__()
+        self.feed = feed
+        self.data = data
+        self.version = version
+        self.fetched_at = fetched_at or datetime.now()
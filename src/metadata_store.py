@@ -0,0 +1,233 @@
+"""Persistent SQLite cache of the static NexTrip metadata: routes, directions, stops and stations.
+
+The route list changes a few times a year, so it and the other metadata are read
+from disk and only fetched again in the background once they're older than
+`max_age`. Until the fresh copy arrives the stored one keeps being served
+(stale-while-revalidate). Every entry has a version that goes up when a
+revalidation returns something different, so readers can tell when to redraw.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_MAX_AGE = 24 * 3600  # Seconds before an entry is revalidated
+RETRY_INTERVAL = 300  # Seconds between revalidation attempts while the API is failing
+SCHEMA_VERSION = 1  # Bump to discard stores written by an older layout
+
+
+def default_path() -> str:
+    """The store's file, in the user's cache directory"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "textual-transit", "metadata.sqlite3")
+
+
+class MetadataStore:
+    """Key-value store of JSON metadata with per-entry versions and background revalidation.
+
+    Keys look like 'routes', 'directions/901', 'stops/901/0' or 'stop_locations/901/0'.
+
+    Args:
+        path: SQLite file, or ':memory:' for a store that isn't kept between runs. A file
+            that can't be opened or created falls back to ':memory:'
+        max_age: Seconds before an entry is fetched again in the background
+        api: MetroTransitAPI used to fetch entries, created on first use if not given
+    """
+
+    def __init__(self, path: str | None = None, max_age: float = DEFAULT_MAX_AGE, api=None):
+        self.path = default_path() if path is None else path
+        self.max_age = max_age
+        self._api = api
+        self._lock = threading.Lock()
+        self._revalidating = set()  # Keys being fetched in the background
+        self._attempted = {}  # {key: monotonic time of the last background fetch}
+        try:
+            self._db = self._open(self.path)
+        except (OSError, sqlite3.Error):
+            # An unwritable cache directory or a broken file costs the cache between runs, not the app
+            self.path = ":memory:"
+            self._db = self._open(self.path)
+
+    @staticmethod
+    def _open(path: str) -> sqlite3.Connection:
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        db = sqlite3.connect(path, check_same_thread=False)
+        try:
+            with db:
+                if db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                    db.execute("DROP TABLE IF EXISTS metadata")
+                    db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS metadata ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, version INTEGER NOT NULL, fetched_at REAL NOT NULL)"
+                )
+        except sqlite3.Error:
+            db.close()
+            raise
+        return db
+
+    @property
+    def api(self):
+        if self._api is None:
+            from .metro_api import MetroTransitAPI
+
+            self._api = MetroTransitAPI()
+        return self._api
+
+    def get(self, key: str, fetch):
+        """Return the stored value of a key, fetching it first if it isn't stored yet.
+
+        A stored value older than `max_age` is still returned, and fetched again on a
+        background thread.
+
+        Args:
+            key: Entry key
+            fetch: Callable returning the value, which must be JSON serializable
+
+        Raises:
+            Whatever `fetch` raises when the key isn't stored yet
+        """
+        row = self._read(key)
+        if row is None:
+            value = fetch()
+            self._write(key, value)
+            return value
+        value, _, fetched_at = row
+        if time.time() - fetched_at > self.max_age:
+            self._revalidate(key, fetch)
+        return value
+
+    def version(self, key: str) -> int:
+        """Version of a stored key, 0 if it isn't stored"""
+        row = self._read(key)
+        return row[1] if row is not None else 0
+
+    def invalidate(self, key: str | None = None):
+        """Forget one key, or every key"""
+        with self._lock, self._db:
+            if key is None:
+                self._db.execute("DELETE FROM metadata")
+            else:
+                self._db.execute("DELETE FROM metadata WHERE key = ?", (key,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def routes(self):
+        return self.get("routes", self.api.get_routes)
+
+    def directions(self, route_id: str):
+        return self.get(f"directions/{route_id}", lambda: self.api.get_directions(route_id))
+
+    def stops(self, route_id: str, direction_id: int):
+        return self.get(f"stops/{route_id}/{direction_id}", lambda: self.api.get_stops(route_id, direction_id))
+
+    def stations(self, route_id: str, direction_id: int):
+        """Stations of a route in travel order, in the same format as `station_data.py`.
+
+        NexTrip only gives stop coordinates with departures, so the first fetch asks
+        for the departures of every stop once; after that the list is read from disk.
+        """
+        return self.get(f"stations/{route_id}/{direction_id}", lambda: self._fetch_stations(route_id, direction_id))
+
+    def stop_locations(self, route_id: str, direction_id: int):
+        """Every GTFS stop of a route's NexTrip places, with its stop_id, place_code, description and coordinates.
+
+        A place such as a rail station can have a stop per platform.
+        """
+        return self.get(
+            f"stop_locations/{route_id}/{direction_id}", lambda: self._fetch_stop_locations(route_id, direction_id)
+        )
+
+    def _fetch_stations(self, route_id: str, direction_id: int):
+        stations = {}  # {place_code: station}, the first located stop of each place
+        for stop in self.stop_locations(route_id, direction_id):
+            stations.setdefault(
+                stop["place_code"],
+                {"name": stop["description"], "latitude": stop["latitude"], "longitude": stop["longitude"]},
+            )
+        return list(stations.values())
+
+    def _fetch_stop_locations(self, route_id: str, direction_id: int):
+        locations = []
+        for stop in self.api.get_stops(route_id, direction_id):
+            departures = self.api.get_departures(route_id, direction_id, stop["place_code"])
+            for located in departures.get("stops", []):
+                if located.get("latitude") is None:
+                    continue
+                locations.append(
+                    {
+                        "stop_id": str(located["stop_id"]),
+                        "place_code": stop["place_code"],
+                        "description": stop["description"],
+                        "latitude": located["latitude"],
+                        "longitude": located["longitude"],
+                    }
+                )
+        return locations
+
+    def _read(self, key: str):
+        with self._lock:
+            row = self._db.execute("SELECT value, version, fetched_at FROM metadata WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1], row[2]
+
+    def _write(self, key: str, value) -> bool:
+        """Store a value, bumping its version if it changed. Returns True if it changed."""
+        encoded = json.dumps(value, sort_keys=True, separators=(",", ":"))
+        with self._lock, self._db:
+            row = self._db.execute("SELECT value, version FROM metadata WHERE key = ?", (key,)).fetchone()
+            changed = row is None or row[0] != encoded
+            version = (row[1] if row else 0) + changed
+            self._db.execute(
+                "INSERT OR REPLACE INTO metadata (key, value, version, fetched_at) VALUES (?, ?, ?, ?)",
+                (key, encoded, version, time.time()),
+            )
+        return changed
+
+    def _revalidate(self, key: str, fetch):
+        with self._lock:
+            last_attempt = self._attempted.get(key)
+            if key in self._revalidating or (
+                last_attempt is not None and time.monotonic() - last_attempt < RETRY_INTERVAL
+            ):
+                return
+            self._revalidating.add(key)
+            self._attempted[key] = time.monotonic()
+        threading.Thread(target=self._refetch, args=(key, fetch), name=f"revalidate_{key}", daemon=True).start()
+
+    def _refetch(self, key: str, fetch):
+        try:
+            self._write(key, fetch())
+        except Exception:
+            pass  # Keep serving the stored value, and try again after RETRY_INTERVAL
+        finally:
+            with self._lock:
+                self._revalidating.discard(key)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_metadata_store() -> MetadataStore:
+    """Return the shared store, opening it on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MetadataStore()
+        return _store
+
+
+def set_metadata_store(store: MetadataStore):
+    """Replace the shared store, closing the previous one"""
+    global _store
+    with _store_lock:
+        previous, _store = _store, store
+    if previous is not None and previous is not store:
+        previous.close()
@@ -1,10 +1,27 @@
+import mmap
+import re
+import threading
+import time
+from bisect import bisect_right
 from datetime import datetime
+from functools import partial
+from sys import intern
 from typing import Dict, List
 
+import numpy as np
 import requests
+from google.protobuf.message import DecodeError
 from google.transit import gtfs_realtime_pb2
 
-from .station_data import BLUE_LINE_STATIONS, GREEN_LINE_STATIONS
+from .feed_urls import ALERTS_URL, TRIP_UPDATES_URL, VEHICLE_POSITIONS_URL
+from .instrumentation import recorder
+from .line_registry import get_line
+from .stop_arrivals import StopArrivals
+from .transport import get_transport
+
+# Slightly shorter than the 5 second map refresh so every tick sees a fresh feed
+FEED_CACHE_TTL = 4.0
+STREAM_CHUNK_SIZE = 64 * 1024  # Bytes of a feed read and decoded at a time
 
 
 class MetroTransitAPI:
@@ -13,205 +30,400 @@ class MetroTransitAPI:
 
     def get_routes(self) -> List[Dict]:
         """Get all available routes"""
-        response = requests.get(f"{self.base_url}/routes")
+        response = get_transport().get(f"{self.base_url}/routes")
         response.raise_for_status()
         return response.json()
 
     def get_directions(self, route_id: str) -> List[Dict]:
         """Get directions for a specific route"""
-        response = requests.get(f"{self.base_url}/directions/{route_id}")
+        response = get_transport().get(f"{self.base_url}/directions/{route_id}")
         response.raise_for_status()
         return response.json()
 
     def get_stops(self, route_id: str, direction_id: int) -> List[Dict]:
         """Get stops for a route and direction"""
-        response = requests.get(f"{self.base_url}/stops/{route_id}/{direction_id}")
+        response = get_transport().get(f"{self.base_url}/stops/{route_id}/{direction_id}")
         response.raise_for_status()
         return response.json()
 
+    def get_departures(self, route_id: str, direction_id: int, place_code: str) -> Dict:
+        """Get departures from a stop, along with the stop's id and coordinates"""
+        response = get_transport().get(f"{self.base_url}/{route_id}/{direction_id}/{place_code}")
+        response.raise_for_status()
+        return response.json()
 
-class DirectionDetector:
-    """Handles direction detection for transit vehicles using coordinate history"""
 
-    def __init__(self):
-        self.position_cache = {}  # {vehicle_id: [prev_pos, curr_pos]}
-        self.direction_cache = {}  # {vehicle_id: current_direction}
-        self.threshold = 0.0001  # Threshold to prevent small fluctuations from changing direction
+class CachedFeed:
+    """A parsed feed together with the validators needed to revalidate it"""
 
-    def detect_direction(self, vehicle_id: str, coord: float, is_latitude: bool = True) -> str:
-        """Detect vehicle direction based on coordinate changes.
+    def __init__(self, feed, version: int, etag: str | None = None, last_modified: str | None = None):
+        self.feed = feed
+        self.version = version  # Bumped whenever the feed content changes
+        self.timestamp = feed.header.timestamp
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = time.monotonic()
+        self.derived = {}  # {name: value decoded from this version of the feed}
 
-        Args:
-            vehicle_id: The unique identifier of the vehicle
-            coord: The current coordinate (latitude or longitude)
-            is_latitude: If True, detect north/south, else detect east/west
 
-        Returns:
-            Direction as string: 'northbound'/'southbound' for latitude,
-            'eastbound'/'westbound' for longitude, or 'stationary'
-        """
-        if vehicle_id in self.position_cache:
-            prevs = self.position_cache[vehicle_id]
-            if len(prevs) == 2:
-                prevs = [prevs[1], coord]
-            else:
-                prevs.append(coord)
-            self.position_cache[vehicle_id] = prevs
-        else:
-            self.position_cache[vehicle_id] = [coord]
-            return self.direction_cache.get(vehicle_id, "stationary")
-
-        prevs = self.position_cache[vehicle_id]
-        if len(prevs) < 2:
-            return self.direction_cache.get(vehicle_id, "stationary")
-
-        prev_coord, curr_coord = prevs
-        old_direction = self.direction_cache.get(vehicle_id, "stationary")
-        coord_diff = curr_coord - prev_coord
-
-        if abs(coord_diff) < self.threshold:
-            return old_direction  # Maintain previous direction if change is small
-
-        if is_latitude:
-            # Latitude: increasing = northbound, decreasing = southbound
-            if coord_diff > self.threshold:
-                new_direction = "northbound"
-            elif coord_diff < -self.threshold:
-                new_direction = "southbound"
-            else:
-                return old_direction
-        else:
-            # Longitude: increasing = eastbound, decreasing = westbound
-            if coord_diff > self.threshold:
-                new_direction = "eastbound"
-            elif coord_diff < -self.threshold:
-                new_direction = "westbound"
-            else:
-                return old_direction
+class FeedCache:
+    """Caches parsed GTFS realtime feeds by URL for a short time-to-live.
 
-        if old_direction != new_direction:
-            self.direction_cache[vehicle_id] = new_direction
+    Callers that ask for the same URL while a download is in flight wait for it
+    and share its result, so one refresh window costs one request and one parse.
+    Stale feeds are revalidated with a conditional request. A FeedStream reads the
+    header off the start of the body, and a feed whose header timestamp has not moved
+    is kept as is, without downloading or parsing the rest of it.
+    """
 
-        return new_direction
+    def __init__(self, ttl: float = FEED_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}  # {url: CachedFeed}
+        self._locks = {}  # {url: lock held while the feed is being fetched}
+        self._locks_guard = threading.Lock()
 
-    def detect_horizontal_direction(self, vehicle_id: str, coord: float) -> str:
-        """Detect vehicle direction based on longitude changes for horizontal display.
+    def get(self, url: str, ttl: float | None = None) -> gtfs_realtime_pb2.FeedMessage:
+        """Return the parsed feed for a URL, downloading it if the cached copy is stale.
 
         Args:
-            vehicle_id: The unique identifier of the vehicle
-            coord: The current longitude coordinate
+            url: The GTFS realtime feed URL
+            ttl: Maximum age in seconds of a cached feed, defaults to the cache TTL
 
         Returns:
-            Direction as string: 'eastbound', 'westbound', or 'stationary'
+            The parsed FeedMessage
         """
-        if vehicle_id in self.position_cache:
-            prevs = self.position_cache[vehicle_id]
-            if len(prevs) == 2:
-                prevs = [prevs[1], coord]
-            else:
-                prevs.append(coord)
-            self.position_cache[vehicle_id] = prevs
-        else:
-            self.position_cache[vehicle_id] = [coord]
-            return self.direction_cache.get(vehicle_id, "stationary")
-
-        prevs = self.position_cache[vehicle_id]
-        if len(prevs) < 2:
-            return self.direction_cache.get(vehicle_id, "stationary")
-
-        prev_coord, curr_coord = prevs
-        old_direction = self.direction_cache.get(vehicle_id, "stationary")
-        coord_diff = curr_coord - prev_coord
-
-        # Using a smaller threshold for longitude since changes are typically smaller
-        threshold = 0.00005
-
-        if abs(coord_diff) < threshold:
-            return old_direction
-
-        new_direction = "eastbound" if coord_diff > threshold else "westbound"
-
-        if old_direction != new_direction:
-            self.direction_cache[vehicle_id] = new_direction
-
-        return new_direction
-
-    def get_marker(self, direction: str) -> str:
-        """Convert a direction to its corresponding marker symbol.
+        return self.get_entry(url, ttl).feed
+
+    def get_entry(self, url: str, ttl: float | None = None) -> CachedFeed:
+        """Like `get`, but return the cache entry with its version and validators"""
+        ttl = self.ttl if ttl is None else ttl
+        entry = self._entries.get(url)
+        if self._is_fresh(entry, ttl):
+            return entry
+        with self._lock_for(url):
+            # Another caller may have refreshed the feed while we were waiting
+            entry = self._entries.get(url)
+            if self._is_fresh(entry, ttl):
+                return entry
+            entry = self._fetch(url, entry)
+            self._entries[url] = entry
+            return entry
+
+    def derive(self, url: str, name: str, build, ttl: float | None = None):
+        """Return `build(feed)` for the current feed, reusing the result until the feed changes.
 
         Args:
-            direction: One of 'northbound', 'southbound', 'eastbound', 'westbound', or 'stationary'
+            url: The GTFS realtime feed URL
+            name: A key identifying what `build` produces
+            build: Callable that turns a FeedMessage into the derived value
 
         Returns:
-            The marker symbol to use for that direction
+            The derived value for the current version of the feed
         """
-        if direction == "stationary":
-            return "●"
-        elif direction in ("northbound", "eastbound"):
-            return "▲"
-        elif direction in ("southbound", "westbound"):
-            return "▼"
-        return "●"  # Default to stationary marker
+        return self.derive_versioned(url, name, build, ttl)[0]
 
-    def get_horizontal_marker(self, direction: str) -> str:
-        """Convert a direction to its corresponding horizontal marker symbol.
+    def derive_versioned(self, url: str, name: str, build, ttl: float | None = None):
+        """Like `derive`, but return (value, version of the feed it was built from).
 
-        Args:
-            direction: One of 'eastbound', 'westbound', or 'stationary'
+        Both come from the same cache entry, so another thread refreshing the feed in
+        between can't pair the value with a newer version.
+        """
+        entry = self.get_entry(url, ttl)
+        if name not in entry.derived:
+            with recorder.span("build", feed=name):
+                entry.derived[name] = build(entry.feed)
+        return entry.derived[name], entry.version
+
+    def derived(self, url: str, name: str, feed: gtfs_realtime_pb2.FeedMessage):
+        """Return what `derive` already built under a name from this exact feed, or None"""
+        entry = self._entries.get(url)
+        if entry is None or entry.feed is not feed:
+            return None
+        return entry.derived.get(name)
+
+    def version(self, url: str) -> int:
+        """Return the version of the cached feed, or 0 if it has never been fetched"""
+        entry = self._entries.get(url)
+        return entry.version if entry else 0
+
+    def invalidate(self, url: str | None = None):
+        """Mark the feed for a URL, or every feed if no URL is given, as stale"""
+        entries = self._entries.values() if url is None else [self._entries.get(url)]
+        for entry in entries:
+            if entry is not None:
+                entry.fetched_at = float("-inf")
+
+    def _fetch(self, url, entry):
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        feed_name = url.rsplit("/", 1)[-1]
+        with recorder.span("fetch", feed=feed_name):
+            response = get_transport().get(url, headers=headers or None, stream=True)
+        with response:
+            response.raise_for_status()
+            if entry is not None and response.status_code == 304:
+                entry.fetched_at = time.monotonic()
+                return entry
+
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            stream = FeedStream(response.iter_content(STREAM_CHUNK_SIZE))
+            # The rest of the body is downloaded while it's read, so this span covers both
+            with recorder.span("parse", feed=feed_name):
+                header = stream.read_header()
+                if entry is not None and entry.timestamp and header.timestamp == entry.timestamp:
+                    # Same feed served again without validators, skip downloading and parsing the rest
+                    entry.etag, entry.last_modified = etag, last_modified
+                    entry.fetched_at = time.monotonic()
+                    return entry
+                feed = stream.read()
+        recorder.count(f"{feed_name} bytes", stream.bytes_read)
+        recorder.count(f"{feed_name} entities", len(feed.entity))
+        version = entry.version + 1 if entry else 1
+        return CachedFeed(feed, version, etag, last_modified)
+
+    def _is_fresh(self, entry, ttl):
+        return entry is not None and time.monotonic() - entry.fetched_at <= ttl
+
+    def _lock_for(self, url):
+        with self._locks_guard:
+            return self._locks.setdefault(url, threading.Lock())
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _encode_varint(value: int) -> bytes:
+    encoded = bytearray()
+    while value > 0x7F:
+        encoded.append(value & 0x7F | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _scan_fields(data):
+    """Find the complete top-level fields at the start of a serialized message.
 
-        Returns:
-            The marker symbol to use for that direction
+    Returns:
+        (field number, value start, value end) of each complete field, and the offset
+        the first incomplete one starts at
+    """
+    fields = []
+    pos, size = 0, len(data)
+    try:
+        while pos < size:
+            # Entity tags are a byte long and most lengths one or two, so those skip the general varint read
+            key = data[pos]
+            if key & 0x80:
+                key, start = _read_varint(data, pos)
+            else:
+                start = pos + 1
+            wire_type = key & 7
+            if wire_type == 2:
+                length = data[start]
+                if not length & 0x80:
+                    start += 1
+                elif not data[start + 1] & 0x80:
+                    length = length & 0x7F | data[start + 1] << 7
+                    start += 2
+                else:
+                    length, start = _read_varint(data, start)
+                end = start + length
+            elif wire_type == 0:
+                _, end = _read_varint(data, start)
+            elif wire_type in (1, 5):
+                end = start + (8 if wire_type == 1 else 4)
+            else:
+                raise DecodeError(f"Unexpected wire type {wire_type} in a feed")
+            if end > size:
+                break
+            fields.append((key >> 3, start, end))
+            pos = end
+    except IndexError:
+        pass  # The end of the data cuts through a field's tag or length
+    return fields, pos
+
+
+class FeedStream:
+    """Decodes a serialized FeedMessage while its bytes arrive, a batch of entities at a time.
+
+    A FeedMessage is its header followed by one length-delimited field per entity,
+    and protobuf merges concatenated fields, so iterating the stream parses the
+    complete fields of every chunk with one MergeFromString while the rest of the
+    body is downloading, holding only the current chunk. `read` parses whatever is
+    left in one go instead, as FeedCache does once `read_header` has shown the feed
+    changed.
+
+    With `routes`, only the trip updates and vehicle positions of those routes are
+    parsed. Each route's encoded TripDescriptor.route_id field is searched for in the
+    raw chunk, and only the entities it appears in are parsed, then checked.
+
+    Args:
+        source: The serialized feed, either a bytes-like object such as a memory-mapped
+            capture, or an iterable of byte chunks such as `response.iter_content()`
+        routes: Route ids whose entities to keep, None to keep every entity
+    """
+
+    ENTITY_FIELD = 2  # FeedMessage.entity
+    HEADER_FIELD = 1  # FeedMessage.header
+    ROUTE_ID_TAG = b"\x2a"  # TripDescriptor.route_id, field 5, length-delimited
+
+    def __init__(self, source, routes=None):
+        if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+            view = memoryview(source)
+            source = (view[i : i + STREAM_CHUNK_SIZE] for i in range(0, len(view), STREAM_CHUNK_SIZE))
+        self._chunks = iter(source)
+        self.routes = None if routes is None else frozenset(routes)
+        self._route_pattern = None
+        if self.routes:
+            encoded = sorted(route_id.encode() for route_id in self.routes)
+            fields = [self.ROUTE_ID_TAG + _encode_varint(len(route_id)) + route_id for route_id in encoded]
+            self._route_pattern = re.compile(b"|".join(map(re.escape, fields)))
+        self.feed = gtfs_realtime_pb2.FeedMessage()
+        self.bytes_read = 0
+        self._pending = b""  # Start of a field the last chunk cut through
+
+    def read_header(self) -> gtfs_realtime_pb2.FeedHeader:
+        """Decode until the header has arrived and return it, empty if the feed has none"""
+        while not self.feed.HasField("header") and self._decode_chunk():
+            pass
+        return self.feed.header
+
+    def read(self) -> gtfs_realtime_pb2.FeedMessage:
+        """Decode the rest of the feed and return it.
+
+        Without `routes` the rest is joined and parsed with one MergeFromString,
+        which is quicker than scanning it chunk by chunk when nothing uses the
+        entities before the last one has arrived.
         """
-        if direction == "stationary":
-            return "●"
-        elif direction == "eastbound":
-            return "►"
-        elif direction == "westbound":
-            return "◄"
-        return "●"  # Default to stationary marker
-
-
-def fetch_service_alerts():
-    """Fetch service alerts from Metro Transit GTFS realtime feed"""
-    url = "https://svc.metrotransit.org/mtgtfs/alerts.pb"
+        if self.routes is not None:
+            while self._decode_chunk():
+                pass
+            return self.feed
+        rest = b"".join(self._chunks)
+        self.bytes_read += len(rest)
+        rest, self._pending = self._pending + rest, b""
+        self.feed.MergeFromString(rest)
+        return self.feed
+
+    def __iter__(self):
+        """Yield the feed's entities in order, each as soon as its chunk is decoded"""
+        yielded = 0
+        while True:
+            while yielded < len(self.feed.entity):
+                yield self.feed.entity[yielded]
+                yielded += 1
+            if not self._decode_chunk():
+                return
+
+    def _decode_chunk(self) -> bool:
+        """Decode the complete fields of the next chunk, returning False once the source is exhausted"""
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            if self._pending:
+                raise DecodeError("Truncated feed, it ends in the middle of a field")
+            return False
+        self.bytes_read += len(chunk)
+        data = memoryview(self._pending + chunk if self._pending else chunk)
+        fields, end = _scan_fields(data)
+        if self.routes is None:
+            self.feed.MergeFromString(data[:end])
+        else:
+            self._merge_routes(data, fields)
+        self._pending = bytes(data[end:])
+        return True
+
+    def _merge_routes(self, data, fields):
+        for number, start, end in fields:
+            if number == self.HEADER_FIELD:
+                self.feed.header.MergeFromString(data[start:end])
+        if self._route_pattern is None:
+            return
+        starts = [start for _, start, _ in fields]
+        candidates = {}  # {field: None}, the entities a route id appears in, in feed order
+        for match in self._route_pattern.finditer(data):
+            field = bisect_right(starts, match.start()) - 1
+            if field >= 0 and fields[field][0] == self.ENTITY_FIELD and match.start() < fields[field][2]:
+                candidates[field] = None
+        for field in candidates:
+            entity = self.feed.entity.add()
+            entity.MergeFromString(data[fields[field][1] : fields[field][2]])
+            # The bytes can also turn up inside another field, e.g. a trip id
+            if _entity_route_id(entity) not in self.routes:
+                del self.feed.entity[-1]
+
+
+def _entity_route_id(entity) -> str | None:
+    if entity.HasField("trip_update"):
+        return entity.trip_update.trip.route_id
+    if entity.HasField("vehicle"):
+        return entity.vehicle.trip.route_id
+    return None
+
+
+feed_cache = FeedCache()
+
+
+def _decode_alerts(feed):
     alerts_data = []
+    for entity in feed.entity:
+        alert = entity.alert
+        # When the alert took effect, or failing that when the feed was published
+        start = alert.active_period[0].start if alert.active_period else 0
+        since = start or feed.header.timestamp or int(time.time())
+        alert_data = {
+            "id": entity.id,
+            "header": (alert.header_text.translation[0].text if alert.header_text.translation else "No header"),
+            "description": (
+                alert.description_text.translation[0].text if alert.description_text.translation else "No description"
+            ),
+            "effect": str(alert.effect) if alert.effect else "UNKNOWN_EFFECT",
+            "cause": str(alert.cause) if alert.cause else "UNKNOWN_CAUSE",
+            "affected_routes": [ie.route_id for ie in alert.informed_entity if ie.route_id],
+            "timestamp": datetime.fromtimestamp(since).strftime("%Y-%m-%d %H:%M:%S"),
+            "time": since,  # POSIX time of `timestamp`, for sorting
+        }
+        alerts_data.append(alert_data)
+    return alerts_data
+
+
+def fetch_service_alerts(versioned: bool = False):
+    """Fetch service alerts from Metro Transit GTFS realtime feed
+
+    Args:
+        versioned: Return (alerts, feed version), and raise if the fetch fails rather
+            than returning an error row, so a poller can keep the alerts it has
+    """
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        feed = gtfs_realtime_pb2.FeedMessage()
-        feed.ParseFromString(response.content)
-        for entity in feed.entity:
-            alert = entity.alert
-            alert_data = {
-                "id": entity.id,
-                "header": (alert.header_text.translation[0].text if alert.header_text.translation else "No header"),
-                "description": (
-                    alert.description_text.translation[0].text
-                    if alert.description_text.translation
-                    else "No description"
-                ),
-                "effect": str(alert.effect) if alert.effect else "UNKNOWN_EFFECT",
-                "cause": str(alert.cause) if alert.cause else "UNKNOWN_CAUSE",
-                "affected_routes": [ie.route_id for ie in alert.informed_entity if ie.route_id],
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            }
-            alerts_data.append(alert_data)
-        return alerts_data
+        alerts, version = feed_cache.derive_versioned(ALERTS_URL, "alerts", _decode_alerts)
     except requests.exceptions.RequestException as e:
+        if versioned:
+            raise
         return [{"error": f"Error fetching alerts: {e}"}]
     except Exception as e:
+        if versioned:
+            raise
         return [{"error": f"Error processing alerts: {e}"}]
+    return (alerts, version) if versioned else alerts
 
 
 def fetch_trip_updates():
     """Fetch GTFS realtime trip updates from Metro Transit"""
-    url = "https://svc.metrotransit.org/mtgtfs/tripupdates.pb"
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        feed = gtfs_realtime_pb2.FeedMessage()
-        feed.ParseFromString(response.content)
-        return feed
+        return feed_cache.get(TRIP_UPDATES_URL)
     except Exception:
         return None
 
@@ -221,157 +433,421 @@ def format_timestamp(timestamp):
     return datetime.fromtimestamp(timestamp).strftime("%I:%M %p")
 
 
-def get_trip_updates():
-    """Get trip updates in a format suitable for display"""
-    feed = fetch_trip_updates()
-    if not feed:
-        return []
-    updates = []
-    for entity in feed.entity:
-        if entity.HasField("trip_update"):
-            trip = entity.trip_update.trip
-            stop_time = None
-            if entity.trip_update.stop_time_update:
-                stop_time = entity.trip_update.stop_time_update[0]
-            update = {
-                "trip_id": trip.trip_id,
-                "route_id": getattr(trip, "route_id", "N/A"),
-                "schedule": getattr(trip, "schedule_relationship", "SCHEDULED"),
-                "stop_id": stop_time.stop_id if stop_time else "N/A",
-                "arrival": (
-                    format_timestamp(stop_time.arrival.time) if stop_time and stop_time.HasField("arrival") else "N/A"
-                ),
-                "departure": (
-                    format_timestamp(stop_time.departure.time)
-                    if stop_time and stop_time.HasField("departure")
-                    else "N/A"
-                ),
-            }
-            updates.append(update)
-    return updates
-
-
-def fetch_vehicle_positions():
-    """Fetch and parse vehicle position data from Metro Transit"""
-    url = "https://svc.metrotransit.org/mtgtfs/vehiclepositions.pb"
-    vehicles = []
+def _format_stop_time(stop_time) -> Dict:
+    arrival = stop_time.arrival.time if stop_time and stop_time.HasField("arrival") else None
+    departure = stop_time.departure.time if stop_time and stop_time.HasField("departure") else None
+    return {
+        "stop_id": stop_time.stop_id if stop_time else "N/A",
+        "arrival": format_timestamp(arrival) if arrival is not None else "N/A",
+        "departure": format_timestamp(departure) if departure is not None else "N/A",
+        # POSIX times for sorting, None when not predicted
+        "arrival_time": arrival,
+        "departure_time": departure,
+    }
+
+
+class TripUpdatesView:
+    """Read-only sequence of trip update rows, decoded from the parsed feed on demand.
+
+    Nothing is formatted until a row is asked for, and each row is formatted once.
+    A row describes the trip's first stop_time_update; `stop_time_updates()` walks
+    the rest without materializing them.
+
+    Args:
+        feed: A parsed trip updates FeedMessage
+    """
+
+    def __init__(self, feed: gtfs_realtime_pb2.FeedMessage | None = None):
+        self._entities = feed.entity if feed is not None else []
+        self._indices = None  # Positions of the entities that carry a trip_update
+        self._rows = {}  # {row: formatted row}
+        self._columns = {}  # {name: value of every row}, for sorting
+
+    def _trip_update_indices(self):
+        if self._indices is None:
+            self._indices = [i for i, entity in enumerate(self._entities) if entity.HasField("trip_update")]
+        return self._indices
+
+    def __len__(self):
+        return len(self._trip_update_indices())
+
+    def __getitem__(self, row: int) -> Dict:
+        if row < 0:
+            row += len(self)
+        if row not in self._rows:
+            self._rows[row] = self._format_row(self.trip_update(row))
+        return self._rows[row]
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def trip_update(self, row: int) -> gtfs_realtime_pb2.TripUpdate:
+        """Return the undecoded TripUpdate message behind a row"""
+        return self._entities[self._trip_update_indices()[row]].trip_update
+
+    def trip_ids(self) -> List[str]:
+        if "trip_id" not in self._columns:
+            self._columns["trip_id"] = [self.trip_update(row).trip.trip_id for row in range(len(self))]
+        return self._columns["trip_id"]
+
+    def route_ids(self) -> List[str]:
+        if "route_id" not in self._columns:
+            self._columns["route_id"] = [self.trip_update(row).trip.route_id for row in range(len(self))]
+        return self._columns["route_id"]
+
+    def stop_times(self, field: str) -> np.ndarray:
+        """POSIX 'arrival' or 'departure' time at every row's first stop, NaN where it isn't predicted"""
+        if field not in self._columns:
+            times = np.full(len(self), np.nan)
+            for row in range(len(self)):
+                stop_time_update = self.trip_update(row).stop_time_update
+                if stop_time_update and stop_time_update[0].HasField(field):
+                    times[row] = getattr(stop_time_update[0], field).time
+            self._columns[field] = times
+        return self._columns[field]
+
+    def stop_time_updates(self, row: int):
+        """Yield every stop_time_update of a row's trip, formatted one at a time"""
+        for stop_time in self.trip_update(row).stop_time_update:
+            yield _format_stop_time(stop_time)
+
+    def _format_row(self, trip_update) -> Dict:
+        trip = trip_update.trip
+        stop_time = trip_update.stop_time_update[0] if trip_update.stop_time_update else None
+        return {
+            "trip_id": trip.trip_id,
+            "route_id": getattr(trip, "route_id", "N/A"),
+            "schedule": getattr(trip, "schedule_relationship", "SCHEDULED"),
+            **_format_stop_time(stop_time),
+        }
+
+
+def get_trip_updates(versioned: bool = False) -> TripUpdatesView:
+    """Get trip updates in a format suitable for display
+
+    Args:
+        versioned: Return (trip updates, feed version), and raise if the fetch fails
+            rather than returning no updates
+    """
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        feed = gtfs_realtime_pb2.FeedMessage()
-        feed.ParseFromString(response.content)
+        updates, version = feed_cache.derive_versioned(TRIP_UPDATES_URL, "trip_updates", TripUpdatesView)
+    except Exception:
+        if versioned:
+            raise
+        return TripUpdatesView()
+    return (updates, version) if versioned else updates
+
+
+def fetch_stop_arrivals(versioned: bool = False) -> StopArrivals:
+    """Predicted arrivals at every stop, from the same trip updates feed as `get_trip_updates`
+
+    Args:
+        versioned: Return (arrivals, feed version), and raise if the fetch fails rather
+            than returning no arrivals
+    """
+    try:
+        arrivals, version = feed_cache.derive_versioned(TRIP_UPDATES_URL, "stop_arrivals", StopArrivals.from_feed)
+    except Exception:
+        if versioned:
+            raise
+        return StopArrivals.empty()
+    return (arrivals, version) if versioned else arrivals
+
+
+class VehicleSnapshot:
+    """Vehicle positions stored as parallel typed columns instead of one dict per vehicle.
+
+    Rows are grouped by route so each route's vehicles are one contiguous slice, and
+    display strings are only produced by `row()` for the rows that are shown. Missing
+    speeds and bearings are NaN, and a missing direction_id is -1.
+
+    Args:
+        vehicle_ids: Vehicle id per row
+        trip_ids: Trip id per row
+        route_ids: Route id per row
+        latitude: float64 latitudes
+        longitude: float64 longitudes
+        speed: float64 speeds in metres per second, NaN when not reported
+        timestamp: int64 POSIX timestamps
+        presorted: True if the rows are already grouped by route
+        bearing: float64 compass bearings in degrees clockwise from north, NaN when not reported
+        direction_id: int8 GTFS trip direction_id, -1 when not reported
+    """
+
+    def __init__(
+        self,
+        vehicle_ids,
+        trip_ids,
+        route_ids,
+        latitude,
+        longitude,
+        speed,
+        timestamp,
+        presorted: bool = False,
+        bearing=None,
+        direction_id=None,
+    ):
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+        speed = np.asarray(speed, dtype=np.float64)
+        timestamp = np.asarray(timestamp, dtype=np.int64)
+        if bearing is None:
+            bearing = np.full(len(route_ids), np.nan)
+        bearing = np.asarray(bearing, dtype=np.float64)
+        if direction_id is None:
+            direction_id = np.full(len(route_ids), -1)
+        direction_id = np.asarray(direction_id, dtype=np.int8)
+        if not presorted:
+            # A stable sort keeps feed order within each route
+            order = sorted(range(len(route_ids)), key=route_ids.__getitem__)
+            vehicle_ids = [vehicle_ids[i] for i in order]
+            trip_ids = [trip_ids[i] for i in order]
+            route_ids = [route_ids[i] for i in order]
+            order = np.array(order, dtype=np.intp)
+            latitude, longitude, speed, timestamp = latitude[order], longitude[order], speed[order], timestamp[order]
+            bearing, direction_id = bearing[order], direction_id[order]
+        self.vehicle_ids = vehicle_ids
+        self.trip_ids = trip_ids
+        self.route_ids = route_ids
+        self.latitude = latitude
+        self.longitude = longitude
+        self.speed = speed
+        self.timestamp = timestamp
+        self.bearing = bearing
+        self.direction_id = direction_id
+        self.route_slices = {}  # {route_id: slice of the rows for that route}
+        start = 0
+        for i in range(1, len(route_ids) + 1):
+            if i == len(route_ids) or route_ids[i] != route_ids[start]:
+                self.route_slices[route_ids[start]] = slice(start, i)
+                start = i
+
+    @classmethod
+    def empty(cls) -> "VehicleSnapshot":
+        return cls([], [], [], [], [], [], [], presorted=True)
+
+    @classmethod
+    def from_feed(cls, feed: gtfs_realtime_pb2.FeedMessage, routes=None) -> "VehicleSnapshot":
+        """Decode the vehicle entities of a vehicle positions feed in one pass.
+
+        Args:
+            feed: A parsed vehicle positions FeedMessage
+            routes: Route ids to decode the vehicles of, None for every vehicle. Each
+                entity's route is read first, and the rest only if it matches
+        """
+        count = len(feed.entity)
+        vehicle_ids, trip_ids, route_ids = [], [], []
+        latitude = np.empty(count)
+        longitude = np.empty(count)
+        speed = np.full(count, np.nan)
+        timestamp = np.empty(count, dtype=np.int64)
+        bearing = np.full(count, np.nan)
+        direction_id = np.full(count, -1, dtype=np.int8)
+        row = 0
         for entity in feed.entity:
+            if not entity.HasField("vehicle"):
+                continue
             vehicle = entity.vehicle
-            timestamp = datetime.fromtimestamp(vehicle.timestamp)
-            vehicle_data = {
-                "vehicle_id": vehicle.vehicle.id,
-                "trip_id": vehicle.trip.trip_id,
-                "route_id": vehicle.trip.route_id,
-                "latitude": vehicle.position.latitude,
-                "longitude": vehicle.position.longitude,
-                "speed": (vehicle.position.speed if vehicle.position.HasField("speed") else "N/A"),
-                "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-            }
-            vehicles.append(vehicle_data)
-        return vehicles
-    except requests.RequestException:
-        return []
+            trip = vehicle.trip
+            route_id = trip.route_id
+            if routes is not None and route_id not in routes:
+                continue
+            position = vehicle.position
+            vehicle_ids.append(intern(vehicle.vehicle.id))
+            trip_ids.append(trip.trip_id)
+            route_ids.append(intern(route_id))
+            latitude[row] = position.latitude
+            longitude[row] = position.longitude
+            if position.HasField("speed"):
+                speed[row] = position.speed
+            if position.HasField("bearing"):
+                bearing[row] = position.bearing
+            if trip.HasField("direction_id"):
+                direction_id[row] = trip.direction_id
+            timestamp[row] = vehicle.timestamp
+            row += 1
+        return cls(
+            vehicle_ids,
+            trip_ids,
+            route_ids,
+            latitude[:row],
+            longitude[:row],
+            speed[:row],
+            timestamp[:row],
+            bearing=bearing[:row],
+            direction_id=direction_id[:row],
+        )
+
+    def to_dict(self) -> Dict:
+        """Return the columns as plain lists, with None for NaN, ready for JSON"""
+
+        def floats(column):
+            return [None if value != value else value for value in column.tolist()]
+
+        return {
+            "vehicle_ids": self.vehicle_ids,
+            "trip_ids": self.trip_ids,
+            "route_ids": self.route_ids,
+            "latitude": floats(self.latitude),
+            "longitude": floats(self.longitude),
+            "speed": floats(self.speed),
+            "timestamp": self.timestamp.tolist(),
+            "bearing": floats(self.bearing),
+            "direction_id": self.direction_id.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, columns: Dict) -> "VehicleSnapshot":
+        """Rebuild a snapshot from `to_dict` output, whose rows are already grouped by route"""
+        # float64 arrays turn None back into NaN
+        return cls(
+            columns["vehicle_ids"],
+            columns["trip_ids"],
+            columns["route_ids"],
+            np.array(columns["latitude"], dtype=np.float64),
+            np.array(columns["longitude"], dtype=np.float64),
+            np.array(columns["speed"], dtype=np.float64),
+            columns["timestamp"],
+            presorted=True,
+            bearing=np.array(columns["bearing"], dtype=np.float64),
+            direction_id=columns["direction_id"],
+        )
+
+    def __len__(self):
+        return len(self.route_ids)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def route(self, route_id: str) -> "VehicleSnapshot":
+        """Return the vehicles of one route, sharing this snapshot's arrays"""
+        return self.routes((route_id,))
+
+    def routes(self, route_ids) -> "VehicleSnapshot":
+        """Return the vehicles of any of several routes, sharing this snapshot's arrays if there's one"""
+        slices = [self.route_slices[route_id] for route_id in sorted(set(route_ids)) if route_id in self.route_slices]
+        if not slices:
+            return VehicleSnapshot.empty()
+        if len(slices) == 1:
+            rows = slices[0]
+            vehicle_ids, trip_ids, route_ids = self.vehicle_ids[rows], self.trip_ids[rows], self.route_ids[rows]
+        else:
+            # Routes are taken in sorted order, so each one stays a contiguous run of rows
+            rows = np.concatenate([np.arange(rows.start, rows.stop) for rows in slices])
+            positions = rows.tolist()
+            vehicle_ids = [self.vehicle_ids[i] for i in positions]
+            trip_ids = [self.trip_ids[i] for i in positions]
+            route_ids = [self.route_ids[i] for i in positions]
+        return VehicleSnapshot(
+            vehicle_ids,
+            trip_ids,
+            route_ids,
+            self.latitude[rows],
+            self.longitude[rows],
+            self.speed[rows],
+            self.timestamp[rows],
+            presorted=True,
+            bearing=self.bearing[rows],
+            direction_id=self.direction_id[rows],
+        )
+
+    def row(self, i: int) -> Dict:
+        """Format one row the way the tables display it"""
+        speed = self.speed[i]
+        return {
+            "vehicle_id": self.vehicle_ids[i],
+            "trip_id": self.trip_ids[i],
+            "route_id": self.route_ids[i],
+            "latitude": float(self.latitude[i]),
+            "longitude": float(self.longitude[i]),
+            "speed": "N/A" if np.isnan(speed) else float(speed),
+            "timestamp": datetime.fromtimestamp(int(self.timestamp[i])).strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+
+def fetch_vehicle_positions(routes=None, versioned: bool = False) -> VehicleSnapshot:
+    """Fetch and parse vehicle position data from Metro Transit.
+
+    Args:
+        routes: Route ids to decode the vehicles of, e.g. {'901', '902'}, None for every
+            vehicle. Every set of routes is decoded from the same parse of the feed
+        versioned: Return (vehicles, feed version), and raise if the fetch fails rather
+            than returning no vehicles
+    """
+    try:
+        if routes is None:
+            name, build = "vehicles", VehicleSnapshot.from_feed
+        else:
+            routes = frozenset(routes)
+            name, build = f"vehicles on {','.join(sorted(routes))}", partial(_decode_route_vehicles, routes)
+        vehicles, version = feed_cache.derive_versioned(VEHICLE_POSITIONS_URL, name, build)
     except Exception:
-        return []
+        if versioned:
+            raise
+        return VehicleSnapshot.empty()
+    return (vehicles, version) if versioned else vehicles
+
+
+def _decode_route_vehicles(routes, feed) -> VehicleSnapshot:
+    # Slicing is cheaper than decoding again if every vehicle of this feed already was, for the table
+    every_vehicle = feed_cache.derived(VEHICLE_POSITIONS_URL, "vehicles", feed)
+    if every_vehicle is not None:
+        return every_vehicle.routes(routes)
+    return VehicleSnapshot.from_feed(feed, routes)
 
 
 def get_station_coordinates(line_type: str):
-    """Get station data for a specific line type.
+    """Get station data for a registered line.
 
     Args:
-        line_type: Either 'blue' or 'green'
+        line_type: Key of the line, e.g. 'blue' or 'green'
 
     Returns:
         List of station dictionaries with name, latitude, and longitude
     """
-    if line_type.lower() == "blue":
-        return BLUE_LINE_STATIONS
-    elif line_type.lower() == "green":
-        return GREEN_LINE_STATIONS
-    else:
-        raise ValueError("line_type must be either 'blue' or 'green'")
+    return get_line(line_type).stations
 
 
 def get_coordinates_list(line_type: str):
     """Get a list of (latitude, longitude) tuples for a line.
 
     Args:
-        line_type: Either 'blue' or 'green'
+        line_type: Key of the line, e.g. 'blue' or 'green'
 
     Returns:
         List of (latitude, longitude) tuples
     """
-    stations = get_station_coordinates(line_type)
-    return [(station["latitude"], station["longitude"]) for station in stations]
+    return get_line(line_type).coordinates
+
 
+def get_line_map(line_type: str, vehicles=None):
+    """Return a list of (stop_name, is_train_present) for a registered line.
 
-def get_blue_line_map(direction_id=0):
+    Pass already fetched `vehicles` to avoid fetching the vehicle positions again.
+    """
+    line = get_line(line_type)
+    if vehicles is None:
+        vehicles = fetch_vehicle_positions(line.route_ids)
+    # Find closest stop for each train
+    train_stop_indices = set(line.index.snap_vehicles(line.vehicles(vehicles)).index.tolist())
+    return [(name, idx in train_stop_indices) for idx, name in enumerate(line.names)]
+
+
+def get_blue_line_map(direction_id=0, vehicles=None):
     """
     Return a list of (stop_name, is_train_present) for the Blue Line as a simple line map,
         using a static list of stations and coordinates.
+    Pass already fetched `vehicles` to avoid fetching the vehicle positions again.
     """
-    stop_names = [station["name"] for station in BLUE_LINE_STATIONS]
-    stop_coords = [(station["latitude"], station["longitude"]) for station in BLUE_LINE_STATIONS]
+    return get_line_map("blue", vehicles)
 
-    route_id = "901"  # Blue Line
-    # Get vehicle positions for Blue Line
-    vehicles = fetch_vehicle_positions()
-    blue_line_vehicles = [v for v in vehicles if v["route_id"] == route_id]
-    # Find closest stop for each train
-    train_stop_indices = set()
-    for vehicle in blue_line_vehicles:
-        min_dist = float("inf")
-        closest_idx = None
-        for i, (lat, lon) in enumerate(stop_coords):
-            if lat is None or lon is None:
-                continue
-            dlat = lat - vehicle["latitude"]
-            dlon = lon - vehicle["longitude"]
-            dist = dlat * dlat + dlon * dlon
-            if dist < min_dist:
-                min_dist = dist
-                closest_idx = i
-        if closest_idx is not None:
-            train_stop_indices.add(closest_idx)
-    # Build map: list of (stop_name, is_train_present)
-    line_map = [(name, idx in train_stop_indices) for idx, name in enumerate(stop_names)]
-    return line_map
-
-
-def get_green_line_map(direction_id=0):
+
+def get_green_line_map(direction_id=0, vehicles=None):
     """
     Return a list of (stop_name, is_train_present) for the Green Line as a simple line map,
         using a static list of stations and coordinates.
+    Pass already fetched `vehicles` to avoid fetching the vehicle positions again.
     """
-    route_id = "902"  # Green Line
-    stop_names = [station["name"] for station in GREEN_LINE_STATIONS]
-    stop_coords = [(station["latitude"], station["longitude"]) for station in GREEN_LINE_STATIONS]
-
-    vehicles = fetch_vehicle_positions()
-    green_line_vehicles = [v for v in vehicles if v["route_id"] == route_id]
-    train_stop_indices = set()
-    for vehicle in green_line_vehicles:
-        min_dist = float("inf")
-        closest_idx = None
-        for i, (lat, lon) in enumerate(stop_coords):
-            if lat is None or lon is None:
-                continue
-            dlat = lat - vehicle["latitude"]
-            dlon = lon - vehicle["longitude"]
-            dist = dlat * dlat + dlon * dlon
-            if dist < min_dist:
-                min_dist = dist
-                closest_idx = i
-        if closest_idx is not None:
-            train_stop_indices.add(closest_idx)
-
-    # Determine direction for each train (eastbound/westbound) by comparing longitude
-    # Attach direction info for downstream use (e.g., GreenLineMapTab)
-    # We'll return a list of (stop_name, is_train_present, direction) for clarity
-    # But for now, preserve the original return signature
-    return [(stop_names[i], i in train_stop_indices) for i in range(len(stop_names))]
+    return get_line_map("green", vehicles)
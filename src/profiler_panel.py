@@ -0,0 +1,49 @@
+from textual.widgets import Static
+
+from .instrumentation import recorder
+
+
+class ProfilerPanel(Static):
+    """Per-stage timings and feed counters from the instrumentation recorder.
+
+    Hidden until toggled, and only redrawn by the poller's shared clock while shown.
+    """
+
+    DEFAULT_CSS = """
+    ProfilerPanel {
+        display: none;
+        dock: bottom;
+        height: auto;
+        max-height: 50%;
+        border-top: solid $accent;
+        padding: 0 1;
+    }
+    """
+
+    def toggle(self):
+        self.display = not self.display
+        if self.display:
+            self.update_message()
+            self.app.feed_poller.subscribe_clock(self)
+        else:
+            self.app.feed_poller.unsubscribe_clock(self)
+
+    def on_unmount(self):
+        self.app.feed_poller.unsubscribe_clock(self)
+
+    def update_message(self):
+        self.update(self.render_summary())
+
+    def render_summary(self):
+        lines = [f"[b]{'Stage':<8} {'Detail':<28} {'Count':>6} {'Last ms':>9} {'Mean ms':>9} {'Max ms':>9}[/b]"]
+        for (name, detail), (count, total, longest, last) in sorted(recorder.summary().items()):
+            lines.append(
+                f"{name:<8} {detail:<28.28} {count:>6} {last * 1000:>9.2f} {total / count * 1000:>9.2f} "
+                f"{longest * 1000:>9.2f}"
+            )
+        if len(lines) == 1:
+            lines.append("No spans recorded yet")
+        counters = "  ".join(f"{name}: {value:,}" for name, value in sorted(recorder.counters.items()))
+        if counters:
+            lines.append(counters)
+        return "\n".join(lines)
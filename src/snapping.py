@@ -0,0 +1,183 @@
+"""Vectorized snapping and linear referencing of vehicle positions along a line"""
+
+from math import cos, radians
+from typing import NamedTuple
+
+import numpy as np
+
+from .instrumentation import recorder
+from .line_registry import get_line
+
+EARTH_RADIUS_M = 6371008.8
+BEARING_TOLERANCE = 0.5  # cos(60°), bearings closer than this to square with the track are ignored
+
+
+class SnapResult(NamedTuple):
+    """Per-vehicle snapping results, one array element per input position"""
+
+    index: np.ndarray  # Nearest station, or -1 for positions without coordinates
+    distance: np.ndarray  # Metres from the nearest station
+    segment: np.ndarray  # Track segment (station i to i + 1) closest to the position
+    fraction: np.ndarray  # How far along that segment the position projects, from 0 to 1
+
+
+class StationIndex:
+    """Station coordinates of one line in a contiguous array, projected to local metres.
+
+    The stations also form the line's polyline, with the cumulative distance along
+    it (the chainage) precomputed at every station for linear referencing.
+
+    A line without stations, such as a route whose stops the metadata store has
+    nothing for, snaps nothing: every position comes back unmatched.
+
+    Args:
+        stations: Station dictionaries with name, latitude and longitude, in line order
+    """
+
+    def __init__(self, stations):
+        self.names = [station["name"] for station in stations]
+        latlon = np.array([(station["latitude"], station["longitude"]) for station in stations], dtype=np.float64)
+        latlon = latlon.reshape(-1, 2)
+        self.ref_lat = float(latlon[:, 0].mean()) if len(latlon) else 0.0
+        self.ref_lon = float(latlon[:, 1].mean()) if len(latlon) else 0.0
+        self._x_scale = radians(1) * EARTH_RADIUS_M * cos(radians(self.ref_lat))
+        self._y_scale = radians(1) * EARTH_RADIUS_M
+        self.points = self.project(latlon[:, 0], latlon[:, 1])
+        self.segments = np.ascontiguousarray(np.diff(self.points, axis=0))
+        self.segment_lengths_sq = np.einsum("ij,ij->i", self.segments, self.segments)
+        self.segment_lengths = np.sqrt(self.segment_lengths_sq)
+        # Metres from the first station
+        self.chainages = np.concatenate(([0.0], np.cumsum(self.segment_lengths))) if len(latlon) else np.empty(0)
+
+    def __len__(self):
+        return len(self.names)
+
+    def project(self, lats, lons) -> np.ndarray:
+        """Project latitudes and longitudes to an (n, 2) array of x/y metres around the line.
+
+        An equirectangular projection is accurate to well under a metre over a metro area.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        points = np.empty((lats.shape[0], 2), dtype=np.float64)
+        points[:, 0] = (lons - self.ref_lon) * self._x_scale
+        points[:, 1] = (lats - self.ref_lat) * self._y_scale
+        return points
+
+    def snap(self, lats, lons) -> SnapResult:
+        """Snap a batch of positions to the line in one vectorized call.
+
+        Args:
+            lats: Sequence or array of latitudes
+            lons: Sequence or array of longitudes
+
+        Returns:
+            A SnapResult of arrays with one element per position
+        """
+        positions = self.project(lats, lons)
+        count = positions.shape[0]
+        if not len(self.points):
+            unmatched = np.full(count, -1, dtype=np.intp)
+            return SnapResult(unmatched, np.full(count, np.nan), unmatched.copy(), np.full(count, np.nan))
+        rows = np.arange(count)
+        valid = np.isfinite(positions).all(axis=1)
+        positions[~valid] = 0
+
+        offsets = positions[:, None, :] - self.points[None, :, :]
+        station_dist_sq = np.einsum("mnk,mnk->mn", offsets, offsets)
+        index = station_dist_sq.argmin(axis=1) if count else np.empty(0, dtype=np.intp)
+        distance = np.sqrt(station_dist_sq[rows, index]) if count else np.empty(0)
+
+        if len(self.segments):
+            # offsets[:, :-1] is the vector from the start of every segment to each position
+            lengths_sq = np.where(self.segment_lengths_sq > 0, self.segment_lengths_sq, 1)
+            t = np.einsum("mnk,nk->mn", offsets[:, :-1], self.segments) / lengths_sq
+            np.clip(t, 0, 1, out=t)
+            gaps = offsets[:, :-1] - t[:, :, None] * self.segments
+            segment = np.einsum("mnk,mnk->mn", gaps, gaps).argmin(axis=1)
+            fraction = t[rows, segment]
+        else:
+            segment = np.zeros(count, dtype=np.intp)
+            fraction = np.zeros(count)
+
+        index[~valid] = -1
+        distance[~valid] = np.nan
+        segment[~valid] = -1
+        fraction[~valid] = np.nan
+        return SnapResult(index, distance, segment, fraction)
+
+    def chainage(self, snapped: SnapResult) -> np.ndarray:
+        """Turn snapping results into chainages, the distance in metres along the line from its first station"""
+        if not len(self.segments):
+            return np.where(snapped.segment >= 0, 0.0, np.nan)
+        segment = np.where(snapped.segment >= 0, snapped.segment, 0)
+        return np.where(
+            snapped.segment >= 0,
+            self.chainages[segment] + snapped.fraction * self.segment_lengths[segment],
+            np.nan,
+        )
+
+    def locate(self, lats, lons) -> np.ndarray:
+        """Project a batch of positions onto the line and return their chainages in metres"""
+        return self.chainage(self.snap(lats, lons))
+
+    def station_position(self, chainages) -> np.ndarray:
+        """Convert chainages to fractional station indexes.
+
+        A position of 2.25 is a quarter of the way from station 2 to station 3. Each
+        chainage is placed with a binary search over the cumulative station distances.
+
+        Args:
+            chainages: Sequence or array of chainages in metres
+
+        Returns:
+            Array of fractional station indexes, NaN where the chainage is NaN
+        """
+        chainages = np.asarray(chainages, dtype=np.float64)
+        if not len(self.segments):
+            return np.where(np.isnan(chainages), np.nan, 0.0)
+        segment = np.searchsorted(self.chainages, chainages, side="right") - 1
+        np.clip(segment, 0, len(self.segments) - 1, out=segment)
+        lengths = np.where(self.segment_lengths[segment] > 0, self.segment_lengths[segment], 1)
+        fraction = np.clip((chainages - self.chainages[segment]) / lengths, 0, 1)
+        return segment + fraction
+
+    def bearing_headings(self, snapped: SnapResult, bearings) -> np.ndarray:
+        """Compare reported compass bearings with the direction of the track each vehicle snapped to.
+
+        Args:
+            snapped: Snapping results of the vehicles
+            bearings: Degrees clockwise from north per vehicle, NaN when not reported
+
+        Returns:
+            int8 array of 1 for travel away from the first station, -1 towards it, and 0
+            where the bearing is missing or too close to square with the track to tell
+        """
+        bearings = np.radians(np.asarray(bearings, dtype=np.float64))
+        headings = np.zeros(len(bearings), dtype=np.int8)
+        if not len(self.segments):
+            return headings
+        segment = np.where(snapped.segment >= 0, snapped.segment, 0)
+        track = self.segments[segment] / np.where(self.segment_lengths > 0, self.segment_lengths, 1)[segment, None]
+        # x is east and y is north, so a bearing's unit vector is (sin, cos)
+        alignment = np.sin(bearings) * track[:, 0] + np.cos(bearings) * track[:, 1]
+        known = (snapped.segment >= 0) & (np.abs(alignment) >= BEARING_TOLERANCE)
+        headings[known] = np.where(alignment[known] > 0, 1, -1)
+        return headings
+
+    def snap_vehicles(self, vehicles) -> SnapResult:
+        """Snap the rows of a VehicleSnapshot as returned by `fetch_vehicle_positions`"""
+        with recorder.span("snap", vehicles=len(vehicles)):
+            return self.snap(vehicles.latitude, vehicles.longitude)
+
+
+def station_index(line_type: str) -> StationIndex:
+    """Get the shared StationIndex for a registered line.
+
+    Args:
+        line_type: Key of the line, e.g. 'blue' or 'green'
+
+    Raises:
+        ValueError: If no line has that key
+    """
+    return get_line(line_type).index
@@ -0,0 +1,272 @@
+"""Versioned feed snapshots served by the headless daemon, and the client that reads them.
+
+The daemon polls every feed once, decodes it into table rows and keeps each feed's
+latest rows encoded as JSON. Serving a client is then a socket write of bytes that
+already exist, so upstream fetches and protobuf parsing don't grow with the number
+of terminals running the app. A client that already has the latest version of a
+feed gets an empty 304 response.
+"""
+
+import json
+import threading
+import time
+from functools import partial
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple
+
+from .feed_poller import FeedSource
+from .instrumentation import recorder
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+def encode_feed(feed: str, data) -> bytes:
+    """Encode a feed's decoded rows as JSON"""
+    if feed in ("vehicle_positions", "line_vehicles", "stop_arrivals"):
+        rows = data.to_dict()
+    elif feed == "trip_updates":
+        rows = list(data)  # Formats every row once, here rather than in every client
+    else:
+        rows = data
+    return json.dumps(rows, separators=(",", ":")).encode()
+
+
+def decode_feed(feed: str, rows):
+    """Turn JSON rows back into what the feed's fetcher returns.
+
+    Trip updates come back as a list of row dictionaries rather than a TripUpdatesView.
+    """
+    if feed in ("vehicle_positions", "line_vehicles"):
+        from .metro_api import VehicleSnapshot
+
+        return VehicleSnapshot.from_dict(rows)
+    if feed == "stop_arrivals":
+        from .stop_arrivals import StopArrivals
+
+        return StopArrivals.from_dict(rows)
+    return rows
+
+
+def feed_error(feed: str, error: Exception):
+    """What a feed shows when the daemon can't be reached and nothing was fetched before"""
+    if feed == "alerts":
+        return [{"error": f"Error fetching alerts: {error}"}]
+    if feed == "routes":
+        return [{"route_id": "ERROR", "route_label": str(error)}]
+    if feed in ("vehicle_positions", "line_vehicles"):
+        from .metro_api import VehicleSnapshot
+
+        return VehicleSnapshot.empty()
+    if feed == "stop_arrivals":
+        from .stop_arrivals import StopArrivals
+
+        return StopArrivals.empty()
+    return []
+
+
+class Snapshot(NamedTuple):
+    """The latest encoded rows of a feed"""
+
+    version: int  # Goes up by one every time the encoded rows change
+    published_at: float  # POSIX time the rows were published
+    payload: bytes  # JSON encoded rows
+
+
+class SnapshotStore:
+    """Latest snapshot of every feed, shared by the publisher and the server threads"""
+
+    def __init__(self):
+        self._snapshots = {}  # {feed: Snapshot}
+        # Versions restart at 1 with every store, so ETags carry when the store was created
+        self.epoch = f"{time.time_ns():x}"
+        self._lock = threading.Lock()
+
+    def publish(self, feed: str, payload: bytes) -> bool:
+        """Store a feed's encoded rows, returning False if they're the same as the last ones"""
+        with self._lock:
+            previous = self._snapshots.get(feed)
+            if previous is not None and previous.payload == payload:
+                return False
+            version = previous.version + 1 if previous is not None else 1
+            self._snapshots[feed] = Snapshot(version, time.time(), payload)
+        recorder.count(f"{feed} snapshot bytes", len(payload))
+        return True
+
+    def get(self, feed: str) -> Snapshot | None:
+        with self._lock:
+            return self._snapshots.get(feed)
+
+    def index(self) -> dict:
+        """{feed: {'version': ..., 'published_at': ...}} for every published feed"""
+        with self._lock:
+            return {
+                feed: {"version": snapshot.version, "published_at": snapshot.published_at}
+                for feed, snapshot in self._snapshots.items()
+            }
+
+
+class SnapshotPublisher:
+    """Polls every feed source on its own thread and publishes its rows to a store.
+
+    Each feed backs off the way FeedPoller does: its interval doubles, up to the
+    source's max_interval, every time a poll returns the same rows or fails. A failed
+    poll leaves the last published rows in place and counts towards the feed's
+    '<feed> poll errors' counter.
+
+    Args:
+        store: SnapshotStore the rows are published to
+        sources: FeedSource of every feed to poll
+    """
+
+    def __init__(self, store: SnapshotStore, sources):
+        self.store = store
+        self.sources = list(sources)
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for source in self.sources:
+            thread = threading.Thread(target=self._run, args=(source,), name=f"publish_{source.name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float | None = None):
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads.clear()
+
+    def poll(self, source: FeedSource, last_version: int | None = None):
+        """Fetch a feed once and publish it.
+
+        Returns:
+            (True if the published rows changed, version of the fetched feed)
+        """
+        with recorder.span("publish", feed=source.name):
+            data, version = source.fetch_versioned()
+            # An unchanged feed cache version means the rows are the same, so skip encoding them
+            if version and version == last_version:
+                return False, version
+            return self.store.publish(source.name, encode_feed(source.name, data)), version
+
+    def _run(self, source: FeedSource):
+        interval = source.interval
+        version = None
+        errors = 0
+        while not self._stopping.is_set():
+            try:
+                changed, version = self.poll(source, version)
+            except Exception:
+                # Raising would end the thread, and the feed would never be polled again
+                changed = False
+                errors += 1
+                recorder.count(f"{source.name} poll errors", errors)
+            interval = source.interval if changed else min(interval * 2, source.max_interval)
+            self._stopping.wait(interval)
+
+
+class SnapshotRequestHandler(BaseHTTPRequestHandler):
+    """Serves `GET /feeds`, the version of every feed, and `GET /feeds/<feed>`, its rows.
+
+    A feed's ETag is its version prefixed with the store's epoch, so a client sending
+    it back as If-None-Match gets a 304 until the feed changes, and never gets one
+    from a restarted daemon whose versions count up from 1 again.
+    """
+
+    server: "SnapshotServer"
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path == "/feeds":
+            self._send(HTTPStatus.OK, json.dumps(self.server.store.index()).encode())
+            return
+        feed = path.removeprefix("/feeds/")
+        snapshot = self.server.store.get(feed) if feed != path else None
+        if snapshot is None:
+            self._send(HTTPStatus.NOT_FOUND, b'{"error":"unknown feed"}')
+            return
+        etag = f'"{self.server.store.epoch}-{snapshot.version}"'
+        if self.headers.get("If-None-Match") == etag:
+            self._send(HTTPStatus.NOT_MODIFIED, b"", etag)
+        else:
+            self._send(HTTPStatus.OK, snapshot.payload, etag)
+
+    def _send(self, status: HTTPStatus, body: bytes, etag: str | None = None):
+        self.send_response(status)
+        if etag is not None:
+            self.send_header("ETag", etag)
+        if status != HTTPStatus.NOT_MODIFIED:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Every client polls every few seconds, logging each request would drown the terminal
+
+
+class SnapshotServer(ThreadingHTTPServer):
+    """HTTP server for the snapshots in a store, one thread per connection"""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], store: SnapshotStore):
+        super().__init__(address, SnapshotRequestHandler)
+        self.store = store
+
+
+class SnapshotClient:
+    """Fetches feed snapshots from a daemon with conditional GETs through the shared transport.
+
+    Args:
+        base_url: The daemon's address, e.g. 'http://127.0.0.1:8765'
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self._snapshots = {}  # {feed: (ETag, version, decoded rows)}
+
+    def fetch(self, feed: str):
+        """Return a feed's latest rows, decoding them only when the daemon has a new version.
+
+        If the daemon can't be reached the last rows are kept, or error rows are returned.
+        """
+        from .transport import get_transport
+
+        etag, version, data = self._snapshots.get(feed, (None, 0, None))
+        headers = {"If-None-Match": etag} if etag is not None else None
+        try:
+            response = get_transport().get(f"{self.base_url}/feeds/{feed}", headers=headers)
+            if response.status_code == HTTPStatus.NOT_MODIFIED:
+                return data
+            response.raise_for_status()
+            etag = response.headers.get("ETag")
+            data = decode_feed(feed, response.json())
+        except Exception as e:
+            return data if data is not None else feed_error(feed, e)
+        self._snapshots[feed] = (etag, version + 1, data)
+        return data
+
+    def version(self, feed: str) -> int:
+        """Version of the rows the last `fetch` of a feed returned, 0 before the first one.
+
+        Counted by the client, one up for every new set of rows the daemon sends, as
+        the daemon's own versions start over when it restarts.
+        """
+        return self._snapshots.get(feed, (None, 0, None))[1]
+
+    def sources(self, sources) -> list[FeedSource]:
+        """Feed sources with the same names and intervals that fetch from the daemon instead"""
+        return [
+            FeedSource(
+                source.name,
+                partial(self.fetch, source.name),
+                interval=source.interval,
+                max_interval=source.max_interval,
+                version=partial(self.version, source.name),
+            )
+            for source in sources
+        ]
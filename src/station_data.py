@@ -210,3 +210,29 @@ GREEN_LINE_STATIONS = [
         "longitude": -93.08681430434538,
     },
 ]
+
+# Lines the map tabs draw. Stations are listed in line order and travel away from the
+# first one is `forward`. `directions` maps GTFS trip direction_ids to direction names
+# as Metro Transit publishes them. Adding a line here adds a map tab for it.
+LINES = [
+    {
+        "key": "blue",
+        "name": "Blue Line",
+        "route_ids": ["901"],
+        "color": "blue",
+        "stations": BLUE_LINE_STATIONS,
+        "directions": {0: "northbound", 1: "southbound"},
+        "forward": "southbound",
+        "backward": "northbound",
+    },
+    {
+        "key": "green",
+        "name": "Green Line",
+        "route_ids": ["902"],
+        "color": "green",
+        "stations": GREEN_LINE_STATIONS,
+        "directions": {0: "eastbound", 1: "westbound"},
+        "forward": "eastbound",
+        "backward": "westbound",
+    },
+]
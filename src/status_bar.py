@@ -8,16 +8,13 @@ class StatusBar(Static):
         super().__init__(*args, **kwargs)
         self.last_refresh_time = None
         self._legend = self._make_legend()
-        self._timer = None
 
     def on_mount(self):
-        # Update every second
-        self._timer = self.set_interval(1, self.update_message)
+        # Update every second from the poller's shared clock
+        self.app.feed_poller.subscribe_clock(self)
 
     def on_unmount(self):
-        if self._timer:
-            self._timer.stop()
-            self._timer = None
+        self.app.feed_poller.unsubscribe_clock(self)
 
     def update_refresh_time(self, dt: datetime):
         self.last_refresh_time = dt
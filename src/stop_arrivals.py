@@ -0,0 +1,156 @@
+"""Predicted arrivals at every stop of the trip updates feed, looked up by stop id.
+
+Every stop_time_update of every trip is read in one pass into flat columns, which
+are then grouped by stop and sorted by time. A stop's arrivals are one contiguous
+slice found with a binary search over the sorted stop ids, and the ones after a
+given time with a second binary search inside that slice.
+"""
+
+from typing import Dict, List, NamedTuple
+
+import numpy as np
+
+from .instrumentation import recorder
+
+
+class Arrival(NamedTuple):
+    """One predicted arrival of a trip at a stop"""
+
+    stop_id: str
+    route_id: str
+    trip_id: str
+    time: int  # POSIX time of the arrival, or of the departure if only that is predicted
+    delay: float  # Seconds behind schedule, NaN if the feed doesn't say
+
+
+class StopArrivals:
+    """Arrivals of one trip updates snapshot, grouped by stop and sorted by time within each stop.
+
+    Trips are stored once, and each arrival refers to its trip by row, so the size
+    is a few numbers per prediction rather than a dictionary.
+
+    Args:
+        trip_ids: Trip id of every trip
+        route_ids: Route id of every trip
+        stop_ids: Stop id of every arrival
+        trips: Row in `trip_ids` of every arrival
+        times: POSIX time of every arrival
+        delays: Delay of every arrival in seconds, NaN where unknown
+        timestamp: POSIX time the feed was published, 0 if unknown
+    """
+
+    def __init__(self, trip_ids, route_ids, stop_ids, trips, times, delays, timestamp: int = 0):
+        self.trip_ids = list(trip_ids)
+        self.route_ids = list(route_ids)
+        self.timestamp = timestamp
+        stop_ids = np.asarray(stop_ids, dtype=str)
+        times = np.asarray(times, dtype=np.int64)
+        # The distinct stops sorted, and each arrival's position among them
+        self.stops, codes = np.unique(stop_ids, return_inverse=True)
+        order = np.lexsort((times, codes))
+        self.times = times[order]
+        self.trips = np.asarray(trips, dtype=np.int32)[order]
+        self.delays = np.asarray(delays, dtype=np.float64)[order]
+        # Arrivals at stop i are rows starts[i] to starts[i + 1]
+        self.starts = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=len(self.stops)))))
+
+    @classmethod
+    def empty(cls) -> "StopArrivals":
+        return cls([], [], [], [], [], [])
+
+    @classmethod
+    def from_feed(cls, feed) -> "StopArrivals":
+        """Read every prediction of a parsed trip updates FeedMessage.
+
+        Stops the trip skips, and stops with neither an arrival nor a departure time,
+        have no arrival.
+        """
+        trip_ids, route_ids = [], []
+        stop_ids, trips, times, delays = [], [], [], []
+        skipped = 1  # StopTimeUpdate.SKIPPED
+        for entity in feed.entity:
+            if not entity.HasField("trip_update"):
+                continue
+            trip_update = entity.trip_update
+            trip = len(trip_ids)
+            trip_ids.append(trip_update.trip.trip_id)
+            route_ids.append(trip_update.trip.route_id)
+            for stop_time in trip_update.stop_time_update:
+                event = stop_time.arrival
+                if not event.time:
+                    event = stop_time.departure
+                    if not event.time:
+                        continue
+                if stop_time.schedule_relationship == skipped:
+                    continue
+                stop_ids.append(stop_time.stop_id)
+                trips.append(trip)
+                times.append(event.time)
+                delays.append(event.delay if event.HasField("delay") else np.nan)
+        recorder.count("stop arrivals", len(times))
+        return cls(trip_ids, route_ids, stop_ids, trips, times, delays, feed.header.timestamp)
+
+    def to_dict(self) -> Dict:
+        """JSON serializable columns, which `from_dict` turns back into a StopArrivals"""
+        counts = np.diff(self.starts)
+        return {
+            "trip_ids": self.trip_ids,
+            "route_ids": self.route_ids,
+            "stop_ids": np.repeat(self.stops, counts).tolist(),
+            "trips": self.trips.tolist(),
+            "times": self.times.tolist(),
+            "delays": [None if np.isnan(delay) else delay for delay in self.delays.tolist()],
+            "timestamp": self.timestamp,
+        }
+
+    @classmethod
+    def from_dict(cls, columns: Dict) -> "StopArrivals":
+        delays = [np.nan if delay is None else delay for delay in columns["delays"]]
+        return cls(
+            columns["trip_ids"],
+            columns["route_ids"],
+            columns["stop_ids"],
+            columns["trips"],
+            columns["times"],
+            delays,
+            columns["timestamp"],
+        )
+
+    def __len__(self):
+        return len(self.times)
+
+    def _rows(self, stop_id: str, after: float | None):
+        """Rows of a stop's arrivals, from the first one at or after `after`"""
+        i = int(np.searchsorted(self.stops, stop_id))
+        if i == len(self.stops) or self.stops[i] != stop_id:
+            return 0, 0
+        start, end = int(self.starts[i]), int(self.starts[i + 1])
+        if after is not None:
+            start += int(np.searchsorted(self.times[start:end], after))
+        return start, end
+
+    def arrivals(self, stop_ids, after: float | None = None, limit: int | None = None) -> List[Arrival]:
+        """The next arrivals at any of some stops, e.g. the platforms of a station, soonest first.
+
+        Args:
+            stop_ids: Stop ids to look up, unknown ones have no arrivals
+            after: Only arrivals at or after this POSIX time
+            limit: Most arrivals to return
+        """
+        stop_ids = list(stop_ids)
+        slices = [self._rows(stop_id, after) for stop_id in stop_ids]
+        # Each stop's arrivals are sorted already, only the few stops of a station are merged
+        rows = [np.arange(start, end if limit is None else min(end, start + limit)) for start, end in slices]
+        stop_of_row = np.repeat(np.asarray(stop_ids, dtype=str), [len(r) for r in rows])
+        rows = np.concatenate(rows) if rows else np.arange(0)
+        order = np.argsort(self.times[rows], kind="stable")[:limit]
+        return [
+            Arrival(
+                str(stop_of_row[i]),
+                self.route_ids[self.trips[row]],
+                self.trip_ids[self.trips[row]],
+                int(self.times[row]),
+                float(self.delays[row]),
+            )
+            for i, row in zip(order.tolist(), rows[order].tolist())
+        ]
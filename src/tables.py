@@ -1,61 +1,384 @@
+import math
+from datetime import datetime
+from functools import partial
+from itertools import islice
+
+from textual.binding import Binding
 from textual.widgets import DataTable
 
+from .instrumentation import recorder
+
 
 class BaseTable(DataTable):
+    """DataTable whose rows are keyed, so each update only applies what changed.
+
+    `update_table` diffs the new rows against the ones on screen: new keys are
+    added, missing keys removed and only the cells that differ are updated. When
+    most rows are gone the table is rebuilt instead, as it is when rows moved, e.g.
+    in a sorted table. The columns, cursor and scroll position survive a refresh.
+    """
+
+    ROW_BATCH_SIZE = 200  # Rows applied per refresh, so the first rows paint before the rest are built
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._columns = None
+        self._column_keys = []
+        self._row_cells = {}  # {row key: cells currently shown}, in display order
+        self._pending_rows = None
+
     def update_table(self, columns, rows):
+        """Bring the table in line with `rows`, consuming them lazily one batch per refresh.
+
+        Args:
+            columns: Column labels
+            rows: Iterable of (key, cells) pairs, where key identifies the row across updates
+        """
+        columns = tuple(columns)
+        if columns != self._columns:
+            self.clear(columns=True)
+            self._columns = columns
+            self._column_keys = [self.add_column(label, key=label) for label in columns]
+            self._row_cells = {}
+        self._pending_rows = iter(rows)
+        self._apply_row_batch(self._pending_rows, {})
+
+    def _apply_row_batch(self, pending_rows, seen):
+        if pending_rows is not self._pending_rows:
+            return  # A newer update replaced these rows
+        with recorder.span("rows", widget=type(self).__name__):
+            batch = list(islice(pending_rows, self.ROW_BATCH_SIZE))
+            for key, cells in batch:
+                key = self._unique_key(key, seen)
+                seen[key] = None  # A dict rather than a set, to keep the feed's row order
+                shown = self._row_cells.get(key)
+                if shown is None:
+                    self.add_row(*cells, key=key)
+                elif shown != cells:
+                    for column_key, old, new in zip(self._column_keys, shown, cells):
+                        if old != new:
+                            self.update_cell(key, column_key, new)
+                self._row_cells[key] = cells
+        if len(batch) == self.ROW_BATCH_SIZE:
+            self.call_after_refresh(self._apply_row_batch, pending_rows, seen)
+            return
+        stale = [key for key in self._row_cells if key not in seen]
+        if len(stale) > len(seen) // 4:
+            self._rebuild(seen)
+        else:
+            for key in stale:
+                self.remove_row(key)
+                del self._row_cells[key]
+            if list(self._row_cells) != list(seen):
+                self._rebuild(seen)
+        self._pending_rows = None
+
+    def _rebuild(self, keys):
+        """Clear the table and add back the rows of `keys` in that order.
+
+        Cheaper than removing many rows one by one, and how moved rows are put back in
+        order, as DataTable can only reorder rows by sorting their cells.
+        """
+        cursor_row = self.cursor_row
+        scroll_x, scroll_y = self.scroll_x, self.scroll_y
+        rows = [(key, self._row_cells[key]) for key in keys]
         self.clear()
-        self.add_columns(*columns)
-        for row in rows:
-            self.add_row(*row)
+        self._row_cells = dict(rows)
+        for key, cells in rows:
+            self.add_row(*cells, key=key)
+        if rows:
+            self.move_cursor(row=min(cursor_row, len(rows) - 1), scroll=False)
+        # clear() scrolls to the top, scroll back once the rows are measured
+        self.call_after_refresh(self.scroll_to, scroll_x, scroll_y, animate=False)
+
+    @staticmethod
+    def _unique_key(key, seen):
+        # Feeds occasionally repeat an id, keep every row rather than overwriting the first
+        key = str(key)
+        if key not in seen:
+            return key
+        suffix = 2
+        while f"{key}#{suffix}" in seen:
+            suffix += 1
+        return f"{key}#{suffix}"
+
+
+class PagedTable(BaseTable):
+    """BaseTable showing one page of a large row source at a time.
+
+    The rows stay in the feed's snapshot, and only the current page's rows are
+    formatted and added to the table, so a refresh costs the same however large the
+    feed grows. Moving the cursor past either end of a page turns the page, as do
+    `[` and `]`. `filter_rows` pages through just the rows matching a query, looked
+    up in an index of the snapshot that's built on the first query after an update.
+
+    Clicking a column header, or `s` on a column, sorts by the column's typed values
+    rather than its text, then reverses the sort, then goes back to feed order.
+    """
+
+    PAGE_SIZE = 100  # Rows per page, below ROW_BATCH_SIZE so a page is applied in one go
+    BINDINGS = [
+        Binding("[", "previous_page", "Previous page"),
+        Binding("]", "next_page", "Next page"),
+        Binding("s", "sort_column", "Sort"),
+    ]
+    DEFAULT_CSS = """
+    PagedTable {
+        border-bottom: solid $panel;
+    }
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.page = 0
+        self._page_columns = ()
+        self._row_count = 0
+        self._row_at = None
+        self._build_index = None
+        self._index = None  # InvertedIndex of the current rows, built when first filtered
+        self._filter = ""
+        self._selection = None  # Rows matching the filter in feed order, None when unfiltered
+        self._sort_values = {}  # {column: callable returning the sort value of every row}
+        self._sort_column = None  # None for feed order
+        self._descending = False
+        self._order = None  # Ascending sort permutation of the current rows, None for feed order
+        self._missing = 0  # Rows at the end of the order without a sort value
+        self._visible = None  # Rows to show in display order, None for every row in feed order
+
+    @property
+    def shown_count(self) -> int:
+        """Number of rows across every page, after filtering"""
+        return self._row_count if self._visible is None else len(self._visible)
+
+    @property
+    def page_count(self) -> int:
+        return max(1, -(-self.shown_count // self.PAGE_SIZE))
+
+    def update_paged(self, columns, row_count: int, row_at, build_index=None, sort_values=None):
+        """Show the current page of a new row source, keeping the page if it still exists.
+
+        Args:
+            columns: Column labels
+            row_count: Number of rows in the source
+            row_at: Callable returning the (key, cells) pair of a row, only called for rows on the page
+            build_index: Callable returning an InvertedIndex of the rows, for filtering
+            sort_values: {column label: callable returning the typed sort value of every row}
+        """
+        self._page_columns = tuple(columns)
+        self._row_count = row_count
+        self._row_at = row_at
+        self._build_index = build_index
+        self._index = None
+        self._sort_values = sort_values or {}
+        # An active filter and sort are applied to the new rows, once for this update
+        self._selection = self._query(self._filter)
+        self._order = self._sort_permutation()
+        self._arrange_rows()
+        self.show_page(min(self.page, self.page_count - 1))
+
+    def filter_rows(self, text: str):
+        """Only show the rows matching a query, see `feed_index` for the syntax"""
+        self._filter = text
+        self._selection = self._query(text)
+        self._arrange_rows()
+        self.show_page(0)
+
+    def sort_by(self, column: str):
+        """Sort by a column, or reverse the sort if it's already sorted by it, or undo a reversed sort"""
+        if column not in self._sort_values:
+            self.app.bell()
+            return
+        if column != self._sort_column:
+            self._sort_column, self._descending = column, False
+        elif not self._descending:
+            self._descending = True
+        else:
+            self._sort_column, self._descending = None, False
+        self._order = self._sort_permutation()
+        self._arrange_rows()
+        self.show_page(0)
+        self.move_cursor(row=0)
+
+    def _sort_permutation(self):
+        if self._sort_column not in self._sort_values:
+            return None
+        from .feed_sort import sort_order
+
+        order, self._missing = sort_order(self._sort_values[self._sort_column]())
+        return order
+
+    def _arrange_rows(self):
+        from .feed_sort import visible_rows
+
+        self._visible = visible_rows(self._row_count, self._order, self._selection, self._descending, self._missing)
+
+    def _query(self, text: str):
+        if not text.strip() or self._build_index is None:
+            return None
+        if self._index is None:
+            self._index = self._build_index()
+        return self._index.query(text)
+
+    def show_page(self, page: int):
+        if page != self.page:
+            # Different rows altogether, so start from an empty table rather than diffing
+            self.clear()
+            self._row_cells = {}
+            self.page = page
+        start = page * self.PAGE_SIZE
+        end = min(start + self.PAGE_SIZE, self.shown_count)
+        rows = range(start, end) if self._visible is None else self._visible[start:end].tolist()
+        self.update_table(self._page_columns, (self._row_at(i) for i in rows))
+        first = start + 1 if end else 0
+        subtitle = f"Rows {first}-{end} of {self.shown_count}"
+        if self._selection is not None:
+            subtitle += f" matching, {self._row_count} in all"
+        subtitle += f", page {page + 1}/{self.page_count}"
+        if self._order is not None:
+            subtitle += f", by {self._sort_column} {'▼' if self._descending else '▲'}"
+        self.border_subtitle = subtitle
+
+    def action_sort_column(self):
+        if self._page_columns:
+            self.sort_by(self._page_columns[self.cursor_column])
+
+    def on_data_table_header_selected(self, event: DataTable.HeaderSelected):
+        event.stop()
+        self.sort_by(event.column_key.value)
+
+    def action_next_page(self):
+        if self.page < self.page_count - 1:
+            self.show_page(self.page + 1)
+            self.move_cursor(row=0)
+
+    def action_previous_page(self):
+        if self.page > 0:
+            self.show_page(self.page - 1)
+            self.move_cursor(row=self.row_count - 1)
+
+    def action_cursor_down(self):
+        if self.cursor_row >= self.row_count - 1 and self.page < self.page_count - 1:
+            self.action_next_page()
+        else:
+            super().action_cursor_down()
 
+    def action_cursor_up(self):
+        if self.cursor_row <= 0 and self.page > 0:
+            self.action_previous_page()
+        else:
+            super().action_cursor_up()
 
-class AlertsTable(BaseTable):
+    def action_page_down(self):
+        if self.cursor_row >= self.row_count - 1 and self.page < self.page_count - 1:
+            self.action_next_page()
+        else:
+            super().action_page_down()
+
+    def action_page_up(self):
+        if self.cursor_row <= 0 and self.page > 0:
+            self.action_previous_page()
+        else:
+            super().action_page_up()
+
+
+class AlertsTable(PagedTable):
     def update_alerts(self, alerts):
+        # These import numpy, which startup doesn't need
+        from .feed_index import index_alerts
+        from .feed_sort import natural, numbers, text
+
         columns = ["Timestamp", "Header", "Effect", "Cause", "Routes", "Description"]
-        rows = []
-        for alert in alerts:
+
+        def row_at(i):
+            alert = alerts[i]
             if "error" in alert:
-                rows.append(("-", alert["error"], "-", "-", "-", "-"))
-            else:
-                rows.append(
-                    (
-                        alert["timestamp"],
-                        alert["header"],
-                        alert["effect"],
-                        alert["cause"],
-                        (", ".join(alert["affected_routes"]) if alert["affected_routes"] else "-"),
-                        alert["description"],
-                    )
-                )
-        self.update_table(columns, rows)
+                return ("error", ("-", alert["error"], "-", "-", "-", "-"))
+            return (
+                alert["id"],
+                (
+                    alert["timestamp"],
+                    alert["header"],
+                    alert["effect"],
+                    alert["cause"],
+                    (", ".join(alert["affected_routes"]) if alert["affected_routes"] else "-"),
+                    alert["description"],
+                ),
+            )
+
+        def column(key, default=""):
+            return [alert.get(key, default) for alert in alerts]
+
+        sort_values = {
+            "Timestamp": lambda: numbers(column("time", None)),
+            "Header": lambda: text(column("header")),
+            "Effect": lambda: natural(column("effect")),
+            "Cause": lambda: natural(column("cause")),
+            "Routes": lambda: natural(routes[0] if routes else "" for routes in column("affected_routes", ())),
+        }
+        self.update_paged(columns, len(alerts), row_at, partial(index_alerts, alerts), sort_values)
 
 
 class RoutesTable(BaseTable):
     def update_routes(self, routes):
         columns = ["Route ID", "Route Label"]
-        rows = [(route["route_id"], route["route_label"]) for route in routes]
+        rows = [(route["route_id"], (route["route_id"], route["route_label"])) for route in routes]
         self.update_table(columns, rows)
 
 
-class TripUpdatesTable(BaseTable):
+class TripUpdatesTable(PagedTable):
     def update_trip_updates(self, updates):
+        from .feed_index import index_trip_updates
+        from .feed_sort import natural, numbers
+
         columns = ["Trip ID", "Route ID", "Schedule", "Stop ID", "Arrival", "Departure"]
-        rows = [
-            (
+
+        # Only the trips on the current page are decoded
+        def row_at(i):
+            update = updates[i]
+            return (
                 update["trip_id"],
-                update["route_id"],
-                str(update["schedule"]),
-                update["stop_id"],
-                update["arrival"],
-                update["departure"],
+                (
+                    update["trip_id"],
+                    update["route_id"],
+                    str(update["schedule"]),
+                    update["stop_id"],
+                    update["arrival"],
+                    update["departure"],
+                ),
             )
-            for update in updates
-        ]
-        self.update_table(columns, rows)
 
+        if hasattr(updates, "stop_times"):
+            # A TripUpdatesView reads them from the feed, so sorting doesn't format every row
+            trip_ids, route_ids = updates.trip_ids, updates.route_ids
+            arrivals, departures = partial(updates.stop_times, "arrival"), partial(updates.stop_times, "departure")
+        else:
+            # Rows from the daemon, already formatted
+            def trip_ids():
+                return [update["trip_id"] for update in updates]
+
+            def route_ids():
+                return [update["route_id"] for update in updates]
+
+            def arrivals():
+                return numbers(update.get("arrival_time") for update in updates)
 
-class VehiclePositionsTable(BaseTable):
+            def departures():
+                return numbers(update.get("departure_time") for update in updates)
+
+        sort_values = {
+            "Trip ID": lambda: natural(trip_ids()),
+            "Route ID": lambda: natural(route_ids()),
+            "Arrival": arrivals,
+            "Departure": departures,
+        }
+        self.update_paged(columns, len(updates), row_at, partial(index_trip_updates, updates), sort_values)
+
+
+class VehiclePositionsTable(PagedTable):
     def update_vehicle_positions(self, vehicles):
+        from .feed_index import index_vehicles
+        from .feed_sort import natural
+
         columns = [
             "Vehicle ID",
             "Trip ID",
@@ -65,16 +388,70 @@ class VehiclePositionsTable(BaseTable):
             "Speed",
             "Timestamp",
         ]
+
+        # Only the vehicles on the current page are formatted
+        def row_at(i):
+            v = vehicles.row(i)
+            return (
+                v["vehicle_id"],
+                (
+                    v["vehicle_id"],
+                    v["trip_id"],
+                    v["route_id"],
+                    str(v["latitude"]),
+                    str(v["longitude"]),
+                    str(v["speed"]),
+                    v["timestamp"],
+                ),
+            )
+
+        sort_values = {
+            "Vehicle ID": lambda: natural(vehicles.vehicle_ids),
+            "Trip ID": lambda: natural(vehicles.trip_ids),
+            "Route ID": lambda: natural(vehicles.route_ids),
+            "Latitude": lambda: vehicles.latitude,
+            "Longitude": lambda: vehicles.longitude,
+            "Speed": lambda: vehicles.speed,
+            "Timestamp": lambda: vehicles.timestamp,
+        }
+        self.update_paged(columns, len(vehicles), row_at, partial(index_vehicles, vehicles), sort_values)
+
+
+class DeparturesTable(BaseTable):
+    def update_departures(self, arrivals, now: float):
+        """Show arrivals at a station, soonest first.
+
+        Args:
+            arrivals: Arrival tuples from StopArrivals.arrivals
+            now: POSIX time the countdown to each arrival is from
+        """
+        columns = ["Route", "Trip ID", "Stop ID", "Arrival", "Due", "Delay"]
         rows = [
             (
-                v["vehicle_id"],
-                v["trip_id"],
-                v["route_id"],
-                str(v["latitude"]),
-                str(v["longitude"]),
-                str(v["speed"]),
-                v["timestamp"],
+                f"{arrival.trip_id}/{arrival.stop_id}",
+                (
+                    arrival.route_id,
+                    arrival.trip_id,
+                    arrival.stop_id,
+                    datetime.fromtimestamp(arrival.time).strftime("%I:%M %p"),
+                    _format_due(arrival.time - now),
+                    _format_delay(arrival.delay),
+                ),
             )
-            for v in vehicles
+            for arrival in arrivals
         ]
         self.update_table(columns, rows)
+
+
+def _format_due(seconds: float) -> str:
+    minutes = int(seconds // 60)
+    return "Now" if minutes < 1 else f"{minutes} min"
+
+
+def _format_delay(seconds: float) -> str:
+    if math.isnan(seconds):
+        return "-"
+    minutes = round(seconds / 60)
+    if not minutes:
+        return "On time"
+    return f"{minutes} min late" if minutes > 0 else f"{-minutes} min early"
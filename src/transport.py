@@ -0,0 +1,89 @@
+"""Shared HTTP transport for the Metro Transit APIs"""
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 10
+
+# Timeouts in seconds, matched against the start of the request URL
+ENDPOINT_TIMEOUTS = {
+    "https://svc.metrotransit.org/nextripv2": 5,
+    "https://svc.metrotransit.org/mtgtfs": 10,
+}
+
+
+class HttpTransport:
+    """A pooled, keep-alive HTTP session with retry/backoff and per-endpoint timeouts.
+
+    Reusing one session keeps connections to the same host open between calls,
+    so steady-state refreshes skip the TCP and TLS handshakes.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        retries: int = 2,
+        backoff_factor: float = 0.5,
+        timeouts: dict | None = None,
+        default_timeout: float = DEFAULT_TIMEOUT,
+    ):
+        self.timeouts = dict(ENDPOINT_TIMEOUTS if timeouts is None else timeouts)
+        self.default_timeout = default_timeout
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET"}),
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def timeout_for(self, url: str) -> float:
+        """Return the timeout for a URL, using the longest matching endpoint prefix"""
+        matches = [prefix for prefix in self.timeouts if url.startswith(prefix)]
+        if not matches:
+            return self.default_timeout
+        return self.timeouts[max(matches, key=len)]
+
+    def get(
+        self, url: str, headers: dict | None = None, timeout: float | None = None, stream: bool = False
+    ) -> requests.Response:
+        """Send a GET request through the pooled session.
+
+        With `stream` the body is read as the caller iterates `response.iter_content()`,
+        and the caller has to close the response.
+        """
+        if timeout is None:
+            timeout = self.timeout_for(url)
+        return self.session.get(url, headers=headers, timeout=timeout, stream=stream)
+
+    def close(self):
+        self.session.close()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> HttpTransport:
+    """Return the shared transport, creating it on first use"""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = HttpTransport()
+        return _transport
+
+
+def set_transport(transport):
+    """Replace the shared transport, closing the previous one"""
+    global _transport
+    with _transport_lock:
+        previous, _transport = _transport, transport
+    if previous is not None and previous is not transport:
+        previous.close()
@@ -0,0 +1,195 @@
+"""Bounded position history of every vehicle in the feed, shared by the map tabs"""
+
+import time
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_HISTORY = 8  # Samples kept per vehicle
+DEFAULT_TTL = 600  # Seconds of feed time a vehicle may be missing before it's forgotten
+DEFAULT_MAX_VEHICLES = 5000  # Least recently seen vehicles beyond this are forgotten
+
+
+class VehicleHistory:
+    """Fixed-size ring buffer of a vehicle's last (timestamp, latitude, longitude) samples.
+
+    The samples live in one preallocated array of doubles, so recording a position
+    allocates nothing.
+    """
+
+    __slots__ = ("_samples", "_next", "size", "last_seen", "heading")
+
+    def __init__(self, capacity: int = DEFAULT_HISTORY):
+        self._samples = array("d", bytes(8 * 3 * capacity))
+        self._next = 0  # Slot the next sample goes into
+        self.size = 0
+        self.last_seen = 0.0  # Feed time the vehicle was last in a snapshot
+        self.heading = 0  # Last movement along its line: 1 forward, -1 backward, 0 unknown
+
+    @property
+    def capacity(self) -> int:
+        return len(self._samples) // 3
+
+    @property
+    def latest_timestamp(self) -> float:
+        if not self.size:
+            return float("-inf")
+        return self._samples[((self._next - 1) % self.capacity) * 3]
+
+    def push(self, timestamp: float, latitude: float, longitude: float):
+        slot = self._next * 3
+        self._samples[slot] = timestamp
+        self._samples[slot + 1] = latitude
+        self._samples[slot + 2] = longitude
+        self._next = (self._next + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def samples(self) -> np.ndarray:
+        """Return the samples oldest first as a (size, 3) array of timestamp, latitude, longitude"""
+        samples = np.frombuffer(self._samples, dtype=np.float64).reshape(-1, 3)
+        start = (self._next - self.size) % self.capacity
+        return np.roll(samples, -start, axis=0)[: self.size]
+
+
+class VehicleTracker:
+    """Position history for every vehicle, keyed by vehicle_id.
+
+    Vehicles that stay out of the feed for `ttl` seconds of feed time are evicted, as
+    are the least recently seen ones once more than `max_vehicles` are tracked, so
+    memory stays flat however long the app runs.
+
+    Args:
+        history: Samples kept per vehicle
+        ttl: Seconds of feed time a vehicle may be missing before it's forgotten
+        max_vehicles: Most vehicles tracked at once
+    """
+
+    def __init__(self, history: int = DEFAULT_HISTORY, ttl: float = DEFAULT_TTL, max_vehicles=DEFAULT_MAX_VEHICLES):
+        self.history = history
+        self.ttl = ttl
+        self.max_vehicles = max_vehicles
+        self.chainage_threshold = 10  # Metres along the line, to ignore GPS jitter
+        self._vehicles = OrderedDict()  # {vehicle_id: VehicleHistory}, least recently seen first
+        self._last_snapshot = None
+
+    def __len__(self):
+        return len(self._vehicles)
+
+    def __contains__(self, vehicle_id):
+        return vehicle_id in self._vehicles
+
+    def get(self, vehicle_id: str) -> VehicleHistory | None:
+        return self._vehicles.get(vehicle_id)
+
+    def update(self, vehicles):
+        """Record the positions in a VehicleSnapshot and evict vehicles that left the feed.
+
+        Every map tab passes the snapshot it renders; a snapshot that was already
+        recorded is skipped, so each one is only recorded once.
+        """
+        if vehicles is self._last_snapshot:
+            return
+        self._last_snapshot = vehicles
+        now = time.time()
+        timestamps = vehicles.timestamp.tolist()
+        newest = max((timestamp for timestamp in timestamps if timestamp > 0), default=now)
+        rows = zip(vehicles.vehicle_ids, timestamps, vehicles.latitude.tolist(), vehicles.longitude.tolist())
+        for vehicle_id, timestamp, latitude, longitude in rows:
+            if not vehicle_id or latitude != latitude:  # No id, or NaN without coordinates
+                continue
+            timestamp = timestamp if timestamp > 0 else newest
+            history = self._vehicles.get(vehicle_id)
+            if history is None:
+                history = self._vehicles[vehicle_id] = VehicleHistory(self.history)
+            else:
+                self._vehicles.move_to_end(vehicle_id)
+            history.last_seen = newest
+            # The feed repeats a vehicle's last report until it sends a new one
+            if timestamp > history.latest_timestamp:
+                history.push(timestamp, latitude, longitude)
+        self._evict(newest)
+
+    def _evict(self, now: float):
+        while self._vehicles:
+            vehicle_id, history = next(iter(self._vehicles.items()))
+            if len(self._vehicles) <= self.max_vehicles and now - history.last_seen <= self.ttl:
+                break
+            del self._vehicles[vehicle_id]
+
+    def line_velocity(self, vehicle_id: str, index) -> float | None:
+        """Estimate a vehicle's speed along a line from its whole history.
+
+        Args:
+            vehicle_id: The vehicle
+            index: StationIndex of the vehicle's line
+
+        Returns:
+            Metres per second, positive away from the line's first station, fitted by
+            least squares over every sample; None with fewer than two samples
+        """
+        history = self._vehicles.get(vehicle_id)
+        if history is None or history.size < 2:
+            return None
+        samples = history.samples()
+        times = samples[:, 0] - samples[:, 0].mean()
+        spread = float(times @ times)
+        if not spread:
+            return None
+        chainages = index.locate(samples[:, 1], samples[:, 2])
+        if np.isnan(chainages).any():
+            return None
+        return float(times @ (chainages - chainages.mean())) / spread
+
+    def line_direction(
+        self, vehicle_id: str, index, forward: str = "forward", backward: str = "backward", heading: int = 0
+    ) -> str:
+        """Return `forward` or `backward` along a line, or 'stationary' for a vehicle yet to move.
+
+        A heading reported by the feed (see `feed_headings`) wins. Otherwise the
+        direction is estimated from the vehicle's history, and a vehicle keeps its last
+        direction while it moves less than the chainage threshold, e.g. while it's
+        stopped at a station.
+        """
+        history = self._vehicles.get(vehicle_id)
+        if heading:
+            if history is not None:
+                history.heading = heading
+            return forward if heading > 0 else backward
+        if history is None:
+            return "stationary"
+        velocity = self.line_velocity(vehicle_id, index)
+        if velocity is not None:
+            samples = history.samples()
+            travelled = velocity * (samples[-1, 0] - samples[0, 0])
+            if abs(travelled) >= self.chainage_threshold:
+                history.heading = 1 if travelled > 0 else -1
+        if history.heading > 0:
+            return forward
+        if history.heading < 0:
+            return backward
+        return "stationary"
+
+
+def feed_headings(vehicles, line, snapped) -> list:
+    """Work out each vehicle's heading along a line from what the feed reports.
+
+    The trip's direction_id is used where the line's direction names are known,
+    then the vehicle's bearing compared with the track it snapped to.
+
+    Args:
+        vehicles: VehicleSnapshot of the line's vehicles
+        line: The Line from the line registry
+        snapped: Snapping results of the vehicles
+
+    Returns:
+        1 forward, -1 backward or 0 when the feed doesn't say, per vehicle
+    """
+    headings = line.index.bearing_headings(snapped, vehicles.bearing)
+    for direction_id, name in line.directions.items():
+        if name in (line.forward, line.backward):
+            headings[vehicles.direction_id == direction_id] = 1 if name == line.forward else -1
+    return headings.tolist()
+
+
+vehicle_tracker = VehicleTracker()
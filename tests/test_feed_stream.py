@@ -0,0 +1,162 @@
+"""FeedStream and _scan_fields against protobuf's own parser, on whole, chunked and broken feeds"""
+
+import unittest
+
+from google.protobuf.message import DecodeError
+from google.transit import gtfs_realtime_pb2
+
+from src.metro_api import FeedStream, _scan_fields
+
+CHUNK_SIZES = (1, 2, 3, 7, 64, 1000)
+
+
+def feed_message(trips=0, vehicles=0, routes=("901", "902", "5")):
+    """A serialized feed with a header and the given number of trip update and vehicle entities"""
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = "2.0"
+    feed.header.timestamp = 1760000000
+    for i in range(trips):
+        entity = feed.entity.add(id=f"t{i}")
+        entity.trip_update.trip.trip_id = f"trip{i}"
+        entity.trip_update.trip.route_id = routes[i % len(routes)]
+        # Enough stops that some entities need a length longer than one byte
+        for stop in range(i * 3):
+            entity.trip_update.stop_time_update.add(stop_id=str(51000 + stop)).arrival.time = 1760000000 + stop
+    for i in range(vehicles):
+        entity = feed.entity.add(id=f"v{i}")
+        entity.vehicle.vehicle.id = str(i)
+        entity.vehicle.trip.route_id = routes[i % len(routes)]
+        entity.vehicle.position.latitude = 44.9 + i / 1000
+        entity.vehicle.position.longitude = -93.2
+    return feed.SerializeToString()
+
+
+def parsed(payload):
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(payload)
+    return feed
+
+
+def chunked(payload, size):
+    return [payload[i : i + size] for i in range(0, len(payload), size)]
+
+
+class ScanFieldsTest(unittest.TestCase):
+    def test_complete_fields(self):
+        payload = feed_message(trips=3, vehicles=2)
+        fields, end = _scan_fields(memoryview(payload))
+        self.assertEqual(end, len(payload))
+        self.assertEqual([number for number, _, _ in fields], [1] + [2] * 5)
+        feed = parsed(payload)
+        for (_, start, stop), entity in zip(fields[1:], feed.entity):
+            self.assertEqual(payload[start:stop], entity.SerializeToString())
+
+    def test_truncated_varints(self):
+        header_field = feed_message()
+        cases = {
+            "tag": b"\x80",  # A tag continuing into a byte that never came
+            "length": b"\x12\x80",  # Entity field whose length stops after its first byte
+            "long length": b"\x12\xff\xff",
+            "varint value": b"\x08\x96",  # Field 1 as a varint, cut inside the value
+        }
+        for name, tail in cases.items():
+            with self.subTest(name):
+                self.assertEqual(_scan_fields(memoryview(tail)), ([], 0))
+                fields, end = _scan_fields(memoryview(header_field + tail))
+                self.assertEqual(len(fields), 1)
+                self.assertEqual(end, len(header_field))
+
+    def test_field_cut_short(self):
+        payload = feed_message(trips=4)
+        fields, _ = _scan_fields(memoryview(payload))
+        _, _, last_entity_end = fields[-2]
+        fields, end = _scan_fields(memoryview(payload[:-1]))
+        self.assertEqual(end, last_entity_end)
+        self.assertEqual(len(fields), 4)
+
+    def test_unknown_wire_types(self):
+        for wire_type in (3, 4, 6, 7):
+            with self.subTest(wire_type=wire_type):
+                with self.assertRaises(DecodeError):
+                    _scan_fields(memoryview(feed_message() + bytes([2 << 3 | wire_type])))
+                with self.assertRaises(DecodeError):
+                    list(FeedStream(chunked(feed_message(trips=2) + bytes([2 << 3 | wire_type, 0]), 5)))
+
+
+class FeedStreamTest(unittest.TestCase):
+    def assertSameFeed(self, feed, payload):
+        self.assertEqual(feed.SerializeToString(), parsed(payload).SerializeToString())
+
+    def test_matches_parse_from_string(self):
+        payload = feed_message(trips=20, vehicles=20)
+        for size in CHUNK_SIZES + (len(payload),):
+            with self.subTest(chunk_size=size):
+                stream = FeedStream(chunked(payload, size))
+                entities = [entity.SerializeToString() for entity in stream]
+                self.assertEqual(entities, [entity.SerializeToString() for entity in parsed(payload).entity])
+                self.assertSameFeed(stream.feed, payload)
+                self.assertSameFeed(FeedStream(chunked(payload, size)).read(), payload)
+        self.assertSameFeed(FeedStream(payload).read(), payload)
+
+    def test_header_then_rest(self):
+        payload = feed_message(trips=10)
+        for size in CHUNK_SIZES:
+            with self.subTest(chunk_size=size):
+                stream = FeedStream(chunked(payload, size))
+                self.assertEqual(stream.read_header().timestamp, 1760000000)
+                self.assertSameFeed(stream.read(), payload)
+                self.assertEqual(stream.bytes_read, len(payload))
+
+    def test_header_only_body(self):
+        payload = feed_message()
+        for size in CHUNK_SIZES + (len(payload),):
+            with self.subTest(chunk_size=size):
+                stream = FeedStream(chunked(payload, size))
+                self.assertEqual(stream.read_header(), parsed(payload).header)
+                self.assertEqual(list(stream), [])
+                self.assertSameFeed(stream.feed, payload)
+                self.assertSameFeed(FeedStream(chunked(payload, size), {"901"}).read(), payload)
+
+    def test_empty_body(self):
+        stream = FeedStream([])
+        self.assertFalse(stream.read_header().HasField("timestamp"))
+        self.assertEqual(list(stream), [])
+
+    def test_truncated_body(self):
+        payload = feed_message(trips=5)
+        for size in (1, 7, 64):
+            with self.subTest(chunk_size=size):
+                with self.assertRaises(DecodeError):
+                    list(FeedStream(chunked(payload[:-3], size)))
+                with self.assertRaises(DecodeError):
+                    FeedStream(chunked(payload[:-3], size), {"901"}).read()
+
+    def test_routes(self):
+        payload = feed_message(trips=12, vehicles=12)
+        routes = {"901", "902"}
+        expected = parsed(payload)
+        kept = [
+            entity
+            for entity in expected.entity
+            if (entity.trip_update.trip if entity.HasField("trip_update") else entity.vehicle.trip).route_id in routes
+        ]
+        del expected.entity[:]
+        expected.entity.extend(kept)
+        for size in CHUNK_SIZES + (len(payload),):
+            with self.subTest(chunk_size=size):
+                feed = FeedStream(chunked(payload, size), routes).read()
+                self.assertEqual(feed.SerializeToString(), expected.SerializeToString())
+
+    def test_route_id_inside_another_field(self):
+        feed = gtfs_realtime_pb2.FeedMessage()
+        feed.header.gtfs_realtime_version = "2.0"
+        # The encoded route_id field for '901' turns up inside this trip id
+        entity = feed.entity.add(id="t0")
+        entity.trip_update.trip.trip_id = "x\x2a\x03901"
+        entity.trip_update.trip.route_id = "5"
+        payload = feed.SerializeToString()
+        self.assertEqual(len(FeedStream(payload, {"901"}).read().entity), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()